@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""BM25 query latency: rank_bm25's per-document loop vs the inverted-index engine.
+
+Builds a synthetic corpus with a Zipf-distributed vocabulary (so common
+terms have long posting lists, like real text), then times keyword
+queries end to end: scoring plus top-k selection. rank_bm25 is only timed
+when it is installed, and its results are checked against the engine's.
+Also reports the size of the on-disk index, how long a cold open plus
+first query takes, and what appending a small batch to the segmented index
+costs compared with rebuilding it.
+
+Usage: python scripts/benchmarks/bench_bm25.py [--docs 100000] [--queries 50]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+import numpy as np
+
+from indexing.bm25_engine import BM25Engine, Postings
+from indexing.bm25_segments import SegmentedIndex
+
+try:
+    from rank_bm25 import BM25Okapi
+except ImportError:
+    BM25Okapi = None
+
+
+def synthetic_doc_freqs(docs: int, vocab_size: int, doc_length: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocab_size + 1)
+    probs = 1.0 / ranks
+    probs /= probs.sum()
+    lengths = rng.integers(doc_length // 2, doc_length * 3 // 2, size=docs)
+    tokens = rng.choice(vocab_size, size=int(lengths.sum()), p=probs)
+    doc_freqs, start = [], 0
+    for length in lengths.tolist():
+        doc_freqs.append({f"t{term}": freq for term, freq in Counter(tokens[start:start + length].tolist()).items()})
+        start += length
+    return doc_freqs, probs
+
+
+def sample_queries(count: int, probs: np.ndarray, terms_per_query: int = 3, seed: int = 1):
+    # Mix frequent and rare terms the way keyword questions do
+    rng = np.random.default_rng(seed)
+    flattened = np.sqrt(probs) / np.sqrt(probs).sum()
+    return [[f"t{term}" for term in rng.choice(len(probs), size=terms_per_query, p=flattened)]
+            for _ in range(count)]
+
+
+def time_queries(search, queries):
+    latencies = []
+    results = []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - started)
+    latencies_ms = np.array(latencies) * 1000
+    return results, {
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=100_000)
+    parser.add_argument('--vocab', type=int, default=50_000)
+    parser.add_argument('--doc-length', type=int, default=120, help="Mean tokens per document")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--append', type=int, default=20, help="Documents in the appended batch")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    doc_freqs, probs = synthetic_doc_freqs(args.docs + args.append, args.vocab, args.doc_length)
+    doc_freqs, appended = doc_freqs[:args.docs], doc_freqs[args.docs:]
+    chunk_ids = [f"chunk_{i}" for i in range(args.docs + args.append)]
+    queries = sample_queries(args.queries, probs)
+    report = {'params': vars(args)}
+
+    started = time.perf_counter()
+    engine = BM25Engine.from_doc_freqs(doc_freqs)
+    report['engine_build_seconds'] = time.perf_counter() - started
+    report['postings'] = int(engine.postings.indptr[-1])
+    engine_results, report['engine'] = time_queries(lambda q: engine.top_k(q, args.k).tolist(), queries)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SegmentedIndex(tmp)
+        index.commit(engine.postings, chunk_ids[:args.docs], [None] * args.docs, set())
+        index.wait()
+        report['index_file_bytes'] = sum(path.stat().st_size for path in Path(tmp).iterdir())
+
+        started = time.perf_counter()
+        reader = SegmentedIndex(tmp)
+        reader.load()
+        report['index_open_ms'] = (time.perf_counter() - started) * 1000
+        reader.search(queries[0], args.k)
+        report['index_open_and_first_query_ms'] = (time.perf_counter() - started) * 1000
+
+        # Adding a batch writes one small segment instead of rebuilding the index
+        started = time.perf_counter()
+        index.commit(Postings.from_doc_freqs(appended), chunk_ids[args.docs:], [None] * args.append, set())
+        report['append_commit_ms'] = (time.perf_counter() - started) * 1000
+        segmented_results, report['segmented'] = time_queries(lambda q: index.search(q, args.k), queries)
+        index.wait()
+        del reader
+
+    full = BM25Engine.from_doc_freqs(doc_freqs + appended)
+    report['segmented_identical_results'] = segmented_results == [
+        [chunk_ids[i] for i in full.top_k(query, args.k).tolist()] for query in queries]
+
+    if BM25Okapi is not None:
+        reference = BM25Okapi([term for term, freq in doc.items() for _ in range(freq)] for doc in doc_freqs)
+
+        def reference_search(query):
+            scores = reference.get_scores(query)
+            return sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:args.k]
+
+        reference_results, report['rank_bm25'] = time_queries(reference_search, queries)
+        report['identical_results'] = reference_results == engine_results
+        report['speedup'] = report['rank_bm25']['mean_ms'] / report['engine']['mean_ms']
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
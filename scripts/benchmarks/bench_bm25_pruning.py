@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+"""BM25 top-k latency: exhaustive scoring vs block-max pruning.
+
+Builds a segmented index over a synthetic corpus with a Zipf-distributed
+vocabulary, generated straight into postings arrays so a million chunks
+fit in memory, then times the same keyword queries with each query
+strategy and checks that they return identical rankings.
+
+Usage: python scripts/benchmarks/bench_bm25_pruning.py [--docs 1000000] [--k 20]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+import numpy as np
+
+from bench_bm25 import sample_queries, time_queries
+from indexing.bm25_engine import Postings
+from indexing.bm25_query import QUERY_STRATEGIES
+from indexing.bm25_segments import SegmentedIndex
+
+
+def zipf_probs(vocab_size: int) -> np.ndarray:
+    probs = 1.0 / np.arange(1, vocab_size + 1)
+    return probs / probs.sum()
+
+
+def synthetic_postings(docs: int, probs: np.ndarray, doc_length: int, rng) -> Postings:
+    lengths = rng.integers(doc_length // 2, doc_length * 3 // 2, size=docs)
+    tokens = rng.choice(len(probs), size=int(lengths.sum()), p=probs)
+    keys, freqs = np.unique(np.repeat(np.arange(docs, dtype=np.int64), lengths) * len(probs) + tokens,
+                            return_counts=True)
+    doc_ids, term_ids = keys // len(probs), keys % len(probs)
+    slots = np.arange(len(keys)) - np.searchsorted(doc_ids, doc_ids)
+    return Postings.from_coo([f"t{term}" for term in range(len(probs))], term_ids, doc_ids.astype(np.int32),
+                             freqs.astype(np.int32), slots.astype(np.int32), lengths.astype(np.int64))
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1_000_000)
+    parser.add_argument('--segment-docs', type=int, default=200_000, help="Chunks per segment")
+    parser.add_argument('--vocab', type=int, default=50_000)
+    parser.add_argument('--doc-length', type=int, default=120, help="Mean tokens per document")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--terms', type=int, default=3, help="Terms per query")
+    parser.add_argument('--k', type=int, default=20, help="HybridSearch asks for k*2 keyword hits")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    probs = zipf_probs(args.vocab)
+    rng = np.random.default_rng(0)
+    queries = sample_queries(args.queries, probs, terms_per_query=args.terms)
+    report = {'params': vars(args)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Segments are kept as written so building does not wait on merges
+        writer = SegmentedIndex(tmp, merge_factor=1 << 30)
+        started = time.perf_counter()
+        for start in range(0, args.docs, args.segment_docs):
+            count = min(args.segment_docs, args.docs - start)
+            writer.commit(synthetic_postings(count, probs, args.doc_length, rng),
+                          [f"chunk_{start + i}" for i in range(count)], [None] * count)
+        writer.wait()
+        report['build_seconds'] = time.perf_counter() - started
+        report['segments'] = writer.segment_count
+
+        results = {}
+        for strategy in QUERY_STRATEGIES:
+            index = SegmentedIndex(tmp, query_strategy=strategy)
+            index.load()
+            index.search(queries[0], args.k)
+            results[strategy], report[strategy] = time_queries(lambda q: index.search(q, args.k), queries)
+            del index
+
+    report['identical_results'] = results['block_max'] == results['exhaustive']
+    report['speedup'] = report['exhaustive']['mean_ms'] / report['block_max']['mean_ms']
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+"""Chunker throughput: per-sentence encoding (legacy) vs batched token counts.
+
+Usage: python scripts/benchmarks/bench_chunker.py [--sections 200] [--threads 1 4] [--local-vocab 400]
+
+Without network access to download cl100k_base, --local-vocab trains a small
+BPE vocabulary on the synthetic text (cl100k_base's pre-tokenizer, far fewer
+merges) and benchmarks with that instead. Absolute rates then differ from
+gpt-4's encoding; the legacy/batched comparison still holds.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+import tiktoken
+
+from ingestion.chunker import HierarchicalChunker
+
+WORDS = (
+    "alpha beta volatility momentum lstm transformer sharpe ratio drawdown portfolio "
+    "bitcoin ethereum returns forecast sentiment reddit github order book liquidity "
+    "regression baseline accuracy precision recall feature indicator macd rsi"
+).split()
+# cl100k_base's pre-tokenizer, for --local-vocab
+CL100K_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+|\s++$|\s*[\r\n]|\s+(?!\S)|\s"""
+
+
+def synthetic_sections(n_sections: int, sentences_per_section: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    sections = []
+    for _ in range(n_sections):
+        sentences = []
+        for _ in range(sentences_per_section):
+            words = rng.choices(WORDS, k=rng.randint(8, 30))
+            sentences.append(" ".join(words).capitalize() + ".")
+        sections.append(" ".join(sentences))
+    return sections
+
+
+def local_encoding(sections: list, vocab_size: int) -> tiktoken.Encoding:
+    from tiktoken._educational import bpe_train
+    ranks = bpe_train(" ".join(sections[:10]), vocab_size, CL100K_PATTERN, visualise=None)
+    return tiktoken.Encoding("synthetic_bpe", pat_str=CL100K_PATTERN, mergeable_ranks=ranks, special_tokens={})
+
+
+def legacy_create_chunks(chunker: HierarchicalChunker, text: str, metadata: dict) -> list:
+    # Pre-batching implementation: encode every sentence, re-encode the overlap
+    sentences = chunker._split_sentences(text)
+    chunks, current_chunk, current_tokens = [], [], 0
+    for sentence in sentences:
+        sentence_tokens = len(chunker.encoder.encode(sentence))
+        if current_tokens + sentence_tokens > chunker.max_tokens and current_chunk:
+            chunks.append({'text': ' '.join(current_chunk), 'metadata': metadata.copy(),
+                           'token_count': current_tokens})
+            if chunker.overlap > 0 and len(current_chunk) > 1:
+                current_chunk = current_chunk[-1:]
+                current_tokens = len(chunker.encoder.encode(current_chunk[-1]))
+            else:
+                current_chunk, current_tokens = [], 0
+        current_chunk.append(sentence)
+        current_tokens += sentence_tokens
+    if current_chunk:
+        chunks.append({'text': ' '.join(current_chunk), 'metadata': metadata.copy(),
+                       'token_count': current_tokens})
+    return chunks
+
+
+def timed(fn, sections: list, repeats: int) -> tuple:
+    best, output = float('inf'), None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        output = [fn(text, {}) for text in sections]
+        best = min(best, time.perf_counter() - start)
+    return best, output
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sections', type=int, default=200)
+    parser.add_argument('--sentences', type=int, default=40, help="Sentences per section")
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--local-vocab', type=int, default=0,
+                        help="Train a BPE vocabulary of this size instead of downloading cl100k_base")
+    args = parser.parse_args(argv)
+
+    sections = synthetic_sections(args.sections, args.sentences)
+    if args.local_vocab:
+        encoding = local_encoding(sections, args.local_vocab)
+        # HierarchicalChunker looks its encoding up by model name
+        tiktoken.encoding_for_model = lambda model_name: encoding
+    chunker = HierarchicalChunker()
+    n_sentences = sum(len(chunker._split_sentences(text)) for text in sections)
+
+    legacy_time, legacy_chunks = timed(lambda t, m: legacy_create_chunks(chunker, t, m), sections, args.repeats)
+    report = {
+        'encoding': chunker.encoder.name,
+        'sentences': n_sentences,
+        'legacy': {'seconds': legacy_time, 'sentences_per_sec': n_sentences / legacy_time},
+        'batched': {},
+    }
+
+    for threads in args.threads:
+        chunker.num_threads = threads
+        batched_time, batched_chunks = timed(chunker._create_chunks, sections, args.repeats)
+        assert batched_chunks == legacy_chunks, "batched counting must not change chunk boundaries"
+        report['batched'][f"threads_{threads}"] = {
+            'seconds': batched_time,
+            'sentences_per_sec': n_sentences / batched_time,
+            'speedup': legacy_time / batched_time,
+        }
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
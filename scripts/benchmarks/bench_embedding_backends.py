@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""Embedding backends: PyTorch vs ONNX Runtime (fp32 and int8) on CPU.
+
+Encodes the same synthetic chunk texts with each backend and reports
+throughput, plus parity with the PyTorch path: the cosine similarity
+between the two vectors of each text, and how much of each query's
+top-10 neighbours (by cosine) stays the same. Exits non-zero when a
+backend's lowest per-text cosine falls below --min-cosine, so it can
+gate a model or runtime upgrade.
+
+Usage: python scripts/benchmarks/bench_embedding_backends.py [--texts 2000] [--threads 0]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+import numpy as np
+
+from config import config
+from indexing.embeddings_generator import EmbeddingsGenerator
+
+VOCABULARY = (
+    "alpha beta momentum volatility drawdown sharpe sortino ratio portfolio return forecast lstm cnn "
+    "transformer attention gradient boosting regression baseline bitcoin ethereum equity futures options "
+    "liquidity spread order book market sentiment indicator signal feature accuracy backtest regime"
+).split()
+
+BACKENDS = {
+    'torch': {'backend': 'torch'},
+    'onnx': {'backend': 'onnx', 'onnx_quantize': False},
+    'onnx_int8': {'backend': 'onnx', 'onnx_quantize': True},
+}
+
+
+def synthetic_texts(count: int, min_words: int, max_words: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=rng.randint(min_words, max_words))) for _ in range(count)]
+
+
+def top_overlap(reference: np.ndarray, candidate: np.ndarray, queries: int, k: int = 10) -> float:
+    """Mean share of each query's top k (queries are the first rows) found by both."""
+    overlaps = []
+    for row in range(queries):
+        expected = set(np.argsort(-(reference[queries:] @ reference[row]))[:k].tolist())
+        found = set(np.argsort(-(candidate[queries:] @ candidate[row]))[:k].tolist())
+        overlaps.append(len(expected & found) / k)
+    return float(np.mean(overlaps))
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--texts', type=int, default=2000, help="Chunk-like passages")
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=config.embedding_batch_size)
+    parser.add_argument('--threads', type=int, default=config.embedding_threads,
+                        help="ONNX Runtime intra-op threads (0 = every core)")
+    parser.add_argument('--backends', nargs='*', default=list(BACKENDS), choices=list(BACKENDS))
+    parser.add_argument('--min-cosine', type=float, default=0.99)
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    queries = synthetic_texts(args.queries, 4, 12, seed=1)
+    texts = queries + synthetic_texts(args.texts, 40, 300)
+    report = {'params': vars(args)}
+    vectors = {}
+    for name in args.backends:
+        generator = EmbeddingsGenerator(batch_size=args.batch_size, use_cache=False, threads=args.threads,
+                                        **BACKENDS[name])
+        # Loading (and on first use, exporting) the model is not timed
+        generator.generate_embeddings(texts[:args.batch_size])
+        started = time.perf_counter()
+        vectors[name] = generator.generate_embeddings(texts)
+        seconds = time.perf_counter() - started
+        report[name] = {'seconds': round(seconds, 3), 'texts_per_sec': round(len(texts) / seconds, 1)}
+
+    failed = False
+    if 'torch' in vectors:
+        for name in vectors:
+            if name == 'torch':
+                continue
+            cosines = np.sum(vectors['torch'] * vectors[name], axis=1)
+            report[name].update({
+                'min_cosine_vs_torch': round(float(cosines.min()), 5),
+                'mean_cosine_vs_torch': round(float(cosines.mean()), 5),
+                'top10_overlap_vs_torch': round(top_overlap(vectors['torch'], vectors[name], args.queries), 4),
+                'speedup_vs_torch': round(report['torch']['seconds'] / report[name]['seconds'], 2),
+            })
+            failed |= report[name]['min_cosine_vs_torch'] < args.min_cosine
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if failed:
+        sys.exit(f"parity check failed: a backend's cosine similarity to torch fell below {args.min_cosine}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
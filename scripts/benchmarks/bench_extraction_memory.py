@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+"""Peak memory of eager vs lazy extraction on long synthetic PDFs.
+
+Each (mode, page count) runs in a fresh subprocess so ru_maxrss is not
+polluted by earlier runs. Reports the Python heap peak (tracemalloc) and
+the growth of peak RSS over the post-import baseline, both normalised per
+100 pages.
+
+Usage: python scripts/benchmarks/bench_extraction_memory.py [--pages 100 500 1000]
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+from ingestion.paper_parser import PaperParser
+from ingestion.pdf_document import PDFDocument
+from ingestion.pdf_extractor import PDFExtractor
+from ingestion.pipeline import LAZY_CACHED_PAGES, LAZY_FALLBACK_WINDOW
+from synthetic_papers import write_synthetic_paper
+
+
+def _peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_mode(pdf_path: str, mode: str) -> dict:
+    rss_before = _peak_rss()
+    tracemalloc.start()
+    sections = 0
+    if mode == 'eager':
+        document = PDFDocument(pdf_path)
+        extracted = PDFExtractor().extract_from_pdf(document)
+        for _ in PaperParser().parse_structure(document)['sections']:
+            sections += 1
+        del extracted
+    else:
+        document = PDFDocument(pdf_path, max_cached_pages=LAZY_CACHED_PAGES)
+        PDFExtractor().extract_metadata(document)
+        for _ in PaperParser().iter_sections(document, LAZY_FALLBACK_WINDOW):
+            sections += 1
+    _, heap_peak = tracemalloc.get_traced_memory()
+    document.close()
+    return {
+        'sections': sections,
+        'heap_peak_bytes': heap_peak,
+        'rss_peak_bytes': _peak_rss(),
+        'rss_growth_bytes': _peak_rss() - rss_before,
+    }
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, nargs='+', default=[100, 500, 1000])
+    parser.add_argument('--child', nargs=2, metavar=('PDF', 'MODE'), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        print(json.dumps(run_mode(*args.child)))
+        return {}
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            pdf_path = Path(tmp) / f"synthetic_{pages}.pdf"
+            write_synthetic_paper(pdf_path, pages=pages, toc_depth=1, sections_per_page=0.2)
+            for mode in ('eager', 'lazy'):
+                out = subprocess.run(
+                    [sys.executable, __file__, '--child', str(pdf_path), mode],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(out.strip().splitlines()[-1])
+                result['heap_mb_per_100_pages'] = result['heap_peak_bytes'] / 2**20 / (pages / 100)
+                result['rss_growth_mb_per_100_pages'] = result['rss_growth_bytes'] / 2**20 / (pages / 100)
+                report[f"{mode}_{pages}_pages"] = result
+
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""BM25 top-k latency with metadata filters pushed down as row bitmaps.
+
+Builds the same synthetic segmented index as bench_bm25_pruning.py, gives
+every chunk a synthetic publication year, and times keyword queries
+unfiltered, filtered to a share of the years (bitmap already built), and
+filtered the way it was done before: ranking everything and keeping the
+first k matching chunks. Also reports how long the first use of a filter
+takes to build its bitmap, and checks every filtered ranking against the
+post-filtered one.
+
+Usage: python scripts/benchmarks/bench_filtered_search.py [--docs 1000000] [--share 0.1]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+import numpy as np
+
+from bench_bm25 import sample_queries, time_queries
+from bench_bm25_pruning import synthetic_postings, zipf_probs
+from indexing.bm25_query import QUERY_STRATEGIES
+from indexing.bm25_segments import SegmentedIndex
+
+YEARS = list(range(2010, 2026))
+
+
+class YearFilter:
+    """Row filter (see `SegmentedIndex.search`) over a synthetic year per chunk."""
+
+    def __init__(self, years: np.ndarray, since: int):
+        self.years = years
+        self.since = since
+        self.key = ("year", since)
+
+    def __call__(self, chunk_ids, paper_ids) -> np.ndarray:
+        return self.years[[int(chunk_id[6:]) for chunk_id in chunk_ids]] >= self.since
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=1_000_000)
+    parser.add_argument('--segment-docs', type=int, default=200_000, help="Chunks per segment")
+    parser.add_argument('--vocab', type=int, default=50_000)
+    parser.add_argument('--doc-length', type=int, default=120, help="Mean tokens per document")
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--terms', type=int, default=3, help="Terms per query")
+    parser.add_argument('--k', type=int, default=20, help="HybridSearch asks for k*2 keyword hits")
+    parser.add_argument('--share', type=float, default=0.1, help="Share of chunks the filter keeps")
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    probs = zipf_probs(args.vocab)
+    rng = np.random.default_rng(0)
+    queries = sample_queries(args.queries, probs, terms_per_query=args.terms)
+    years = rng.choice(YEARS, size=args.docs)
+    since = int(np.quantile(years, 1 - args.share, method='higher'))
+    row_filter = YearFilter(years, since)
+    report = {'params': vars(args), 'filter': f"year >= {since}",
+              'filtered_share': round(float(np.mean(years >= since)), 4)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = SegmentedIndex(tmp, merge_factor=1 << 30)
+        for start in range(0, args.docs, args.segment_docs):
+            count = min(args.segment_docs, args.docs - start)
+            writer.commit(synthetic_postings(count, probs, args.doc_length, rng),
+                          [f"chunk_{start + i}" for i in range(count)], [None] * count)
+        writer.wait()
+
+        for strategy in QUERY_STRATEGIES:
+            index = SegmentedIndex(tmp, query_strategy=strategy)
+            index.load()
+            index.search(queries[0], args.k)
+            started = time.perf_counter()
+            index.search(queries[0], args.k, row_filter)
+            bitmap_ms = (time.perf_counter() - started) * 1000
+
+            def post_filtered(query):
+                # Rank the whole corpus, keep the first k chunks that match
+                ranked = index.search(query, args.docs)
+                return [chunk_id for chunk_id in ranked if years[int(chunk_id[6:])] >= since][:args.k]
+
+            _, unfiltered = time_queries(lambda q: index.search(q, args.k), queries)
+            filtered_results, filtered = time_queries(lambda q: index.search(q, args.k, row_filter), queries)
+            expected, post = time_queries(post_filtered, queries)
+            report[strategy] = {
+                'unfiltered': unfiltered,
+                'filtered': filtered,
+                'post_filtered': post,
+                'first_use_bitmap_ms': round(bitmap_ms, 1),
+                'identical_to_post_filter': filtered_results == expected,
+                'speedup_vs_unfiltered': round(unfiltered['mean_ms'] / filtered['mean_ms'], 2),
+            }
+            del index
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
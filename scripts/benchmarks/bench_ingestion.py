@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+"""End-to-end ingestion throughput on synthetic papers.
+
+Generates a corpus with synthetic_papers.py and runs it through the
+ingestion pipeline (PDFExtractor -> PaperParser -> HierarchicalChunker),
+embedding, the Chroma vector store and the BM25 index. Prints one JSON
+report with per-stage wall time, pages/sec, chunks/sec and peak RSS, so
+runs can be diffed to catch regressions.
+
+A stage that cannot run here (e.g. the embedding model is not available
+offline) is reported with an "error" entry instead of aborting the run.
+
+Usage: python scripts/benchmarks/bench_ingestion.py [--papers 10] [--pages 20]
+           [--toc-depth 2] [--words-per-page 450] [--skip embed vector_index]
+           [--output report.json]
+"""
+
+import argparse
+import json
+import platform
+import resource
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+from config import config
+from ingestion.pipeline import PipelineSettings, chunk_stage, extract_stage, parse_stage
+from synthetic_papers import write_corpus
+
+STAGES = ('extract', 'parse', 'chunk', 'embed', 'vector_index', 'bm25_index')
+
+
+def _peak_rss() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageTimer:
+    """Accumulates time spent pulling items out of nested pipeline generators.
+
+    Each wrapped generator records inclusive time (its own work plus that of
+    the stages it pulls from); `exclusive()` subtracts the upstream stage.
+    """
+
+    def __init__(self):
+        self.inclusive = defaultdict(float)
+
+    def wrap(self, name: str, items):
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                self.inclusive[name] += time.perf_counter() - start
+                return
+            self.inclusive[name] += time.perf_counter() - start
+            yield item
+
+    def exclusive(self, order) -> dict:
+        result, upstream = {}, 0.0
+        for name in order:
+            result[name] = self.inclusive[name] - upstream
+            upstream = self.inclusive[name]
+        return result
+
+
+def _batches(chunks: list, batch_size: int):
+    for start in range(0, len(chunks), batch_size):
+        yield chunks[start:start + batch_size]
+
+
+def run_pipeline(pdf_paths: list, settings: PipelineSettings) -> tuple:
+    extractor, parser, chunker = settings.build_components()
+    timer = StageTimer()
+    jobs = timer.wrap('extract', extract_stage(pdf_paths, extractor, settings.lazy_page_threshold))
+    jobs = timer.wrap('parse', parse_stage(jobs, parser))
+    jobs = timer.wrap('chunk', chunk_stage(jobs, chunker))
+
+    chunks, failed = [], []
+    for job in jobs:
+        if job.error:
+            failed.append({'paper_id': job.paper_id, 'error': job.error})
+        chunks.extend(job.chunks)
+    return chunks, failed, timer.exclusive(('extract', 'parse', 'chunk'))
+
+
+def run_embed(chunks: list, workdir: Path, batch_size: int, workers: int) -> None:
+    from indexing.embeddings_generator import EmbeddingsGenerator
+
+    # A fresh cache, so every chunk is encoded; with workers > 1 this includes starting the pool
+    generator = EmbeddingsGenerator(cache_path=workdir / 'embed_cache.sqlite', workers=workers)
+    for batch in _batches(chunks, batch_size):
+        generator.generate_embeddings([chunk['text'] for chunk in batch])
+    generator.close()
+
+
+def run_vector_index(chunks: list, workdir: Path, batch_size: int) -> None:
+    # Includes encoding: the store embeds chunks through its own (cold) cache
+    from indexing.embeddings_generator import EmbeddingsGenerator
+    from indexing.vector_store import ChromaDBStore
+
+    embedder = EmbeddingsGenerator(cache_path=workdir / 'vector_cache.sqlite')
+    store = ChromaDBStore(path=str(workdir / 'chroma_db'), collection_name='bench', embedder=embedder)
+    for batch in _batches(chunks, batch_size):
+        store.add_chunks(batch)
+
+
+def run_bm25_index(chunks: list, workdir: Path, batch_size: int) -> None:
+    from indexing.bm25_indexer import BM25Indexer
+
+    indexer = BM25Indexer(workdir / 'bm25_index')
+    indexer.reset()
+    for batch in _batches(chunks, batch_size):
+        indexer.add_chunks(batch)
+    indexer.commit()
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--papers', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=20, help='pages per paper')
+    parser.add_argument('--toc-depth', type=int, default=2)
+    parser.add_argument('--words-per-page', type=int, default=450)
+    parser.add_argument('--sections-per-page', type=float, default=0.5)
+    parser.add_argument('--embed-workers', type=int, default=config.embedding_workers,
+                        help='encoding processes for the embed stage')
+    parser.add_argument('--skip', nargs='*', default=[], choices=STAGES, help='stages to leave out')
+    parser.add_argument('--output', type=Path, help='also write the JSON report here')
+    args = parser.parse_args(argv)
+
+    settings = PipelineSettings(
+        max_tokens=config.max_tokens,
+        overlap=config.overlap,
+        tokenizer_threads=config.tokenizer_threads,
+        lazy_page_threshold=config.lazy_page_threshold,
+    )
+    batch_size = config.ingestion_batch_size
+    stages = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        start = time.perf_counter()
+        corpus = write_corpus(
+            workdir / 'papers', args.papers, pages=args.pages, toc_depth=args.toc_depth,
+            words_per_page=args.words_per_page, sections_per_page=args.sections_per_page,
+        )
+        generate_seconds = time.perf_counter() - start
+        pdf_paths = [Path(paper['path']) for paper in corpus]
+        total_pages = sum(paper['pages'] for paper in corpus)
+
+        chunks, failed, pipeline_times = run_pipeline(pdf_paths, settings)
+        for name, seconds in pipeline_times.items():
+            stages[name] = {'seconds': seconds, 'pages_per_sec': total_pages / seconds if seconds else None}
+
+        downstream = {
+            'embed': lambda: run_embed(chunks, workdir, batch_size, args.embed_workers),
+            'vector_index': lambda: run_vector_index(chunks, workdir, batch_size),
+            'bm25_index': lambda: run_bm25_index(chunks, workdir, batch_size),
+        }
+        for name, run in downstream.items():
+            if name in args.skip:
+                continue
+            if not chunks:
+                stages[name] = {'error': 'no chunks produced'}
+                continue
+            start = time.perf_counter()
+            try:
+                run()
+            except Exception as exc:
+                stages[name] = {'error': f"{type(exc).__name__}: {exc}"}
+                continue
+            seconds = time.perf_counter() - start
+            stages[name] = {'seconds': seconds, 'chunks_per_sec': len(chunks) / seconds if seconds else None}
+
+    total_seconds = sum(stage.get('seconds', 0.0) for stage in stages.values())
+    report = {
+        'params': {
+            'papers': args.papers,
+            'pages_per_paper': args.pages,
+            'toc_depth': args.toc_depth,
+            'words_per_page': args.words_per_page,
+            'sections_per_page': args.sections_per_page,
+            'max_tokens': settings.max_tokens,
+            'overlap': settings.overlap,
+            'tokenizer_threads': settings.tokenizer_threads,
+            'batch_size': batch_size,
+            'embed_workers': args.embed_workers,
+            'skipped': args.skip,
+        },
+        'environment': {'python': platform.python_version(), 'platform': platform.platform()},
+        'corpus': {
+            'pages': total_pages,
+            'toc_entries': sum(paper['toc_entries'] for paper in corpus),
+            'words': sum(paper['words'] for paper in corpus),
+            'generate_seconds': generate_seconds,
+        },
+        'chunks': len(chunks),
+        'failed_papers': failed,
+        'stages': stages,
+        'total_seconds': total_seconds,
+        'pages_per_sec': total_pages / total_seconds if total_seconds else None,
+        'chunks_per_sec': len(chunks) / total_seconds if total_seconds else None,
+        'peak_rss_bytes': _peak_rss(),
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        args.output.write_text(output + '\n')
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""IVF-PQ recall and latency against exact search at millions of chunks.
+
+Generates clustered, normalized synthetic embeddings (the same model as
+bench_vector_quantization.py) into a memory-mapped float32 file, trains
+and encodes an IVF-PQ index (src/indexing/ivf_pq.py), and searches it
+with every combination of --nprobe and --rescore-factors. Rescoring reads
+the candidates' float32 vectors from the memory map, as IvfPqVectorStore
+does; a rescore factor of 0 ranks by PQ scores alone. Ground truth is
+exact search; recall and MRR come from tests/evaluation/ir_metrics.py.
+The report also has build times, the in-memory size of the index against
+the float32 matrix, and the latency of an exact scan.
+
+Usage: python scripts/benchmarks/bench_ivf_pq.py [--docs 2000000] [--nprobe 1 4 16 64]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+root = Path(__file__).parent.parent.parent
+sys.path.extend([str(root / 'src'), str(root / 'tests/evaluation')])
+
+import numpy as np
+
+from bench_vector_quantization import evaluate, spectrum
+from indexing.bm25_engine import top_k_indices
+from indexing.ivf_pq import IvfPqIndex, default_nlist, encode, train
+
+# Rows generated, or scanned exactly, per block
+BLOCK_ROWS = 65536
+
+
+def write_embeddings(path: Path, docs: int, dim: int, clusters: int, rng) -> np.ndarray:
+    """bench_vector_quantization.synthetic_embeddings, written block by block to a memory map."""
+    weights = spectrum(dim)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32) * weights
+    vectors = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(docs, dim))
+    for start in range(0, docs, BLOCK_ROWS):
+        count = min(BLOCK_ROWS, docs - start)
+        block = centers[rng.integers(clusters, size=count)] + rng.standard_normal((count, dim)).astype(np.float32) * weights
+        vectors[start:start + count] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    vectors.flush()
+    return np.load(path, mmap_mode='r')
+
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int):
+    """Every query's exact top k rows, in one pass over the matrix."""
+    rows = np.empty((len(queries), 0), dtype=np.int64)
+    scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(vectors), BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + BLOCK_ROWS]) @ queries.T
+        rows = np.concatenate([rows, np.broadcast_to(np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+        scores = np.concatenate([scores, block.T], axis=1)
+        best = np.stack([top_k_indices(row_scores, k) for row_scores in scores])
+        rows, scores = np.take_along_axis(rows, best, axis=1), np.take_along_axis(scores, best, axis=1)
+    return [set(query_rows.tolist()) for query_rows in rows]
+
+
+def ivf_pq_search(index: IvfPqIndex, vectors: np.ndarray, k: int, nprobe: int, rescore_factor: int):
+    def search(query):
+        rows, _ = index.search(query, k * max(1, rescore_factor), nprobe)
+        if rescore_factor:
+            # Ascending rows, so the memmap is read front to back
+            rows = np.sort(rows)
+            rows = rows[top_k_indices(np.asarray(vectors[rows]) @ query, k)]
+        return rows.tolist()
+    return search
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=2_000_000)
+    parser.add_argument('--dim', type=int, default=384, help="all-MiniLM-L6-v2 has 384 dimensions")
+    parser.add_argument('--clusters', type=int, default=0, help="Topic clusters (default: one per 250 chunks)")
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10, choices=(5, 10), help="ir_metrics reports recall at 5 and 10")
+    parser.add_argument('--nlist', type=int, default=0, help="k-means cells (default: about 4 * sqrt(docs))")
+    parser.add_argument('--subquantizers', type=int, default=48, help="PQ bytes per vector")
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--rescore-factors', type=int, nargs='+', default=[0, 4, 16])
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    clusters = args.clusters or max(1, args.docs // 250)
+    nlist = args.nlist or default_nlist(args.docs)
+    report = {'params': {**vars(args), 'clusters': clusters, 'nlist': nlist},
+              'float32_mb': round(args.docs * args.dim * 4 / 2**20, 1)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vectors = write_embeddings(Path(tmp) / 'vectors.npy', args.docs, args.dim, clusters, rng)
+        # Queries near corpus points, as questions land near the passages that answer them
+        noise = rng.standard_normal((args.queries, args.dim)).astype(np.float32) * spectrum(args.dim)
+        queries = np.asarray(vectors[np.sort(rng.integers(args.docs, size=args.queries))]) + noise / np.linalg.norm(spectrum(args.dim))
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        truth = exact_top_k(vectors, queries, args.k)
+        report['exact'] = evaluate(lambda query: top_k_indices(np.asarray(vectors) @ query, args.k).tolist(),
+                                   queries[:10], truth[:10], args.k)
+
+        started = time.perf_counter()
+        params = train(vectors, nlist, args.subquantizers)
+        report['train_seconds'] = round(time.perf_counter() - started, 1)
+        started = time.perf_counter()
+        index = IvfPqIndex(params, *encode(params, vectors))
+        report['encode_seconds'] = round(time.perf_counter() - started, 1)
+        report['index_mb'] = round(index.nbytes / 2**20, 1)
+
+        for nprobe in args.nprobe:
+            for factor in args.rescore_factors:
+                report[f'nprobe_{nprobe}_rescore_{factor}'] = evaluate(
+                    ivf_pq_search(index, vectors, args.k, nprobe, factor), queries, truth, args.k)
+        del vectors
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
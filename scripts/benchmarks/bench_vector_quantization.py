@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+"""Semantic search recall: ChromaDBStore vs int8 / binary quantized candidates.
+
+Generates clustered, normalized synthetic embeddings, indexes them in a
+ChromaDBStore (HNSW over float32) and searches the same queries with each
+quantization: candidates from the in-memory codes, rescored against the
+float32 vectors memory-mapped from disk. Ground truth is exact search.
+Recall and MRR come from tests/evaluation/ir_metrics.py, treating the
+exact top k as the relevant set; the report also has the in-memory size
+of each representation and per-query latency.
+
+Usage: python scripts/benchmarks/bench_vector_quantization.py [--docs 50000] [--dim 384] [--k 10]
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+root = Path(__file__).parent.parent.parent
+sys.path.extend([str(root / 'src'), str(root / 'tests/evaluation')])
+
+import numpy as np
+
+from indexing.bm25_engine import top_k_indices
+from indexing.vector_quantization import QUANTIZATIONS, quantize, quantized_search
+from ir_metrics import aggregate_metrics, calculate_metrics
+
+
+def spectrum(dim: int) -> np.ndarray:
+    # Variance falls off across dimensions, as in real sentence embeddings
+    return (1 / np.sqrt(np.arange(1, dim + 1))).astype(np.float32)
+
+
+def synthetic_embeddings(docs: int, dim: int, clusters: int, rng) -> np.ndarray:
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32) * spectrum(dim)
+    vectors = centers[rng.integers(clusters, size=docs)] + rng.standard_normal((docs, dim)).astype(np.float32) * spectrum(dim)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+class PrecomputedEmbedder:
+    """Stands in for EmbeddingsGenerator: texts are "doc <row>" or "query <row>"."""
+
+    def __init__(self, vectors: np.ndarray, queries: np.ndarray):
+        self.vectors = vectors
+        self.queries = queries
+
+    def generate_embeddings(self, texts):
+        return self.vectors[[int(text.split()[1]) for text in texts]]
+
+    def embed_query(self, query):
+        return self.queries[int(query.split()[1])]
+
+
+def evaluate(search, queries: np.ndarray, truth, k: int) -> dict:
+    metrics, latencies = [], []
+    for query, relevant in zip(queries, truth):
+        started = time.perf_counter()
+        retrieved = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        metrics.append(calculate_metrics(relevant, retrieved[:k]))
+    report = {name: round(value, 4) for name, value in aggregate_metrics(metrics).items()
+              if name in (f'recall_at_{k}', 'mrr')}
+    report['mean_ms'] = round(float(np.mean(latencies)), 3)
+    return report
+
+
+def main(argv=None) -> dict:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=50_000)
+    parser.add_argument('--dim', type=int, default=384, help="all-MiniLM-L6-v2 has 384 dimensions")
+    parser.add_argument('--clusters', type=int, default=200)
+    parser.add_argument('--queries', type=int, default=100)
+    parser.add_argument('--k', type=int, default=10, choices=(5, 10), help="ir_metrics reports recall at 5 and 10")
+    parser.add_argument('--rescore-factor', type=int, help="Candidates rescored per result (default per quantization)")
+    parser.add_argument('--skip-chroma', action='store_true')
+    parser.add_argument('--output', help="Also write the JSON report to this file")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_embeddings(args.docs, args.dim, args.clusters, rng)
+    # Queries near corpus points, as questions land near the passages that answer them
+    noise = rng.standard_normal((args.queries, args.dim)).astype(np.float32) * spectrum(args.dim)
+    queries = vectors[rng.integers(args.docs, size=args.queries)] + noise / np.linalg.norm(spectrum(args.dim))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    ids = [f"chunk_{row}" for row in range(args.docs)]
+    truth = [{ids[row] for row in top_k_indices(vectors @ query, args.k)} for query in queries]
+    report = {'params': vars(args), 'float32_mb': round(vectors.nbytes / 2**20, 2)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.skip_chroma:
+            from indexing.vector_store import ChromaDBStore
+
+            store = ChromaDBStore(path=str(Path(tmp) / 'chroma_db'), collection_name='bench',
+                                  embedder=PrecomputedEmbedder(vectors, queries))
+            for start in range(0, args.docs, 5000):
+                store.add_chunks([{'chunk_id': ids[row], 'text': f"doc {row}",
+                                   'metadata': {'paper_title': 'synthetic', 'section': ''}}
+                                  for row in range(start, min(start + 5000, args.docs))])
+            query_numbers = iter(range(len(queries)))
+            report['chroma'] = evaluate(
+                lambda query: [hit['metadata']['chunk_id'] for hit in store.search(f"query {next(query_numbers)}", args.k)],
+                queries, truth, args.k)
+
+        path = Path(tmp) / 'vectors.npy'
+        np.save(path, vectors)
+        on_disk = np.load(path, mmap_mode='r')
+        for kind in QUANTIZATIONS:
+            codes = quantize(vectors, kind)
+            report[kind] = evaluate(lambda query: [ids[row] for row in quantized_search(on_disk, codes, query, args.k, rescore_factor=args.rescore_factor)[0]],
+                                    queries, truth, args.k)
+            report[kind]['in_memory_mb'] = round(codes.nbytes / 2**20, 2)
+            if 'chroma' in report:
+                recall = f'recall_at_{args.k}'
+                report[kind]['recall_loss_vs_chroma'] = round(report['chroma'][recall] - report[kind][recall], 4)
+        del on_disk
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Synthetic research-paper PDFs for ingestion benchmarks.
+
+Papers are generated locally with PyMuPDF, so benchmarks do not depend on
+the contents of data/raw_papers. Page count, outline depth and text density
+are configurable, and TOC entries carry destination points so the parser's
+intra-page section splitting is exercised.
+"""
+
+import math
+import random
+from pathlib import Path
+from typing import Dict
+
+try:
+    import fitz
+except ImportError:
+    import pymupdf as fitz
+
+VOCABULARY = (
+    "alpha beta momentum volatility drawdown sharpe sortino ratio portfolio return "
+    "forecast lstm cnn transformer attention gradient boosting regression baseline "
+    "bitcoin ethereum equity futures options liquidity spread order book market "
+    "sentiment reddit github twitter indicator macd rsi bollinger signal feature "
+    "accuracy precision recall f1 backtest walk forward validation overfitting regime"
+).split()
+
+MARGIN = 72
+FONT_SIZE = 10
+LINE_HEIGHT = 12.5
+CHARS_PER_LINE = 85
+
+
+def _sentence(rng: random.Random) -> str:
+    words = rng.choices(VOCABULARY, k=rng.randint(8, 24))
+    return " ".join(words).capitalize() + "."
+
+
+def _paragraph(rng: random.Random, n_words: int) -> str:
+    sentences = []
+    while n_words > 0:
+        sentence = _sentence(rng)
+        sentences.append(sentence)
+        n_words -= sentence.count(" ") + 1
+    return " ".join(sentences)
+
+
+def write_synthetic_paper(
+    path: Path,
+    pages: int = 20,
+    toc_depth: int = 2,
+    words_per_page: int = 450,
+    sections_per_page: float = 0.5,
+    seed: int = 0,
+) -> Dict:
+    """Write a paper to `path` and return a summary of what was generated."""
+    rng = random.Random(seed)
+    doc = fitz.open()
+    toc = []
+    counters = [0] * toc_depth
+    words_written = 0
+
+    for page_idx in range(pages):
+        page = doc.new_page()
+        bottom = page.rect.height - MARGIN
+        y = MARGIN
+        words_left = words_per_page
+
+        if page_idx == 0:
+            page.insert_text((MARGIN, y), f"Synthetic Study {seed} of Financial Machine Learning", fontsize=16)
+            page.insert_text((MARGIN, y + 24), "Published 2021", fontsize=FONT_SIZE)
+            page.insert_text((MARGIN, y + 48), "Abstract", fontsize=12)
+            y += 64
+
+        while words_left > 0:
+            n_words = min(words_left, rng.randint(40, 90))
+            # Heading probability scales with paragraph size to hit sections_per_page
+            if rng.random() < sections_per_page * n_words / words_per_page or (page_idx == 0 and not toc):
+                if y + 2 * LINE_HEIGHT > bottom:
+                    break
+                level = 1 if not toc else rng.choices(range(1, toc_depth + 1), weights=[2] + [1] * (toc_depth - 1))[0]
+                counters[level - 1] += 1
+                counters[level:] = [0] * (toc_depth - level)
+                number = ".".join(str(c or 1) for c in counters[:level])
+                title = f"{number} {rng.choice(VOCABULARY).capitalize()} {rng.choice(VOCABULARY).capitalize()}"
+                # TOC destinations live in PDF space (origin bottom-left)
+                toc.append([level, title, page_idx + 1,
+                            {"kind": fitz.LINK_GOTO, "to": fitz.Point(MARGIN, page.rect.height - y + 4)}])
+                page.insert_text((MARGIN, y + 12), title, fontsize=12)
+                y += 2 * LINE_HEIGHT
+
+            text = _paragraph(rng, n_words)
+            height = (math.ceil(len(text) / CHARS_PER_LINE) + 1) * LINE_HEIGHT
+            if y + height > bottom:
+                break
+            rect = fitz.Rect(MARGIN, y, page.rect.width - MARGIN, y + height)
+            while page.insert_textbox(rect, text, fontsize=FONT_SIZE) < 0 and rect.y1 < bottom:
+                rect.y1 = min(rect.y1 + LINE_HEIGHT, bottom)
+            y = rect.y1 + 6
+            words_left -= n_words
+            words_written += n_words
+
+    doc.set_toc(toc)
+    doc.save(str(path))
+    doc.close()
+    return {'path': str(path), 'pages': pages, 'toc_entries': len(toc), 'words': words_written}
+
+
+def write_corpus(directory: Path, papers: int, **kwargs) -> list:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    return [
+        write_synthetic_paper(directory / f"synthetic_{i:04d}.pdf", seed=i, **kwargs)
+        for i in range(papers)
+    ]
@@ -2,85 +2,208 @@
 
 import sys
 import json
+import argparse
+from collections import deque
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent / 'src'))
 
-from ingestion.pdf_extractor import PDFExtractor
-from ingestion.paper_parser import PaperParser
-from ingestion.chunker import HierarchicalChunker
-from indexing.vector_store import ChromaDBStore
+from config import config
+from ingestion.checkpoint import IngestionCheckpoint
+from ingestion.manifest import IngestionManifest
+from ingestion.pipeline import PipelineSettings, batch_stage, embed_stage, index_stage, process_stage
+from indexing.embeddings_generator import embedding_model_id
+from indexing.vector_store import create_vector_store
 from indexing.bm25_indexer import BM25Indexer
+from indexing.chunk_store import convert_json_paper, merge_chunk_stores, write_chunk_store
+from indexing.generation import bump_generation
+from indexing.snapshots import publish_snapshot
 import os
 
 
 os.environ.setdefault("CHROMADB_DISABLE_TELEMETRY", "1")
 
-def ingest_papers(papers_dir="data/raw_papers"):
-    extractor = PDFExtractor()
-    parser = PaperParser()
-    chunker = HierarchicalChunker()
-    vector_store = ChromaDBStore()
+def ingest_papers(papers_dir=None, workers=1, rebuild=False):
+    vector_store = create_vector_store()
     bm25_indexer = BM25Indexer()
+    manifest = IngestionManifest(Path(config.data_dir) / "ingestion_manifest.json")
+    checkpoint = IngestionCheckpoint(Path(config.data_dir) / "ingestion_checkpoint.sqlite")
+    processed_dir = Path(config.processed_papers_path)
 
+    # Full rebuilds are written here and swapped in once complete
+    staging_name = f"{vector_store.name}_staging"
+    staging_bm25_path = Path(f"{config.bm25_index_path}_staging")
+
+    if checkpoint.phase == 'promote':
+        print("Completing the index swap of an interrupted rebuild")
+        promote_rebuild(checkpoint, manifest, vector_store, bm25_indexer, staging_name, staging_bm25_path)
+        vector_store.optimize()
+        build_corpus_store(processed_dir, manifest.papers)
+        publish(vector_store, bm25_indexer, bump_generation())
+        checkpoint.finish()
+
+    papers_dir = papers_dir or config.raw_papers_path
     papers_path = Path(papers_dir)
-    pdf_files = list(papers_path.glob('*.pdf'))
+    pdf_files = sorted(papers_path.glob('*.pdf'))
 
-    if not pdf_files:
+    if not pdf_files and not manifest.papers:
         print(f"No PDF files found in {papers_dir}")
         return
 
-    # Reset indices before rebuilding
-    vector_store.clear()
+    if rebuild:
+        manifest.settings = {}
+    plan = manifest.plan(pdf_files, {
+        'max_tokens': config.max_tokens,
+        'overlap': config.overlap,
+        'embedding_model': embedding_model_id(config.embedding_model_name, config.embedding_backend,
+                                              config.embedding_onnx_quantize),
+        'vector_backend': config.vector_backend,
+        'bm25_analyzer': config.bm25_analyzer,
+    })
 
-    all_chunks = []
-    stats = {'papers_processed': 0, 'total_chunks': 0}
+    resumed = checkpoint.resume({'full_rebuild': plan.full_rebuild, 'settings': manifest.settings})
+    resumed_ids = []
+    if resumed:
+        done = checkpoint.done()
+        resumed_ids = [
+            manifest.paper_id(p) for p in plan.to_process
+            if done.get(manifest.paper_id(p), {}).get('sha256') == plan.hashes.get(manifest.paper_id(p))
+        ]
+        plan.to_process = [p for p in plan.to_process if manifest.paper_id(p) not in resumed_ids]
+        print(f"Resuming interrupted run: {len(done)} papers already committed")
+    checkpoint.enqueue((manifest.paper_id(p), p, plan.hashes.get(manifest.paper_id(p))) for p in plan.to_process)
 
-    for pdf_path in pdf_files:
-        print(f"Processing: {pdf_path.name}")
+    if plan.full_rebuild:
+        print("Settings changed or no manifest found; rebuilding into staging indexes")
+        target_store = create_vector_store(collection_name=staging_name)
+        target_bm25 = BM25Indexer(staging_bm25_path)
+        if not resumed:
+            target_store.clear()
+            target_bm25.reset()
+    else:
+        target_store, target_bm25 = vector_store, bm25_indexer
 
-        try:
-            # Extract PDF
-            extracted = extractor.extract_from_pdf(str(pdf_path))
+    # Chunks of changed or deleted papers are dropped before new ones land.
+    # After a crash, papers that were in flight may be partially indexed.
+    stale_ids = list(plan.removed)
+    stale_ids += [
+        manifest.paper_id(p) for p in plan.to_process
+        if resumed or manifest.paper_id(p) in manifest.papers
+    ]
+    if stale_ids:
+        target_store.delete_papers(stale_ids)
+        target_bm25.remove_papers(stale_ids)
 
-            # Parse structure using PDF path directly
-            structure = parser.parse_structure(str(pdf_path))
+    for paper_id in plan.removed:
+        (processed_dir / f"{paper_id}.chunks").unlink(missing_ok=True)
+        (processed_dir / f"{paper_id}.json").unlink(missing_ok=True)
+        manifest.forget(paper_id)
+        print(f"Removed: {paper_id}")
 
-            # Create chunks
-            chunks = chunker.chunk_paper(structure, extracted['metadata'])
+    stats = {
+        'papers_processed': 0,
+        'papers_unchanged': len(plan.unchanged),
+        'papers_resumed': len(resumed_ids),
+        'papers_removed': len(plan.removed),
+        'total_chunks': 0,
+        'failed': [],
+    }
 
-            # Save processed paper
-            output_path = Path("data/processed_papers") / f"{pdf_path.stem}.json"
-            output_path.parent.mkdir(parents=True, exist_ok=True)
+    # Papers whose chunks are not all committed yet, as (chunks emitted so far, record)
+    in_flight = deque()
+    progress = {'emitted': 0, 'commits': 0}
 
-            with open(output_path, 'w') as f:
-                json.dump({
-                    'metadata': extracted['metadata'],
-                    'chunks': chunks,
-                    'stats': {'num_chunks': len(chunks)}
-                }, f, indent=2)
+    def persist_stage(jobs):
+        for job in jobs:
+            if job.error:
+                print(f"  [ERROR] {job.pdf_path.name}: {job.error}")
+                stats['failed'].append({'paper': job.pdf_path.name, 'error': job.error})
+                checkpoint.mark_failed(job.paper_id, job.pdf_path, job.error)
+                manifest.forget(job.paper_id)
+                continue
 
-            all_chunks.extend(chunks)
+            # Save processed paper; superseded JSON output is dropped
+            write_chunk_store(processed_dir / f"{job.paper_id}.chunks", job.chunks, {job.paper_id: job.metadata})
+            (processed_dir / f"{job.paper_id}.json").unlink(missing_ok=True)
+
+            progress['emitted'] += len(job.chunks)
+            in_flight.append((progress['emitted'], (
+                job.paper_id, job.pdf_path, plan.hashes.get(job.paper_id), [c['chunk_id'] for c in job.chunks],
+            )))
             stats['papers_processed'] += 1
-            stats['total_chunks'] += len(chunks)
+            stats['total_chunks'] += len(job.chunks)
+            print(f"  [OK] {job.pdf_path.name}: {len(job.chunks)} chunks created")
+            yield job
+
+    def commit(committed_chunks):
+        """Persist the BM25 index, then mark papers whose chunks are all indexed as done."""
+        target_bm25.commit()
+        finished = []
+        while in_flight and in_flight[0][0] <= committed_chunks:
+            finished.append(in_flight.popleft()[1])
+        checkpoint.mark_done(finished)
+        if not plan.full_rebuild:
+            # The live indexes already hold these papers
+            for _, pdf_path, sha, chunk_ids in finished:
+                manifest.record(pdf_path, sha, chunk_ids)
+            manifest.save()
+        progress['commits'] += 1
 
-            print(f"  [OK] {len(chunks)} chunks created")
+    def commit_stage(batches):
+        committed = 0
+        for batch in batches:
+            committed += len(batch)
+            commit(committed)
+            yield batch
 
-        except Exception as e:
-            print(f"  [ERROR] {e}")
+    if plan.to_process:
+        print(f"Processing {len(plan.to_process)} papers with {workers} worker(s)")
+
+    # Workers only extract/parse/chunk; this process is the single writer
+    settings = PipelineSettings(
+        max_tokens=config.max_tokens,
+        overlap=config.overlap,
+        tokenizer_threads=config.tokenizer_threads,
+        lazy_page_threshold=config.lazy_page_threshold,
+    )
+    jobs = process_stage(plan.to_process, settings, workers=workers, queue_size=config.ingestion_queue_size)
+    batches = batch_stage(persist_stage(jobs), config.ingestion_batch_size)
+    for _ in commit_stage(index_stage(embed_stage(batches, target_store), target_bm25)):
+        pass
 
     print("\nIngestion complete:")
-    print(f"  Papers: {stats['papers_processed']}")
-    print(f"  Total chunks: {stats['total_chunks']}")
+    print(f"  Papers processed: {stats['papers_processed']}")
+    print(f"  Papers unchanged: {stats['papers_unchanged']}")
+    if resumed_ids:
+        print(f"  Papers resumed: {stats['papers_resumed']}")
+    print(f"  Papers removed: {stats['papers_removed']}")
+    print(f"  New chunks: {stats['total_chunks']}")
+    if stats['failed']:
+        print(f"  Failed: {len(stats['failed'])}")
+
+    changed = stats['total_chunks'] or stale_ids or resumed_ids or plan.full_rebuild
+    if in_flight or (changed and not progress['commits']):
+        commit(progress['emitted'])
+    # Background segment merges land before the index is swapped in or announced
+    target_bm25.wait_for_merges()
+    if plan.full_rebuild:
+        promote_rebuild(checkpoint, manifest, vector_store, bm25_indexer, staging_name, staging_bm25_path)
+    else:
+        manifest.save()
 
-    if all_chunks:
-        vector_store.add_chunks(all_chunks)
-        bm25_indexer.build_index(all_chunks)
-        print(f"\nIndexes updated with {len(all_chunks)} chunks")
+    if changed:
+        print(f"\nIndexes updated: {stats['total_chunks']} chunks upserted, {len(stale_ids)} papers replaced or removed")
     else:
-        print("\nNo chunks generated; skipped index updates")
+        print("\nNothing changed; skipped index updates")
+    if changed or not Path(config.chunk_store_path).exists():
+        vector_store.optimize()
+        build_corpus_store(processed_dir, manifest.papers)
+        # Running searchers reload their indexes when this moves
+        publish(vector_store, bm25_indexer, bump_generation())
+    checkpoint.finish()
+    checkpoint.close()
 
     # Save stats
-    stats_path = Path("data") / "ingestion_stats.json"
+    stats_path = Path(config.data_dir) / "ingestion_stats.json"
     stats_path.parent.mkdir(parents=True, exist_ok=True)
     with stats_path.open('w') as f:
         json.dump(stats, f, indent=2)
@@ -88,5 +211,56 @@ def ingest_papers(papers_dir="data/raw_papers"):
     return stats
 
 
+def promote_rebuild(checkpoint, manifest, vector_store, bm25_indexer, staging_name, staging_bm25_path):
+    """Swap the staging indexes in and record the rebuilt papers in the manifest.
+
+    Runs again on the next start if the process dies part-way through.
+    """
+    checkpoint.set_phase('promote')
+    manifest.settings = checkpoint.run['settings']
+    manifest.papers = {}
+    for entry in checkpoint.done().values():
+        if Path(entry['path']).exists():
+            manifest.record(Path(entry['path']), entry['sha256'], entry['chunk_ids'])
+    vector_store.swap_in(staging_name)
+    bm25_indexer.swap_in(staging_bm25_path)
+    manifest.save()
+
+
+def publish(vector_store, bm25_indexer, generation: int) -> None:
+    """Publish the updated indexes as a snapshot, which running searchers warm and swap in."""
+    if not config.snapshots_enabled:
+        return
+    bm25_indexer.wait_for_merges()
+    info = publish_snapshot(vector_store, bm25_indexer.index_path, config.chunk_store_path, generation,
+                            embedding_model_id(config.embedding_model_name, config.embedding_backend,
+                                               config.embedding_onnx_quantize))
+    print(f"Published index snapshot {info.version} ({info.chunks} chunks)")
+
+
+def build_corpus_store(processed_dir: Path, paper_ids) -> None:
+    """Merge per-paper chunk stores into the file HybridSearch memory-maps."""
+    paths = []
+    for paper_id in sorted(paper_ids):
+        store_path = processed_dir / f"{paper_id}.chunks"
+        legacy_path = processed_dir / f"{paper_id}.json"
+        if not store_path.exists() and legacy_path.exists():
+            convert_json_paper(legacy_path, store_path)
+        if store_path.exists():
+            paths.append(store_path)
+    merge_chunk_stores(paths, config.chunk_store_path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ingest PDF papers into the hybrid indexes")
+    parser.add_argument('--papers-dir', default=config.raw_papers_path, help="Directory containing PDF files")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for extract/parse/chunk (1 = run in-process)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="Ignore the ingestion manifest and re-index every paper")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    ingest_papers()
+    args = parse_args()
+    ingest_papers(args.papers_dir, workers=args.workers, rebuild=args.rebuild)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+"""Convert processed-paper JSON files to chunk stores and rebuild the corpus store.
+
+Usage: python scripts/tools/convert_processed_papers.py [--processed-dir data/processed_papers] [--remove-json]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent.parent / 'src'))
+
+from config import config
+from indexing.chunk_store import ChunkStore, convert_json_paper, merge_chunk_stores
+
+
+def convert(processed_dir: Path, remove_json: bool = False) -> None:
+    for json_path in sorted(processed_dir.glob("*.json")):
+        store_path = json_path.with_suffix(".chunks")
+        num_chunks = convert_json_paper(json_path, store_path)
+        print(f"  {json_path.name} -> {store_path.name} ({num_chunks} chunks)")
+        if remove_json:
+            json_path.unlink()
+
+    store_paths = sorted(processed_dir.glob("*.chunks"))
+    merge_chunk_stores(store_paths, config.chunk_store_path)
+    with ChunkStore(config.chunk_store_path) as store:
+        print(f"Corpus store: {config.chunk_store_path} ({store.count} chunks from {len(store.papers)} papers)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processed-dir', type=Path, default=Path(config.processed_papers_path))
+    parser.add_argument('--remove-json', action='store_true', help="delete JSON files once converted")
+    args = parser.parse_args()
+    convert(args.processed_dir, args.remove_json)
@@ -11,12 +11,14 @@ from pathlib import Path
 from typing import Dict, List
 
 import sys
-sys.path.append(str(Path(__file__).parent / "src"))
+sys.path.append(str(Path(__file__).parent.parent.parent / "src"))
 
+from indexing.chunk_store import ChunkStore
 from retrieval.hybrid_search import HybridSearch
 
 GOLDEN_DATASET_PATH = Path("tests/evaluation/golden_dataset.json")
 PROCESSED_PAPER_PATH = Path("data/processed_papers/On Technical Trading and Social Media Indicators in Cryptocurrencies Price Classification Through Deep Learning.json")
+CHUNK_STORE_PATH = Path("data/corpus.chunks")
 
 
 def load_golden_dataset() -> List[Dict]:
@@ -25,6 +27,12 @@ def load_golden_dataset() -> List[Dict]:
 
 
 def load_processed_chunks() -> List[Dict]:
+    if CHUNK_STORE_PATH.exists():
+        with ChunkStore(CHUNK_STORE_PATH) as store:
+            return [
+                chunk for chunk in store.iter_chunks()
+                if chunk["metadata"].get("paper_id") == PROCESSED_PAPER_PATH.stem
+            ]
     with PROCESSED_PAPER_PATH.open("r", encoding="utf-8") as f:
         paper_data = json.load(f)
     return paper_data.get("chunks", [])
@@ -32,8 +40,7 @@ def load_processed_chunks() -> List[Dict]:
 
 def show_chunk_inventory(chunks: List[Dict], limit: int = 10) -> None:
     print(f"Total chunks available: {len(chunks)}")
-    print(f"
-First {limit} chunks (id, section, preview):")
+    print(f"\nFirst {limit} chunks (id, section, preview):")
     for chunk in chunks[:limit]:
         chunk_id = chunk.get("chunk_id")
         section = chunk.get("metadata", {}).get("section", "Unknown")
@@ -50,20 +57,17 @@ def compare_ids(golden: List[Dict], chunks: List[Dict]) -> None:
         missing_ids.update(set(item.get("relevant_chunk_ids", [])) - actual_ids)
 
     if missing_ids:
-        print("
-??  Missing chunk IDs referenced by the golden set:")
+        print("\n??  Missing chunk IDs referenced by the golden set:")
         for chunk_id in sorted(missing_ids):
             print(f"  - {chunk_id}")
     else:
-        print("
-? All golden-set chunk IDs are present in the processed data.")
+        print("\n? All golden-set chunk IDs are present in the processed data.")
 
 
 def sample_search(query: str, k: int = 5) -> None:
     search = HybridSearch()
     results = search.search(query, k=k)
-    print(f"
-Sample search for: '{query}' (top {k})")
+    print(f"\nSample search for: '{query}' (top {k})")
     for idx, result in enumerate(results, start=1):
         chunk_id = result.get("chunk_id")
         section = result.get("metadata", {}).get("section", "Unknown")
@@ -80,8 +84,7 @@ def show_question_alignment(golden: List[Dict], question_idx: int = 0) -> None:
         print(f"No question at index {question_idx}")
         return
 
-    print(f"
-Golden question {item['id']}:")
+    print(f"\nGolden question {item['id']}:")
     print(f"  Question: {item['question']}")
     print(f"  Expected chunks: {item['relevant_chunk_ids']}")
     print(f"  Expected sections: {item.get('expected_sections', [])}")
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+"""Watch the raw papers folder and ingest new, changed or deleted PDFs.
+
+Changes are debounced (`watcher.debounce_seconds`) so a burst of file drops
+triggers a single incremental run. Each run only processes the affected
+papers and bumps the index generation, which running HybridSearch
+instances pick up on their next query.
+"""
+
+import sys
+import argparse
+import traceback
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent / 'src'))
+
+from config import config
+from ingestion.watcher import FolderWatcher
+from ingest_papers import ingest_papers
+
+
+def watch_papers(papers_dir=None, workers=1, poll_interval=None, debounce_seconds=None):
+    papers_dir = Path(papers_dir or config.raw_papers_path)
+    papers_dir.mkdir(parents=True, exist_ok=True)
+    watcher = FolderWatcher(papers_dir, debounce_seconds=debounce_seconds or config.watcher_debounce_seconds)
+
+    # Catch up on anything that changed while the watcher was not running
+    ingest_papers(str(papers_dir), workers=workers)
+    print(f"\nWatching {papers_dir} for PDF changes (Ctrl+C to stop)")
+
+    for changes in watcher.watch(poll_interval or config.watcher_poll_interval):
+        print(f"\nDetected changes: {len(changes.added)} added, "
+              f"{len(changes.modified)} modified, {len(changes.removed)} removed")
+        try:
+            ingest_papers(str(papers_dir), workers=workers)
+        except Exception:
+            # Keep watching; the checkpoint lets the next run resume
+            traceback.print_exc()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Incrementally ingest PDFs as they appear in a folder")
+    parser.add_argument('--papers-dir', default=config.raw_papers_path, help="Directory to watch")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Worker processes for extract/parse/chunk (1 = run in-process)")
+    parser.add_argument('--poll-interval', type=float, help="Seconds between folder scans")
+    parser.add_argument('--debounce', type=float, help="Quiet period before a batch of changes is ingested")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        watch_papers(args.papers_dir, args.workers, args.poll_interval, args.debounce)
+    except KeyboardInterrupt:
+        print("\nStopped watching")
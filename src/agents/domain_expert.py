@@ -33,7 +33,8 @@ class DomainExpert(BaseAgent):
             else DomainExpertRequest.model_validate(input_data)
         )
 
-        raw_chunks = self.search_system.search(request.query, k=5)
+        where = request.filters.as_where() if request.filters else None
+        raw_chunks = self.search_system.search(request.query, k=5, where=where)
         chunks = self._select_high_value_chunks(raw_chunks)
         metadata = self._analyze_chunks(chunks, request.query_analysis, request.query)
 
@@ -1,4 +1,4 @@
-from typing import List, Literal
+from typing import Dict, List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field
 
@@ -33,9 +33,44 @@ class QueryAnalyzerResponse(BaseModel):
         return self.model_dump()
 
 
+class SearchFilters(BaseModel):
+    """Restricts retrieval to matching chunks; unset fields do not filter."""
+
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    sections: List[str] = Field(default_factory=list)
+    paper_titles: List[str] = Field(default_factory=list)
+    paper_ids: List[str] = Field(default_factory=list)
+    page_min: Optional[int] = None
+    page_max: Optional[int] = None
+
+    def as_where(self) -> Optional[Dict]:
+        """The filters as a Chroma-style `where` clause (None when nothing is set)."""
+        clauses = []
+        if self.year_min is not None:
+            clauses.append({"year": {"$gte": self.year_min}})
+        if self.year_max is not None:
+            clauses.append({"year": {"$lte": self.year_max}})
+        if self.sections:
+            clauses.append({"section": {"$in": self.sections}})
+        if self.paper_titles:
+            clauses.append({"paper_title": {"$in": self.paper_titles}})
+        if self.paper_ids:
+            clauses.append({"paper_id": {"$in": self.paper_ids}})
+        if self.page_min is not None:
+            clauses.append({"page_start": {"$gte": self.page_min}})
+        if self.page_max is not None:
+            clauses.append({"page_start": {"$lte": self.page_max}})
+        if not clauses:
+            return None
+        # Chroma takes one operator per dict
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
 class DomainExpertRequest(BaseModel):
     query: str
     query_analysis: QueryAnalyzerMetadata
+    filters: Optional[SearchFilters] = None
 
     model_config = ConfigDict(str_strip_whitespace=True)
 
@@ -70,6 +105,7 @@ class DomainExpertResponse(BaseModel):
 
 class OrchestratorRequest(BaseModel):
     query: str
+    filters: Optional[SearchFilters] = None
 
     model_config = ConfigDict(str_strip_whitespace=True)
 
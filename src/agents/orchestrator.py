@@ -39,6 +39,7 @@ class Orchestrator(BaseAgent):
             DomainExpertRequest(
                 query=request.query,
                 query_analysis=query_analysis.metadata,
+                filters=request.filters,
             )
         )
 
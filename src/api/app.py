@@ -9,6 +9,8 @@ sys.path.extend([str(root_path), str(root_path.parent / 'tests/evaluation')])
 from agents.models import OrchestratorRequest, OrchestratorResponse
 from agents.orchestrator import Orchestrator
 from eval_runner import EvaluationRunner
+from indexing.snapshots import current_version, list_snapshots
+from retrieval.hybrid_search import HybridSearch
 
 app = FastAPI(title="Financial ML Research Assistant", version="1.0.0")
 
@@ -23,6 +25,10 @@ def get_evaluation_runner() -> EvaluationRunner:
     return _eval_runner
 
 
+def get_search_system() -> HybridSearch:
+    return _orchestrator.domain_expert.search_system
+
+
 @app.post("/query", response_model=OrchestratorResponse)
 async def query_papers(
     request: OrchestratorRequest,
@@ -66,6 +72,36 @@ async def health_check(
         raise HTTPException(status_code=500, detail=str(exc)) from exc
 
 
+@app.get("/snapshots")
+async def get_snapshots(search: HybridSearch = Depends(get_search_system)):
+    return {
+        "current": current_version(),
+        **search.status(),
+        "snapshots": [info.as_dict() for info in list_snapshots()],
+    }
+
+
+@app.post("/snapshots/{version}/activate", status_code=202)
+async def activate_snapshot(version: str, search: HybridSearch = Depends(get_search_system)):
+    """Warm `version` in the background, then swap it in; queries keep running meanwhile."""
+    try:
+        started = search.activate(version)
+    except ValueError as exc:
+        raise HTTPException(status_code=404, detail=str(exc)) from exc
+    if not started:
+        raise HTTPException(status_code=409, detail="another snapshot is being activated")
+    return {"activating": version, **search.status()}
+
+
+@app.post("/snapshots/rollback")
+async def rollback_snapshot(search: HybridSearch = Depends(get_search_system)):
+    try:
+        search.rollback()
+    except (ValueError, RuntimeError) as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    return search.status()
+
+
 def _get_quality_indicators(eval_runner: EvaluationRunner):
     try:
         return eval_runner.get_recent_metrics()
@@ -1,7 +1,7 @@
 import yaml
 import os
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 class Config:
     _instance = None
@@ -27,22 +27,122 @@ class Config:
     def chroma_db_path(self) -> str:
         return self._config_data['chroma_db_path']
 
+    @property
+    def numpy_store_path(self) -> str:
+        return self._config_data.get('numpy_store_path', 'data/vector_store')
+
+    @property
+    def snapshot_path(self) -> str:
+        return self._config_data.get('snapshot_path', 'data/snapshots')
+
+    @property
+    def snapshots_enabled(self) -> bool:
+        return self._config_data.get('snapshots', {}).get('enabled', True)
+
+    @property
+    def snapshots_keep(self) -> int:
+        return self._config_data.get('snapshots', {}).get('keep', 3)
+
     @property
     def bm25_index_path(self) -> str:
         return self._config_data['bm25_index_path']
 
+    @property
+    def bm25_merge_factor(self) -> int:
+        return self._config_data['bm25']['merge_factor']
+
+    @property
+    def bm25_query_strategy(self) -> str:
+        return self._config_data['bm25'].get('query_strategy', 'exhaustive')
+
+    @property
+    def bm25_analyzer(self) -> Optional[Dict[str, Any]]:
+        return self._config_data['bm25'].get('analyzer')
+
+    @property
+    def bm25_query_cache_size(self) -> int:
+        return self._config_data['bm25'].get('query_cache_size', 1024)
+
+    @property
+    def raw_papers_path(self) -> str:
+        return self._config_data['raw_papers_path']
+
     @property
     def processed_papers_path(self) -> str:
         return self._config_data['processed_papers_path']
 
+    @property
+    def chunk_store_path(self) -> str:
+        return self._config_data['chunk_store_path']
+
     @property
     def embedding_model_name(self) -> str:
         return self._config_data['embeddings']['model_name']
 
+    @property
+    def embedding_batch_size(self) -> int:
+        return self._config_data['embeddings']['batch_size']
+
+    @property
+    def embedding_cache_path(self) -> str:
+        return self._config_data['embeddings']['cache_path']
+
+    @property
+    def embedding_backend(self) -> str:
+        return self._config_data['embeddings'].get('backend', 'torch')
+
+    @property
+    def embedding_onnx_quantize(self) -> bool:
+        return self._config_data['embeddings'].get('onnx_quantize', False)
+
+    @property
+    def onnx_export_path(self) -> str:
+        return self._config_data['embeddings'].get('onnx_path', 'data/onnx')
+
+    @property
+    def embedding_threads(self) -> int:
+        return self._config_data['embeddings'].get('threads', 0)
+
+    @property
+    def embedding_workers(self) -> int:
+        return self._config_data['embeddings'].get('workers', 1)
+
+    @property
+    def query_embedding_cache_entries(self) -> int:
+        return self._config_data['embeddings'].get('query_cache_entries', 1024)
+
+    @property
+    def query_embedding_cache_bytes(self) -> int:
+        return self._config_data['embeddings'].get('query_cache_mb', 16) * 1024 * 1024
+
     @property
     def semantic_weight(self) -> float:
         return self._config_data['retrieval']['semantic_weight']
 
+    @property
+    def vector_backend(self) -> str:
+        return self._config_data['retrieval'].get('vector_backend', 'chroma')
+
+    @property
+    def vector_quantization(self) -> str:
+        return self._config_data['retrieval'].get('vector_quantization', 'none')
+
+    @property
+    def ivf_nlist(self) -> int:
+        return self._config_data['retrieval'].get('ivf_pq', {}).get('nlist', 0)
+
+    @property
+    def ivf_nprobe(self) -> int:
+        return self._config_data['retrieval'].get('ivf_pq', {}).get('nprobe', 64)
+
+    @property
+    def pq_subquantizers(self) -> int:
+        return self._config_data['retrieval'].get('ivf_pq', {}).get('subquantizers', 48)
+
+    @property
+    def ivf_rescore_factor(self) -> int:
+        return self._config_data['retrieval'].get('ivf_pq', {}).get('rescore_factor', 16)
+
     @property
     def max_tokens(self) -> int:
         return self._config_data['chunking']['max_tokens']
@@ -51,6 +151,30 @@ class Config:
     def overlap(self) -> int:
         return self._config_data['chunking']['overlap']
 
+    @property
+    def tokenizer_threads(self) -> int:
+        return self._config_data['chunking'].get('tokenizer_threads', 1)
+
+    @property
+    def ingestion_queue_size(self) -> int:
+        return self._config_data['ingestion']['queue_size']
+
+    @property
+    def ingestion_batch_size(self) -> int:
+        return self._config_data['ingestion']['batch_size']
+
+    @property
+    def lazy_page_threshold(self):
+        return self._config_data['ingestion'].get('lazy_page_threshold')
+
+    @property
+    def watcher_poll_interval(self) -> float:
+        return self._config_data['watcher']['poll_interval']
+
+    @property
+    def watcher_debounce_seconds(self) -> float:
+        return self._config_data['watcher']['debounce_seconds']
+
     @property
     def confidence_high(self) -> float:
         return self._config_data['confidence_thresholds']['high']
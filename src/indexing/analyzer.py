@@ -0,0 +1,111 @@
+"""Text analysis for BM25: the same pipeline turns chunks and queries into terms.
+
+An `Analyzer` runs a compiled regex tokenizer, lowercases, drops stopwords
+and optionally stems. Protected terms (tickers, model names such as "S&P"
+or "GARCH(1,1)") are matched as written, before the tokenizer would split
+them, and are kept whole: never dropped as stopwords and never stemmed.
+
+The settings are stored in the BM25 index manifest, and an index is always
+queried with the analyzer it was built with; changing the configured
+analyzer takes effect on the next full rebuild.
+"""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ANALYZER_VERSION = 1
+# Word characters, keeping decimals and dotted abbreviations ("0.05", "e.g") whole
+DEFAULT_TOKEN_PATTERN = r"\w+(?:\.\w+)*"
+
+# Lucene's classic English stop set
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be but by for if in into is it no not of on or such that the their then there these
+they this to was will with
+""".split())
+
+STEMMERS = ("none", "plural")
+
+
+def plural_stem(term: str) -> str:
+    """Harman's S-stemmer: strips English plural endings only, so it rarely conflates unrelated words."""
+    if len(term) > 3 and term.endswith("ies") and not term.endswith(("eies", "aies")):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("es") and not term.endswith(("aes", "ees", "oes")):
+        return term[:-1]
+    if len(term) > 2 and term.endswith("s") and not term.endswith(("us", "ss")):
+        return term[:-1]
+    return term
+
+
+class Analyzer:
+    def __init__(self, token_pattern: str = DEFAULT_TOKEN_PATTERN, lowercase: bool = True,
+                 stopwords: Iterable[str] = (), stemmer: str = "none",
+                 protected_terms: Iterable[str] = (), cache_size: int = 1024):
+        if stemmer not in STEMMERS:
+            raise ValueError(f"unknown stemmer {stemmer!r}; expected one of {', '.join(STEMMERS)}")
+        self.token_pattern = token_pattern
+        self.lowercase = lowercase
+        self.stopwords = frozenset(stopwords)
+        self.stemmer = stemmer
+        self.protected_terms = tuple(protected_terms)
+        # Longest first, so "S&P 500" wins over "S&P"
+        protected = "|".join(re.escape(term) for term in sorted(self.protected_terms, key=len, reverse=True))
+        pattern = f"(?<!\\w)(?P<protected>{protected})(?!\\w)|" if protected else ""
+        self._regex = re.compile(f"{pattern}(?:{token_pattern})")
+        # Query strings repeat (paging, retries, evaluation runs), so their terms are cached
+        self.analyze_query = lru_cache(maxsize=cache_size)(self._analyze_query)
+
+    @classmethod
+    def from_settings(cls, settings: Dict, cache_size: int = 1024) -> 'Analyzer':
+        """Rebuild an analyzer from `settings` as stored in an index."""
+        if settings.get("version") != ANALYZER_VERSION:
+            raise ValueError(f"unsupported analyzer settings version {settings.get('version')}")
+        stopwords = settings.get("stopwords") or ()
+        if stopwords == "english":
+            stopwords = ENGLISH_STOPWORDS
+        return cls(settings.get("token_pattern", DEFAULT_TOKEN_PATTERN), settings.get("lowercase", True),
+                   stopwords, settings.get("stemmer", "none"), settings.get("protected_terms", ()), cache_size)
+
+    @classmethod
+    def whitespace(cls, cache_size: int = 1024) -> 'Analyzer':
+        """`text.lower().split()`, how indexes were tokenized before analyzers existed."""
+        return cls(token_pattern=r"\S+", cache_size=cache_size)
+
+    @property
+    def settings(self) -> Dict:
+        stopwords = "english" if self.stopwords == ENGLISH_STOPWORDS else sorted(self.stopwords)
+        return {
+            "version": ANALYZER_VERSION,
+            "token_pattern": self.token_pattern,
+            "lowercase": self.lowercase,
+            "stopwords": stopwords,
+            "stemmer": self.stemmer,
+            "protected_terms": list(self.protected_terms),
+        }
+
+    def analyze(self, text: str) -> List[str]:
+        terms = []
+        for match in self._regex.finditer(text):
+            term = match.group(0)
+            if self.lowercase:
+                term = term.lower()
+            if self.protected_terms and match.group("protected") is not None:
+                terms.append(term)
+                continue
+            if term in self.stopwords:
+                continue
+            if self.stemmer == "plural":
+                term = plural_stem(term)
+            terms.append(term)
+        return terms
+
+    def _analyze_query(self, text: str) -> Tuple[str, ...]:
+        return tuple(self.analyze(text))
+
+
+def configured_analyzer(settings: Optional[Dict], cache_size: int = 1024) -> Analyzer:
+    """The analyzer described by the `bm25.analyzer` config section."""
+    if not settings:
+        return Analyzer.whitespace(cache_size)
+    return Analyzer.from_settings({"version": ANALYZER_VERSION, **settings}, cache_size)
@@ -0,0 +1,362 @@
+"""Inverted-index BM25 scoring.
+
+Scores match `rank_bm25.BM25Okapi` bit for bit: idf uses the same math.log
+calls and epsilon floor for terms that appear in more than half of the
+documents (summed in the order BM25Okapi first sees each term), and each
+posting's weight is computed with the same floating-point expression
+`get_scores` evaluates. A query only touches the posting lists of its
+terms instead of every document in the corpus.
+
+The tf and length-normalisation factor of every posting is precomputed
+when an engine is created; a query only multiplies it by the term's idf.
+Both factors use corpus-wide statistics (avgdl and idf) that change
+whenever segments are added or merged, so they live in memory with the
+engine, not in the segment files.
+
+`Postings` holds one batch of documents in flat arrays that can live in a
+memory-mapped file (see `bm25_store`), plus per-block bounds used to prune
+top-k queries (see `bm25_query`). `corpus_stats` combines any number of
+them, minus deleted documents, into corpus-wide N, avgdl and idf, so an
+index split into segments scores exactly like one built from all of its
+live documents.
+"""
+
+import math
+from collections.abc import Sequence as SequenceABC
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+_NOT_SEEN = np.iinfo(np.int64).max
+# Postings per block in the block-max bounds
+POSTINGS_PER_BLOCK = 128
+
+
+class StringArray(SequenceABC):
+    """Strings stored as one UTF-8 blob plus u64 offsets."""
+
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray):
+        self.offsets = offsets
+        self.blob = blob
+
+    @classmethod
+    def from_strings(cls, values: Iterable[str]) -> 'StringArray':
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype="<u8")
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+
+    def _bytes(self, index: int) -> bytes:
+        return self.blob[int(self.offsets[index]):int(self.offsets[index + 1])].tobytes()
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._bytes(index).decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        data = self.blob.tobytes()
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets[:-1], offsets[1:]):
+            yield data[start:end].decode("utf-8")
+
+    def find(self, value: str) -> Optional[int]:
+        """Binary search; only valid when the strings are sorted."""
+        key = value.encode("utf-8")
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self._bytes(lo) == key else None
+
+
+class PostingBlocks(NamedTuple):
+    """Each term's postings cut into runs of POSTINGS_PER_BLOCK.
+
+    Block j covers postings offsets[j]:offsets[j + 1]; a term's blocks are
+    term_ptr[t]:term_ptr[t + 1]. The largest term frequency and shortest
+    document of a block bound the BM25 weight of any of its postings.
+    """
+    term_ptr: np.ndarray
+    offsets: np.ndarray
+    max_tf: np.ndarray
+    min_len: np.ndarray
+
+
+class Postings:
+    """Term-major (CSR) postings for a batch of documents.
+
+    Terms are sorted by UTF-8 bytes so lookups are a binary search. `slots`
+    holds each posting's position within its document's term counts, which
+    is what lets `doc_freqs` and `corpus_stats` reproduce the order in which
+    BM25Okapi would have seen the terms.
+    """
+
+    def __init__(self, terms: StringArray, indptr: np.ndarray, doc_ids: np.ndarray,
+                 term_freqs: np.ndarray, slots: np.ndarray, doc_len: np.ndarray,
+                 blocks: Optional[PostingBlocks] = None):
+        self.terms = terms
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.term_freqs = term_freqs
+        self.slots = slots
+        self.doc_len = doc_len
+        self._blocks = blocks
+        # Term -> ID lookups are binary searches over the vocabulary; queries repeat terms
+        self._find = lru_cache(maxsize=4096)(terms.find)
+
+    @property
+    def doc_count(self) -> int:
+        return len(self.doc_len)
+
+    @property
+    def blocks(self) -> PostingBlocks:
+        """Block-max bounds; computed on first use for segments stored without them."""
+        if self._blocks is None:
+            rank = np.arange(len(self.doc_ids)) - np.repeat(self.indptr[:-1], np.diff(self.indptr))
+            starts = np.flatnonzero(rank % POSTINGS_PER_BLOCK == 0)
+            self._blocks = PostingBlocks(
+                np.searchsorted(starts, self.indptr),
+                np.append(starts, len(self.doc_ids)),
+                np.maximum.reduceat(self.term_freqs, starts) if len(starts) else self.term_freqs[:0],
+                np.minimum.reduceat(self.doc_len[self.doc_ids], starts) if len(starts) else self.doc_len[:0],
+            )
+        return self._blocks
+
+    @classmethod
+    def from_doc_freqs(cls, doc_freqs: Sequence[Dict[str, int]]) -> 'Postings':
+        """Build from per-document term counts (the `BM25Okapi.doc_freqs` layout)."""
+        if not doc_freqs:
+            raise ValueError("cannot build a BM25 index without documents")
+        vocab: Dict[str, int] = {}
+        rows, cols, freqs, slots = [], [], [], []
+        doc_len = np.zeros(len(doc_freqs), dtype=np.int64)
+        for doc_id, frequencies in enumerate(doc_freqs):
+            for slot, (term, freq) in enumerate(frequencies.items()):
+                rows.append(vocab.setdefault(term, len(vocab)))
+                cols.append(doc_id)
+                freqs.append(freq)
+                slots.append(slot)
+            doc_len[doc_id] = sum(frequencies.values())
+        return cls.from_coo(list(vocab), np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int32),
+                            np.asarray(freqs, dtype=np.int32), np.asarray(slots, dtype=np.int32), doc_len)
+
+    @classmethod
+    def from_coo(cls, terms: List[str], rows: np.ndarray, cols: np.ndarray, freqs: np.ndarray,
+                 slots: np.ndarray, doc_len: np.ndarray) -> 'Postings':
+        """Build from one entry per (term, document): `rows` index into `terms`, `cols` are documents."""
+        # Every term keeps at least one posting (merges can leave terms of deleted documents behind)
+        used = np.flatnonzero(np.bincount(rows, minlength=len(terms)))
+        sorted_ids = np.asarray(sorted(used.tolist(), key=terms.__getitem__), dtype=np.int64)
+        rank = np.empty(len(terms), dtype=np.int64)
+        rank[sorted_ids] = np.arange(len(sorted_ids))
+        rows = rank[rows]
+        # Postings are grouped by term, then in document order
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(sorted_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(sorted_ids)), out=indptr[1:])
+        return cls(StringArray.from_strings(terms[i] for i in sorted_ids.tolist()), indptr,
+                   cols[order], freqs[order], slots[order], doc_len)
+
+    def find(self, term: str) -> Optional[int]:
+        return self._find(term)
+
+    def term_ids(self) -> np.ndarray:
+        """Term ID of every posting."""
+        return np.repeat(np.arange(len(self.terms)), np.diff(self.indptr))
+
+    def doc_freqs(self) -> List[Dict[str, int]]:
+        """Per-document term counts in their original order."""
+        terms = list(self.terms)
+        order = np.lexsort((self.slots, self.doc_ids))
+        bounds = np.searchsorted(self.doc_ids[order], np.arange(self.doc_count + 1))
+        ids, freqs = self.term_ids()[order].tolist(), self.term_freqs[order].tolist()
+        return [
+            {terms[ids[i]]: freqs[i] for i in range(start, end)}
+            for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+        ]
+
+
+def merge_postings(parts: Sequence[Tuple[Postings, Optional[np.ndarray]]]) -> Postings:
+    """Concatenate the live documents of `parts` (postings, live mask or None) into one."""
+    vocab: Dict[str, int] = {}
+    rows, cols, freqs, slots, lengths = [], [], [], [], []
+    offset = 0
+    for postings, live in parts:
+        if live is None:
+            live = np.ones(postings.doc_count, dtype=bool)
+        new_ids = np.cumsum(live) - 1 + offset
+        mapping = np.fromiter((vocab.setdefault(term, len(vocab)) for term in postings.terms),
+                              dtype=np.int64, count=len(postings.terms))
+        kept = live[postings.doc_ids]
+        rows.append(mapping[postings.term_ids()[kept]])
+        cols.append(new_ids[postings.doc_ids[kept]].astype(np.int32))
+        freqs.append(postings.term_freqs[kept])
+        slots.append(postings.slots[kept])
+        lengths.append(postings.doc_len[live])
+        offset += int(live.sum())
+    if not offset:
+        raise ValueError("cannot build a BM25 index without documents")
+    return Postings.from_coo(list(vocab), np.concatenate(rows), np.concatenate(cols),
+                             np.concatenate(freqs).astype(np.int32), np.concatenate(slots).astype(np.int32),
+                             np.concatenate(lengths).astype(np.int64))
+
+
+@dataclass
+class CorpusStats:
+    corpus_size: int
+    avgdl: float
+    # Per part, aligned with that part's vocabulary; terms without a live
+    # document have doc_freq 0 and idf 0
+    idf: List[np.ndarray]
+    doc_freq: List[np.ndarray]
+
+
+def corpus_stats(parts: Sequence[Tuple[Postings, Optional[np.ndarray]]], epsilon: float = 0.25) -> CorpusStats:
+    """N, avgdl and per-term idf over the live documents of `parts`, in order."""
+    vocab: Dict[str, int] = {}
+    mappings, part_dfs, part_first = [], [], []
+    slot_base = max((int(postings.slots.max()) + 1 for postings, _ in parts if len(postings.slots)), default=1)
+    offset = corpus_size = total_len = 0
+    for postings, live in parts:
+        starts = postings.indptr[:-1]
+        # Where each term is first seen: (document, position within the document)
+        keys = (offset + postings.doc_ids.astype(np.int64)) * slot_base + postings.slots
+        if live is None:
+            df = np.diff(postings.indptr)
+            corpus_size += postings.doc_count
+            total_len += int(postings.doc_len.sum())
+        else:
+            kept = live[postings.doc_ids]
+            df = np.add.reduceat(kept.astype(np.int64), starts) if len(starts) else np.zeros(0, np.int64)
+            keys = np.where(kept, keys, _NOT_SEEN)
+            corpus_size += int(live.sum())
+            total_len += int(postings.doc_len[live].sum())
+        part_dfs.append(df)
+        part_first.append(np.minimum.reduceat(keys, starts) if len(starts) else np.zeros(0, np.int64))
+        mappings.append(np.fromiter((vocab.setdefault(term, len(vocab)) for term in postings.terms),
+                                    dtype=np.int64, count=len(postings.terms)))
+        offset += postings.doc_count
+    if not corpus_size:
+        raise ValueError("cannot build a BM25 index without documents")
+
+    doc_freq = np.zeros(len(vocab), dtype=np.int64)
+    first_seen = np.full(len(vocab), _NOT_SEEN, dtype=np.int64)
+    for mapping, df, first in zip(mappings, part_dfs, part_first):
+        # A term appears once per part, so plain fancy indexing is enough
+        doc_freq[mapping] += df
+        first_seen[mapping] = np.minimum(first_seen[mapping], first)
+    seen = np.flatnonzero(doc_freq)
+    seen = seen[np.argsort(first_seen[seen], kind='stable')]
+    idf = np.zeros(len(vocab), dtype=np.float64)
+    idf[seen] = _idf(doc_freq[seen], corpus_size, epsilon)
+    return CorpusStats(corpus_size, total_len / corpus_size,
+                       [idf[mapping] for mapping in mappings], [doc_freq[mapping] for mapping in mappings])
+
+
+def _idf(doc_counts: np.ndarray, corpus_size: int, epsilon: float) -> np.ndarray:
+    # Same math.log calls as BM25Okapi._calc_idf, evaluated once per distinct
+    # count; cumsum adds left to right like its idf_sum loop
+    unique, inverse = np.unique(doc_counts, return_inverse=True)
+    values = np.array([math.log(corpus_size - freq + 0.5) - math.log(freq + 0.5) for freq in unique.tolist()])
+    idf = values[inverse]
+    eps = epsilon * (float(np.cumsum(idf)[-1]) / len(idf)) if len(idf) else 0.0
+    idf[idf < 0] = eps
+    return idf
+
+
+class BM25Engine:
+    """Scores one `Postings` part with corpus-wide idf and avgdl."""
+
+    def __init__(self, postings: Postings, idf: np.ndarray, avgdl: float, k1: float = 1.5, b: float = 0.75):
+        self.postings = postings
+        self.idf_values = idf
+        self.avgdl = avgdl
+        self.k1 = k1
+        self.b = b
+        # Everything in a posting's weight except idf, as BM25Okapi.get_scores
+        # evaluates it. It depends on the corpus-wide avgdl, so it is computed
+        # per engine (once per index version) rather than stored in segments.
+        length_norm = k1 * (1 - b + b * postings.doc_len / avgdl)
+        q_freq = postings.term_freqs.astype(np.int64)
+        self._tf_weights = q_freq * (k1 + 1) / (q_freq + length_norm[postings.doc_ids])
+
+    @classmethod
+    def from_doc_freqs(cls, doc_freqs: Sequence[Dict[str, int]], k1: float = 1.5, b: float = 0.75,
+                       epsilon: float = 0.25) -> 'BM25Engine':
+        postings = Postings.from_doc_freqs(doc_freqs)
+        stats = corpus_stats([(postings, None)], epsilon)
+        return cls(postings, stats.idf[0], stats.avgdl, k1, b)
+
+    @property
+    def corpus_size(self) -> int:
+        return self.postings.doc_count
+
+    @property
+    def idf(self) -> Dict[str, float]:
+        return dict(zip(self.postings.terms, self.idf_values.tolist()))
+
+    def weights(self, term_id: int, positions) -> Tuple[np.ndarray, np.ndarray]:
+        """Documents and BM25 weights of the postings at `positions` (a slice or indices)."""
+        # idf * (tf part), the same product BM25Okapi.get_scores computes, so results are identical
+        return self.postings.doc_ids[positions], self.idf_values[term_id] * self._tf_weights[positions]
+
+    def block_bounds(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Posting offsets (one more than blocks) and weight bound of each of a term's blocks."""
+        blocks = self.postings.blocks
+        lo, hi = blocks.term_ptr[term_id], blocks.term_ptr[term_id + 1]
+        max_tf = blocks.max_tf[lo:hi].astype(np.int64)
+        # Same expression as the weights, so rounding cannot push a weight above its bound
+        # by more than a few ulps (covered by the caller's slack)
+        norm = self.k1 * (1 - self.b + self.b * blocks.min_len[lo:hi] / self.avgdl)
+        return blocks.offsets[lo:hi + 1], self.idf_values[term_id] * (max_tf * (self.k1 + 1) / (max_tf + norm))
+
+    def add_scores(self, query: Iterable[str], scores: np.ndarray) -> None:
+        postings = self.postings
+        for term in query:
+            term_id = postings.find(term)
+            if term_id is None:
+                continue
+            docs, weights = self.weights(term_id, slice(postings.indptr[term_id], postings.indptr[term_id + 1]))
+            # Posting lists hold each document once, so fancy-index add is safe
+            scores[docs] += weights
+
+    def get_scores(self, query: Iterable[str]) -> np.ndarray:
+        scores = np.zeros(self.corpus_size)
+        self.add_scores(query, scores)
+        return scores
+
+    def top_k(self, query: Iterable[str], k: int) -> np.ndarray:
+        """Indices of the k best documents, ties broken by lower index."""
+        return top_k_indices(self.get_scores(query), k)
+
+    def doc_freqs(self) -> List[Dict[str, int]]:
+        return self.postings.doc_freqs()
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Same order as `sorted(range(n), key=scores.__getitem__, reverse=True)[:k]`."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > kth)
+        # Among documents tied at the cut-off, the lowest indices win
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        candidates = np.concatenate([above, ties])
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.lexsort((candidates, -scores[candidates]))]
@@ -1,53 +1,190 @@
-from rank_bm25 import BM25Okapi
 import pickle
+import shutil
+from collections import Counter
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, List, Optional, Tuple
 from config import config
+from indexing.analyzer import Analyzer, configured_analyzer
+from indexing.bm25_engine import Postings
+from indexing.bm25_segments import RowFilter, SegmentedIndex
+
+LEGACY_FILES = ("bm25_index.pkl", "chunk_ids.pkl", "paper_ids.pkl")
 
 class BM25Indexer:
     def __init__(self, index_path=None):
         self.index_path = Path(index_path or config.bm25_index_path)
         self.index_path.mkdir(parents=True, exist_ok=True)
-        self.bm25 = None
-        self.chunk_ids = []
+        self.bm25 = SegmentedIndex(self.index_path, merge_factor=config.bm25_merge_factor,
+                                   query_strategy=config.bm25_query_strategy)
+        # Replaced by the analyzer stored with the index when it is loaded
+        self.analyzer = self._configured_analyzer()
+        # Chunks staged since the last commit; only their term counts are
+        # kept. Each commit writes them as one new segment, so adding a paper
+        # never re-tokenizes or re-indexes the rest of the corpus.
+        self._doc_freqs: List[Dict[str, int]] = []
+        self._staged_chunk_ids: List[str] = []
+        self._staged_paper_ids: List[Optional[str]] = []
+        self._removed_papers = set()
+        self._reset = False
+        self._loaded = False
 
     def build_index(self, chunks: List[Dict]):
-        corpus = []
-        self.chunk_ids = []
+        self.reset()
+        self.add_chunks(chunks)
+        self.commit()
+
+    def update_index(self, chunks: List[Dict], removed_paper_ids: Iterable[str] = ()):
+        """Patch the index in place: drop papers, then add (or replace) chunks.
+
+        To replace a paper, list its ID in `removed_paper_ids` and pass its
+        new chunks.
+        """
+        self.remove_papers(removed_paper_ids)
+        self.add_chunks(chunks)
+        self.commit()
+
+    def reset(self):
+        """Start from an empty index; the existing one is replaced on the next commit.
 
+        The rebuilt index uses the configured analyzer.
+        """
+        self._ensure_loaded()
+        self._clear_staged()
+        self._reset = True
+        self.analyzer = self._configured_analyzer()
+
+    def remove_papers(self, paper_ids: Iterable[str]):
+        """Delete papers on the next commit (tombstones; merges drop the rows later)."""
+        self._ensure_loaded()
+        removed = set(paper_ids)
+        if not removed:
+            return
+        keep = [i for i, paper_id in enumerate(self._staged_paper_ids) if paper_id not in removed]
+        self._doc_freqs = [self._doc_freqs[i] for i in keep]
+        self._staged_chunk_ids = [self._staged_chunk_ids[i] for i in keep]
+        self._staged_paper_ids = [self._staged_paper_ids[i] for i in keep]
+        self._removed_papers |= removed
+
+    def add_chunks(self, chunks: Iterable[Dict]):
+        """Stage chunks for the next commit(); only term counts are kept."""
+        self._ensure_loaded()
         for chunk in chunks:
-            corpus.append(chunk['text'].lower().split())
-            self.chunk_ids.append(chunk['chunk_id'])
+            self._doc_freqs.append(dict(Counter(self.analyzer.analyze(chunk['text']))))
+            self._staged_chunk_ids.append(chunk['chunk_id'])
+            self._staged_paper_ids.append(chunk['metadata'].get('paper_id'))
 
-        self.bm25 = BM25Okapi(corpus)
-        self._save_index()
+    def commit(self):
+        self._ensure_loaded()
+        postings = Postings.from_doc_freqs(self._doc_freqs) if self._doc_freqs else None
+        self.bm25.commit(postings, self._staged_chunk_ids, self._staged_paper_ids,
+                         self._removed_papers, reset=self._reset, analyzer=self.analyzer.settings)
+        if postings is not None or self._removed_papers or self._reset:
+            for name in LEGACY_FILES:
+                (self.index_path / name).unlink(missing_ok=True)
+        self._clear_staged()
 
-    def search(self, query: str, k: int = 10) -> List[str]:
-        if not self.bm25:
-            self._load_index()
+    def wait_for_merges(self):
+        """Block until background segment merges and statistics are written."""
+        self.bm25.wait()
 
-        if not self.bm25:
-            return []
+    def swap_in(self, staging_path) -> bool:
+        """Replace this index with the one committed under `staging_path`.
 
-        tokenized_query = query.lower().split()
-        scores = self.bm25.get_scores(tokenized_query)
+        Directories are swapped by renaming; if the process dies between the
+        renames, calling this again completes the swap.
+        """
+        staging_path = Path(staging_path)
+        if not staging_path.exists():
+            return False
+        self.bm25.wait()
+        SegmentedIndex.wait_for_path(staging_path)
+        backup_path = self.index_path.with_name(self.index_path.name + "_previous")
+        shutil.rmtree(backup_path, ignore_errors=True)
+        if self.index_path.exists():
+            self.index_path.rename(backup_path)
+        staging_path.rename(self.index_path)
+        shutil.rmtree(backup_path, ignore_errors=True)
+        self.bm25 = SegmentedIndex(self.index_path, merge_factor=config.bm25_merge_factor,
+                                   query_strategy=config.bm25_query_strategy)
+        self._loaded = False
+        return True
 
-        # Get top k indices
-        top_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)[:k]
-        return [self.chunk_ids[i] for i in top_indices]
+    def search(self, query: str, k: int = 10, row_filter: Optional[RowFilter] = None) -> List[str]:
+        """IDs of the k best chunks for `query`; `row_filter` restricts them (see `SegmentedIndex.search`)."""
+        self._ensure_loaded()
+        return self.bm25.search(list(self.analyzer.analyze_query(query)), k, row_filter)
 
-    def _save_index(self):
-        with open(self.index_path / "bm25_index.pkl", "wb") as f:
-            pickle.dump(self.bm25, f)
-        with open(self.index_path / "chunk_ids.pkl", "wb") as f:
-            pickle.dump(self.chunk_ids, f)
+    def search_keys(self, query: str, k: int = 10,
+                    row_filter: Optional[RowFilter] = None) -> List[Tuple[str, Optional[str]]]:
+        """Like `search`, as (chunk ID, paper ID) pairs."""
+        self._ensure_loaded()
+        return self.bm25.search_keys(list(self.analyzer.analyze_query(query)), k, row_filter)
+
+    @property
+    def chunk_ids(self) -> List[str]:
+        """IDs of the committed chunks, in index order."""
+        self._ensure_loaded()
+        return self.bm25.chunk_ids()
+
+    @property
+    def paper_ids(self) -> List[Optional[str]]:
+        self._ensure_loaded()
+        return self.bm25.paper_ids()
+
+    @staticmethod
+    def _configured_analyzer() -> Analyzer:
+        return configured_analyzer(config.bm25_analyzer, cache_size=config.bm25_query_cache_size)
+
+    def _clear_staged(self):
+        self._doc_freqs = []
+        self._staged_chunk_ids = []
+        self._staged_paper_ids = []
+        self._removed_papers = set()
+        self._reset = False
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            self._load_index()
 
     def _load_index(self):
+        self._loaded = True
+        self.bm25.load()
         bm25_path = self.index_path / "bm25_index.pkl"
         ids_path = self.index_path / "chunk_ids.pkl"
+        paper_ids_path = self.index_path / "paper_ids.pkl"
+        # Queries and new chunks are analyzed exactly as the committed ones were
+        if self.bm25.analyzer is not None:
+            self.analyzer = Analyzer.from_settings(self.bm25.analyzer, cache_size=config.bm25_query_cache_size)
+        elif self.bm25.segment_count or bm25_path.exists():
+            self.analyzer = Analyzer.whitespace(config.bm25_query_cache_size)
+        if self.bm25.generation or self.bm25.segment_count or not bm25_path.exists() or not ids_path.exists():
+            return
+
+        # Pickled layout from older versions; written out as a segment on the next commit
+        postings = self._load_legacy_postings(bm25_path)
+        if postings is None:
+            return
+        with open(ids_path, "rb") as f:
+            chunk_ids = pickle.load(f)
+        if paper_ids_path.exists():
+            with open(paper_ids_path, "rb") as f:
+                paper_ids = pickle.load(f)
+        else:
+            # Indexes written before paper tracking cannot be patched per paper
+            paper_ids = [None] * len(chunk_ids)
+        self.bm25.adopt(postings, chunk_ids, paper_ids)
 
-        if bm25_path.exists() and ids_path.exists():
+    @staticmethod
+    def _load_legacy_postings(bm25_path: Path) -> Optional[Postings]:
+        try:
             with open(bm25_path, "rb") as f:
-                self.bm25 = pickle.load(f)
-            with open(ids_path, "rb") as f:
-                self.chunk_ids = pickle.load(f)
\ No newline at end of file
+                bm25 = pickle.load(f)
+        except ModuleNotFoundError as e:
+            raise RuntimeError(
+                f"{bm25_path} was written by an older version using rank_bm25, which is not installed; "
+                "re-run ingestion with --rebuild to recreate the BM25 index"
+            ) from e
+        if bm25 is None:
+            return None
+        # Index pickled as a rank_bm25.BM25Okapi, which keeps per-document term counts
+        return Postings.from_doc_freqs(bm25.doc_freqs)
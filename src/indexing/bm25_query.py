@@ -0,0 +1,226 @@
+"""Top-k query strategies over the BM25 engines of a segmented index.
+
+`exhaustive` scores every document that contains a query term and selects
+the best k from the whole corpus.
+
+`block_max` prunes with block-max bounds (see `Postings.blocks`), in the
+block-max MaxScore variant of WAND-style dynamic pruning, which works on
+whole posting lists at a time and so stays in numpy:
+
+1. Documents from the query's highest-bounded blocks are scored to learn
+   a threshold, the score a document needs to enter the top k.
+2. Query terms whose maximum weights together stay below the threshold are
+   non-essential: a document containing only those cannot make the top k.
+   Candidates are the documents of the essential terms' posting lists,
+   usually the rare, short ones.
+3. A candidate's score is bounded by the bounds of the blocks it falls in,
+   one per query term. Candidates below the threshold are dropped before
+   their exact scores are looked up in the (long) posting lists.
+
+Results are identical to `exhaustive`, ties included. Queries where pruning
+cannot guarantee that or would not pay off (a negative idf, fewer than k
+documents with a positive score, or most of the corpus as candidates) are
+scored exhaustively.
+
+Both take an optional `allowed` `RowSet` (a metadata filter's bitmap,
+deleted rows already cleared). Only allowed rows can be returned, and only
+their postings are scored, so a selective filter makes a query cheaper.
+Filtered queries are never pruned: block bounds cover the filtered-out
+documents too, so they would rarely skip anything.
+"""
+
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from indexing.bm25_engine import BM25Engine, top_k_indices
+
+# Blocks scored for the first threshold (quadrupled while fewer than k documents match)
+FIRST_ROUND_BLOCKS = 2
+# Above this share of the corpus as candidates, exhaustive scoring is cheaper
+MAX_CANDIDATE_FRACTION = 0.25
+# Bounds use the same expression as the weights, but rounding of a ratio is not
+# monotonic to the last ulp, and sums of bounds are added in a different order
+# than scores; this covers both
+_BOUND_SLACK = 1 + 1e-9
+
+
+class RowSet(NamedTuple):
+    """The rows a search may return, as a bitmap and as ascending row numbers."""
+    mask: np.ndarray
+    rows: np.ndarray
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray) -> 'RowSet':
+        return cls(mask, np.flatnonzero(mask))
+
+
+def exhaustive_top_k(engines: Sequence[BM25Engine], offsets: np.ndarray, query: List[str], k: int,
+                     deleted: np.ndarray, allowed: Optional[RowSet] = None) -> np.ndarray:
+    """Rows (across `engines`, stacked at `offsets`) of the k best live (and allowed) documents."""
+    if allowed is not None:
+        return _allowed_top_k(engines, offsets, query, k, allowed)
+    scores = np.zeros(int(offsets[-1]))
+    for engine, start in zip(engines, offsets.tolist()):
+        engine.add_scores(query, scores[start:start + engine.corpus_size])
+    if len(deleted):
+        scores[deleted] = -np.inf
+    return top_k_indices(scores, k)
+
+
+def _allowed_top_k(engines: Sequence[BM25Engine], offsets: np.ndarray, query: List[str], k: int,
+                   allowed: RowSet) -> np.ndarray:
+    # One score per allowed row; each row's terms are added in query order, as in the full scan
+    scores = np.zeros(len(allowed.rows))
+    for engine, start in zip(engines, offsets.tolist()):
+        mask = allowed.mask[start:start + engine.corpus_size]
+        postings = engine.postings
+        for term in query:
+            term_id = postings.find(term)
+            if term_id is None:
+                continue
+            lo = int(postings.indptr[term_id])
+            kept = np.flatnonzero(mask[postings.doc_ids[lo:postings.indptr[term_id + 1]]])
+            docs, weights = engine.weights(term_id, lo + kept)
+            scores[np.searchsorted(allowed.rows, docs + start)] += weights
+    # Rows are ascending, so ties go to the lower row as in the full scan
+    return allowed.rows[top_k_indices(scores, k)]
+
+
+class _TermBlocks:
+    """One query term's posting list and blocks in one engine."""
+
+    def __init__(self, engine: BM25Engine, term_id: int):
+        postings = engine.postings
+        self.engine = engine
+        self.term_id = term_id
+        self.start = int(postings.indptr[term_id])
+        self.docs = postings.doc_ids[self.start:postings.indptr[term_id + 1]]
+        self.offsets, bounds = engine.block_bounds(term_id)
+        self.bounds = bounds * _BOUND_SLACK
+        self.first_docs = postings.doc_ids[self.offsets[:-1]]
+        self.last_docs = postings.doc_ids[self.offsets[1:] - 1]
+
+    def block_bounds_of(self, docs: np.ndarray) -> np.ndarray:
+        """Bound of the block each of `docs` falls in, 0 where none does."""
+        blocks = np.searchsorted(self.last_docs, docs)
+        inside = blocks < len(self.bounds)
+        inside[inside] = self.first_docs[blocks[inside]] <= docs[inside]
+        return np.where(inside, self.bounds[np.minimum(blocks, len(self.bounds) - 1)], 0.0)
+
+    def add_scores(self, docs: np.ndarray, scores: np.ndarray) -> None:
+        """Add this term's weights for `docs` (sorted) into `scores`, aligned with them."""
+        positions = np.searchsorted(self.docs, docs)
+        found = positions < len(self.docs)
+        found[found] = self.docs[positions[found]] == docs[found]
+        _, weights = self.engine.weights(self.term_id, self.start + positions[found])
+        scores[found] += weights
+
+
+class _EngineQuery:
+    """The query's terms in one engine; each term once per occurrence, in query order."""
+
+    def __init__(self, engine: BM25Engine, offset: int, query: List[str], deleted: np.ndarray):
+        self.offset = offset
+        ids: Dict[str, Optional[int]] = {}
+        for term in query:
+            if term not in ids:
+                ids[term] = engine.postings.find(term)
+        found = {term: _TermBlocks(engine, term_id) for term, term_id in ids.items() if term_id is not None}
+        self.terms = [found.get(term) for term in query]
+        self.deleted = deleted[(deleted >= offset) & (deleted < offset + engine.corpus_size)] - offset
+
+    def score(self, docs: np.ndarray, threshold: Optional[float] = None):
+        """Exact scores of the live `docs` (unique), skipping those whose bound is below `threshold`."""
+        docs = docs[~np.isin(docs, self.deleted)]
+        if threshold is not None:
+            # Summed in query order like the scores, so a score never exceeds its bound
+            bounds = np.zeros(len(docs))
+            for term in self.terms:
+                if term is not None:
+                    bounds += term.block_bounds_of(docs)
+            docs = docs[bounds >= threshold]
+        scores = np.zeros(len(docs))
+        for term in self.terms:
+            if term is not None:
+                term.add_scores(docs, scores)
+        return docs + self.offset, scores
+
+
+def _threshold(scores: List[np.ndarray], k: int) -> Optional[float]:
+    scores = np.concatenate(scores) if scores else np.zeros(0)
+    if len(scores) < k:
+        return None
+    return float(np.partition(scores, len(scores) - k)[len(scores) - k])
+
+
+def _block_max_rows(engines: Sequence[BM25Engine], offsets: np.ndarray, query: List[str], k: int,
+                    deleted: np.ndarray) -> Optional[np.ndarray]:
+    queries = [_EngineQuery(engine, int(offset), query, deleted) for engine, offset in zip(engines, offsets.tolist())]
+    if any(term is not None and term.engine.idf_values[term.term_id] < 0 for q in queries for term in q.terms):
+        return None
+
+    # 1. A threshold from the documents of the highest-bounded blocks
+    terms = [(index, term) for index, q in enumerate(queries) for term in q.terms if term is not None]
+    if not terms:
+        return None
+    bounds = np.concatenate([term.bounds for _, term in terms])
+    owners = np.repeat(np.arange(len(terms)), [len(term.bounds) for _, term in terms])
+    starts = np.concatenate([term.offsets[:-1] - term.start for _, term in terms])
+    ends = np.concatenate([term.offsets[1:] - term.start for _, term in terms])
+    order = np.argsort(-bounds, kind='stable')
+    count = FIRST_ROUND_BLOCKS
+    while True:
+        chosen: Dict[int, List[np.ndarray]] = {}
+        for block in order[:count].tolist():
+            index, term = terms[owners[block]]
+            chosen.setdefault(index, []).append(term.docs[starts[block]:ends[block]])
+        threshold = _threshold([queries[index].score(np.unique(np.concatenate(docs)))[1]
+                                for index, docs in chosen.items()], k)
+        if threshold is not None and threshold > 0:
+            break
+        if count >= len(bounds):
+            return None
+        count *= 4
+
+    # 2. Candidates from the essential terms: the non-essential ones (lowest
+    # maximum weights first) together stay below the threshold
+    max_weights = {}
+    for q in queries:
+        for index, term in enumerate(q.terms):
+            if term is not None:
+                max_weights[index] = max(max_weights.get(index, 0.0), float(term.bounds.max()))
+    essential, total = set(), 0.0
+    for index in sorted(max_weights, key=max_weights.get):
+        total += max_weights[index]
+        if total * _BOUND_SLACK >= threshold:
+            essential.add(index)
+    candidates = []
+    for q in queries:
+        lists = [term.docs for index, term in enumerate(q.terms) if term is not None and index in essential]
+        candidates.append(np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype=np.int32))
+    if sum(len(docs) for docs in candidates) > MAX_CANDIDATE_FRACTION * int(offsets[-1]):
+        return None
+
+    # 3. Exact scores for candidates whose block bounds reach the threshold
+    rows, scores = zip(*(q.score(docs, threshold) for q, docs in zip(queries, candidates)))
+    rows, scores = np.concatenate(rows), np.concatenate(scores)
+    # Rows are ascending, so ties still go to the lower row
+    return rows[top_k_indices(scores, k)]
+
+
+def block_max_top_k(engines: Sequence[BM25Engine], offsets: np.ndarray, query: List[str], k: int,
+                    deleted: np.ndarray, allowed: Optional[RowSet] = None) -> np.ndarray:
+    """Same result as `exhaustive_top_k`, skipping documents that cannot reach the top k."""
+    if k <= 0 or not engines:
+        return np.empty(0, dtype=np.int64)
+    if allowed is not None:
+        return _allowed_top_k(engines, offsets, query, k, allowed)
+    rows = _block_max_rows(engines, offsets, query, k, deleted)
+    return rows if rows is not None else exhaustive_top_k(engines, offsets, query, k, deleted)
+
+
+QUERY_STRATEGIES: Dict[str, Callable[..., np.ndarray]] = {
+    "exhaustive": exhaustive_top_k,
+    "block_max": block_max_top_k,
+}
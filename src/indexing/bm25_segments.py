@@ -0,0 +1,499 @@
+"""Segmented (log-structured) BM25 index.
+
+An index directory holds immutable segment files (see `bm25_store`) and a
+`manifest.json` listing, in order, the live segments, the rows of each that
+have been deleted (tombstones), the analyzer settings its terms were
+produced with and, once computed, the stats file with corpus-wide idf for
+exactly that set of segments.
+
+A commit writes one new segment for the added documents and records
+deletions as tombstones, so its cost depends on the batch rather than on
+the corpus. A background thread merges runs of adjacent, similarly sized
+segments (dropping deleted rows) and then writes the stats file. Queries
+score every segment with the statistics of the whole manifest (N, avgdl and
+document frequencies over the live documents), so results are identical to
+a single index built from the live documents in order, whichever query
+strategy (see `bm25_query`) selects the top k.
+
+Searches can be restricted by a row filter (see `SegmentedIndex.search`).
+Its bitmap over the rows is computed the first time the filter is used on
+a version of the manifest and then kept with that version, so repeated
+filters cost a lookup.
+"""
+
+import copy
+import json
+import math
+import os
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, Dict, Hashable, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from indexing.bm25_engine import BM25Engine, CorpusStats, Postings, corpus_stats, merge_postings
+from indexing.bm25_query import QUERY_STRATEGIES, RowSet
+from indexing.bm25_store import (PaperIdArray, StringArray, read_segment, read_stats, write_segment,
+                                 write_stats)
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+# Single-file index written before segments existed; adopted as the first segment
+LEGACY_SEGMENT = "bm25.index"
+# In-memory segment converted from a pickled index, written out on the next commit
+PICKLED_SEGMENT = "<pickled>"
+# Segments with a larger share of deleted rows are rewritten on their own
+MAX_DELETED_FRACTION = 0.5
+# Live documents per segment below which every segment is in the first merge tier
+BASE_TIER_DOCS = 256
+# Filter bitmaps kept per manifest version; the oldest is dropped first
+MAX_FILTER_MASKS = 64
+
+# (chunk_ids, paper_ids) of every row -> bool array of allowed rows; also has
+# a hashable `key` attribute (see `SegmentedIndex.search`)
+RowFilter = Callable[[List[str], List[Optional[str]]], np.ndarray]
+
+
+class Segment(NamedTuple):
+    postings: Postings
+    chunk_ids: StringArray
+    paper_ids: PaperIdArray
+
+
+class _View(NamedTuple):
+    generation: int
+    engines: List[BM25Engine]
+    segments: List[Segment]
+    offsets: np.ndarray
+    deleted: np.ndarray
+    live_count: int
+    stats: Optional[CorpusStats]
+    # Row filter key -> live rows it allows
+    masks: Dict[Hashable, RowSet]
+
+
+def _live_mask(doc_count: int, deleted: Sequence[int]) -> np.ndarray:
+    live = np.ones(doc_count, dtype=bool)
+    live[list(deleted)] = False
+    return live
+
+
+class SegmentedIndex:
+    """BM25 over the segments listed in one index directory's manifest.
+
+    A single writer per directory is assumed (ingestion runs one at a time);
+    any number of processes can read.
+    """
+
+    # Maintenance threads by index directory, so a directory is not moved
+    # while a writer in this process is still merging into it
+    _maintenance_threads: Dict[Path, threading.Thread] = {}
+
+    def __init__(self, path, merge_factor: int = 8, query_strategy: str = "exhaustive",
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        if query_strategy not in QUERY_STRATEGIES:
+            raise ValueError(f"unknown BM25 query strategy {query_strategy!r}; "
+                             f"expected one of {', '.join(QUERY_STRATEGIES)}")
+        self.path = Path(path)
+        self.merge_factor = merge_factor
+        self.query_strategy = query_strategy
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self._lock = threading.RLock()
+        self._manifest = self._empty_manifest()
+        self._segments: Dict[str, Segment] = {}
+        self._next_segment = 1
+        self._view: Optional[_View] = None
+        # Incremented by reset so merges started before it are discarded
+        self._epoch = 0
+        # Files being written by the maintenance thread, not yet in the manifest
+        self._reserved = set()
+        self._maintenance: Optional[threading.Thread] = None
+        self._maintenance_pending = False
+        self._maintenance_error: Optional[BaseException] = None
+        self._cleaned = False
+
+    @staticmethod
+    def _empty_manifest() -> Dict:
+        return {"version": MANIFEST_VERSION, "generation": 0, "next_segment": 1, "segments": [], "stats": None}
+
+    @property
+    def generation(self) -> int:
+        return self._manifest["generation"]
+
+    @property
+    def segment_count(self) -> int:
+        return len(self._manifest["segments"])
+
+    @property
+    def analyzer(self) -> Optional[Dict]:
+        """Settings of the analyzer the committed terms came from (None for older indexes)."""
+        return self._manifest.get("analyzer")
+
+    def load(self) -> None:
+        """(Re)read the manifest and map its segments."""
+        for attempt in range(5):
+            try:
+                manifest = self._read_manifest()
+                segments = {
+                    entry["file"]: self._segments.get(entry["file"]) or Segment(*read_segment(self.path / entry["file"]))
+                    for entry in manifest["segments"]
+                }
+                break
+            except FileNotFoundError:
+                # A merge replaced segments between reading the manifest and mapping them
+                if attempt == 4:
+                    raise
+                time.sleep(0.05)
+        with self._lock:
+            self._manifest, self._segments, self._view = manifest, segments, None
+            self._next_segment = max(self._next_segment, manifest["next_segment"])
+
+    def _read_manifest(self) -> Dict:
+        manifest_path = self.path / MANIFEST_FILE
+        if manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text())
+            if manifest.get("version") != MANIFEST_VERSION:
+                raise ValueError(f"{manifest_path}: unsupported BM25 manifest version {manifest.get('version')}")
+            return manifest
+        manifest = self._empty_manifest()
+        if (self.path / LEGACY_SEGMENT).exists():
+            manifest["segments"].append({"file": LEGACY_SEGMENT, "deleted": []})
+        return manifest
+
+    def adopt(self, postings: Postings, chunk_ids: Sequence[str], paper_ids: Sequence[Optional[str]]) -> None:
+        """Serve an in-memory index (converted from a pickle) until the next commit writes it out."""
+        with self._lock:
+            manifest = self._empty_manifest()
+            manifest["segments"].append({"file": PICKLED_SEGMENT, "deleted": []})
+            segment = Segment(postings, StringArray.from_strings(chunk_ids), PaperIdArray.from_ids(paper_ids))
+            self._manifest, self._segments, self._view = manifest, {PICKLED_SEGMENT: segment}, None
+
+    def commit(self, postings: Optional[Postings], chunk_ids: Sequence[str], paper_ids: Sequence[Optional[str]],
+               removed_papers: Iterable[str] = (), reset: bool = False, analyzer: Optional[Dict] = None) -> None:
+        """Tombstone the rows of `removed_papers`, then append `postings` as a new segment.
+
+        With `reset`, the new manifest starts empty instead; either way the
+        switch is a single atomic manifest replacement. `analyzer` settings,
+        if given, are recorded with it.
+        """
+        removed = set(removed_papers)
+        if postings is None and not removed and not reset:
+            return
+        with self._lock:
+            manifest = copy.deepcopy(self._manifest)
+            segments = dict(self._segments)
+            if reset:
+                self._epoch += 1
+                manifest["segments"] = []
+            for entry in manifest["segments"]:
+                if entry["file"] == PICKLED_SEGMENT:
+                    entry["file"] = self._write_new_segment(segments, *segments[PICKLED_SEGMENT])
+                if removed:
+                    rows = np.flatnonzero(segments[entry["file"]].paper_ids.rows_of(removed))
+                    entry["deleted"] = sorted(set(entry["deleted"]).union(rows.tolist()))
+            if postings is not None:
+                name = self._write_new_segment(segments, postings, chunk_ids, paper_ids)
+                manifest["segments"].append({"file": name, "deleted": []})
+            if analyzer is not None:
+                manifest["analyzer"] = analyzer
+            self._publish(manifest, segments)
+        self._schedule_maintenance()
+
+    def _write_new_segment(self, segments: Dict[str, Segment], postings: Postings, chunk_ids, paper_ids) -> str:
+        name = self._allocate_name()
+        write_segment(self.path / name, postings, chunk_ids, paper_ids)
+        segments[name] = Segment(*read_segment(self.path / name))
+        return name
+
+    def _allocate_name(self) -> str:
+        with self._lock:
+            name = f"seg_{self._next_segment:06d}.index"
+            self._next_segment += 1
+            return name
+
+    def _publish(self, manifest: Dict, segments: Dict[str, Segment], stats_changed: bool = False) -> None:
+        """Atomically replace the manifest; callers hold the lock."""
+        if not stats_changed:
+            manifest["generation"] += 1
+            manifest["stats"] = None
+            # Segments with every row deleted need no merge to go away
+            manifest["segments"] = [
+                entry for entry in manifest["segments"]
+                if len(entry["deleted"]) < segments[entry["file"]].postings.doc_count
+            ]
+        manifest["next_segment"] = self._next_segment
+        self.path.mkdir(parents=True, exist_ok=True)
+        manifest_path = self.path / MANIFEST_FILE
+        tmp_path = manifest_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(manifest))
+        os.replace(tmp_path, manifest_path)
+
+        live = {entry["file"] for entry in manifest["segments"]}
+        self._manifest = manifest
+        self._segments = {name: segment for name, segment in segments.items() if name in live}
+        if not stats_changed:
+            self._view = None
+        self._remove_unreferenced()
+
+    def _remove_unreferenced(self) -> None:
+        # Readers that already mapped a removed file keep using it until they reload
+        keep = {entry["file"] for entry in self._manifest["segments"]} | self._reserved | {MANIFEST_FILE}
+        if self._manifest["stats"]:
+            keep.add(self._manifest["stats"])
+        for path in self.path.iterdir():
+            stale_tmp = path.suffix == ".tmp" and not self._cleaned and not self._reserved
+            if path.name not in keep and (path.suffix in (".index", ".bin") or stale_tmp):
+                path.unlink(missing_ok=True)
+        self._cleaned = True
+
+    # Background maintenance
+
+    def _schedule_maintenance(self) -> None:
+        with self._lock:
+            self._maintenance_pending = True
+            if self._maintenance is None:
+                self._maintenance = threading.Thread(target=self._maintain, name="bm25-maintenance", daemon=True)
+                self._maintenance_threads[self.path.resolve()] = self._maintenance
+                self._maintenance.start()
+
+    def _maintain(self) -> None:
+        while True:
+            with self._lock:
+                if not self._maintenance_pending or self._maintenance_error is not None:
+                    self._maintenance = None
+                    return
+                self._maintenance_pending = False
+            try:
+                while self._merge_once():
+                    pass
+                self._write_stats()
+            except Exception as e:
+                traceback.print_exc()
+                with self._lock:
+                    self._maintenance_error = e
+
+    @classmethod
+    def wait_for_path(cls, path) -> None:
+        """Wait for any maintenance thread of this process working in `path`."""
+        thread = cls._maintenance_threads.get(Path(path).resolve())
+        if thread is not None:
+            thread.join()
+
+    def wait(self) -> None:
+        """Block until background merges and stats are done; re-raises their failure."""
+        while True:
+            with self._lock:
+                thread = self._maintenance
+                error, self._maintenance_error = self._maintenance_error, None
+            if error is not None:
+                raise RuntimeError("BM25 segment maintenance failed") from error
+            if thread is None:
+                return
+            thread.join()
+
+    def _merge_candidate(self, manifest: Dict, segments: Dict[str, Segment]) -> Optional[slice]:
+        sizes = []
+        for index, entry in enumerate(manifest["segments"]):
+            doc_count = segments[entry["file"]].postings.doc_count
+            if len(entry["deleted"]) > doc_count * MAX_DELETED_FRACTION:
+                return slice(index, index + 1)
+            sizes.append(doc_count - len(entry["deleted"]))
+        # Only adjacent segments are merged so documents keep their order
+        tiers = [max(0, int(math.log(max(size, 1) / BASE_TIER_DOCS, self.merge_factor))) for size in sizes]
+        start = 0
+        for index in range(1, len(tiers) + 1):
+            if index == len(tiers) or tiers[index] != tiers[start]:
+                if index - start >= self.merge_factor:
+                    return slice(start, start + self.merge_factor)
+                start = index
+        return None
+
+    def _merge_once(self) -> bool:
+        with self._lock:
+            manifest, segments, epoch = self._manifest, self._segments, self._epoch
+            span = self._merge_candidate(manifest, segments)
+            if span is None:
+                return False
+            sources = copy.deepcopy(manifest["segments"][span])
+            name = self._allocate_name()
+            self._reserved.add(name)
+
+        try:
+            parts, chunk_ids, paper_ids = [], [], []
+            for entry in sources:
+                segment = segments[entry["file"]]
+                live = _live_mask(segment.postings.doc_count, entry["deleted"])
+                parts.append((segment.postings, live))
+                rows = np.flatnonzero(live).tolist()
+                chunk_ids.extend(segment.chunk_ids[row] for row in rows)
+                paper_ids.extend(segment.paper_ids[row] for row in rows)
+            write_segment(self.path / name, merge_postings(parts), chunk_ids, paper_ids)
+            merged = Segment(*read_segment(self.path / name))
+
+            with self._lock:
+                if self._epoch != epoch:
+                    return True
+                manifest = copy.deepcopy(self._manifest)
+                # Commits since the snapshot only append segments, add
+                # tombstones and drop segments that became fully deleted, so
+                # the sources still left form one contiguous run
+                current = {entry["file"]: entry for entry in manifest["segments"]}
+                positions = [i for i, entry in enumerate(manifest["segments"])
+                             if entry["file"] in {source["file"] for source in sources}]
+                if not positions:
+                    return True
+                deleted, offset = [], 0
+                for before, (postings, live) in zip(sources, parts):
+                    after = current.get(before["file"])
+                    now_deleted = after["deleted"] if after else range(postings.doc_count)
+                    new_rows = np.cumsum(live) - 1 + offset
+                    deleted.extend(new_rows[sorted(set(now_deleted) - set(before["deleted"]))].tolist())
+                    offset += int(live.sum())
+                manifest["segments"][positions[0]:positions[-1] + 1] = [{"file": name, "deleted": sorted(deleted)}]
+                self._reserved.discard(name)
+                self._publish(manifest, dict(self._segments, **{name: merged}))
+            return True
+        finally:
+            with self._lock:
+                if name in self._reserved:
+                    self._reserved.discard(name)
+                    (self.path / name).unlink(missing_ok=True)
+
+    def _write_stats(self) -> None:
+        with self._lock:
+            manifest, segments = self._manifest, self._segments
+            if manifest["stats"] or not manifest["segments"]:
+                return
+            name = f"stats_{manifest['generation']:06d}.bin"
+            self._reserved.add(name)
+        try:
+            stats = self._compute_stats(manifest, segments)
+            write_stats(self.path / name, manifest["generation"], [e["file"] for e in manifest["segments"]], stats)
+            with self._lock:
+                if self._manifest is manifest:
+                    self._reserved.discard(name)
+                    self._publish(dict(copy.deepcopy(manifest), stats=name), segments, stats_changed=True)
+        finally:
+            with self._lock:
+                if name in self._reserved:
+                    self._reserved.discard(name)
+                    (self.path / name).unlink(missing_ok=True)
+
+    # Queries
+
+    def _compute_stats(self, manifest: Dict, segments: Dict[str, Segment]) -> CorpusStats:
+        parts = []
+        for entry in manifest["segments"]:
+            postings = segments[entry["file"]].postings
+            parts.append((postings, _live_mask(postings.doc_count, entry["deleted"]) if entry["deleted"] else None))
+        return corpus_stats(parts, self.epsilon)
+
+    def _load_stats(self, manifest: Dict, segments: Dict[str, Segment]) -> CorpusStats:
+        if manifest["stats"]:
+            try:
+                header, stats = read_stats(self.path / manifest["stats"])
+                if header["generation"] == manifest["generation"]:
+                    return stats
+            except FileNotFoundError:
+                pass
+        # Stats for this generation are still being computed in the background
+        return self._compute_stats(manifest, segments)
+
+    def _current_view(self) -> _View:
+        with self._lock:
+            if self._view is not None:
+                return self._view
+            manifest, segments = self._manifest, self._segments
+        ordered = [segments[entry["file"]] for entry in manifest["segments"]]
+        counts = [segment.postings.doc_count for segment in ordered]
+        offsets = np.zeros(len(ordered) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        deleted = np.asarray([offsets[i] + row for i, entry in enumerate(manifest["segments"])
+                              for row in entry["deleted"]], dtype=np.int64)
+        stats = self._load_stats(manifest, segments) if ordered else None
+        engines = [BM25Engine(segment.postings, idf, stats.avgdl, self.k1, self.b)
+                   for segment, idf in zip(ordered, stats.idf)] if stats else []
+        view = _View(manifest["generation"], engines, ordered, offsets, deleted,
+                     int(offsets[-1]) - len(deleted), stats, {})
+        with self._lock:
+            if self._manifest is manifest:
+                self._view = view
+        return view
+
+    def search(self, query_terms: List[str], k: int, row_filter: Optional[RowFilter] = None) -> List[str]:
+        """Chunk IDs of the k best matches, only among rows `row_filter` allows if given.
+
+        `row_filter(chunk_ids, paper_ids)` maps the IDs of every row in the
+        index, deleted ones included, to a bool array of the rows that may be
+        returned; its hashable `key` identifies the filter, so the array is
+        computed once per manifest version.
+        """
+        return [chunk_id for chunk_id, _ in self.search_keys(query_terms, k, row_filter)]
+
+    def search_keys(self, query_terms: List[str], k: int,
+                    row_filter: Optional[RowFilter] = None) -> List[Tuple[str, Optional[str]]]:
+        """Like `search`, as (chunk ID, paper ID) pairs; chunk IDs are only unique per paper."""
+        view = self._current_view()
+        if not view.live_count:
+            return []
+        allowed, count = None, view.live_count
+        if row_filter is not None:
+            allowed = self._filter_rows(view, row_filter)
+            count = len(allowed.rows)
+            if not count:
+                return []
+        top_k = QUERY_STRATEGIES[self.query_strategy]
+        top = top_k(view.engines, view.offsets, query_terms, min(k, count), view.deleted, allowed).tolist()
+        return [self._row_key(view, row) for row in top]
+
+    @staticmethod
+    def _filter_rows(view: _View, row_filter: RowFilter) -> RowSet:
+        cached = view.masks.get(row_filter.key)
+        if cached is not None:
+            return cached
+        chunk_ids = [chunk_id for segment in view.segments for chunk_id in segment.chunk_ids]
+        paper_ids = [paper_id for segment in view.segments for paper_id in segment.paper_ids]
+        mask = np.array(row_filter(chunk_ids, paper_ids), dtype=bool)
+        mask[view.deleted] = False
+        # Racing searches may both compute it; either result is the same
+        if len(view.masks) >= MAX_FILTER_MASKS:
+            view.masks.pop(next(iter(view.masks)), None)
+        view.masks[row_filter.key] = cached = RowSet.from_mask(mask)
+        return cached
+
+    @staticmethod
+    def _row_key(view: _View, row: int) -> Tuple[str, Optional[str]]:
+        index = int(np.searchsorted(view.offsets, row, side='right')) - 1
+        segment, row = view.segments[index], row - int(view.offsets[index])
+        return segment.chunk_ids[row], segment.paper_ids[row]
+
+    def _live_rows(self):
+        view = self._current_view()
+        deleted = set(view.deleted.tolist())
+        for index, segment in enumerate(view.segments):
+            start = int(view.offsets[index])
+            for row in range(segment.postings.doc_count):
+                if start + row not in deleted:
+                    yield segment, row
+
+    def chunk_ids(self) -> List[str]:
+        return [segment.chunk_ids[row] for segment, row in self._live_rows()]
+
+    def paper_ids(self) -> List[Optional[str]]:
+        return [segment.paper_ids[row] for segment, row in self._live_rows()]
+
+    @property
+    def idf(self) -> Dict[str, float]:
+        view = self._current_view()
+        if view.stats is None:
+            return {}
+        idf = {}
+        for segment, values, doc_freq in zip(view.segments, view.stats.idf, view.stats.doc_freq):
+            for term, value, df in zip(segment.postings.terms, values.tolist(), doc_freq.tolist()):
+                if df:
+                    idf[term] = value
+        return idf
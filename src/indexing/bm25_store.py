@@ -0,0 +1,189 @@
+"""Memory-mapped on-disk formats for BM25 segments and corpus statistics.
+
+Every file uses the same container, laid out like the chunk store (all
+integers little-endian):
+
+    MAGIC (8 bytes) | format version (u32) | reserved (u32) | header length (u64)
+    header (UTF-8 JSON) | padding to 8 bytes | arrays
+
+The header describes each array (dtype, byte offset, size) plus
+file-specific fields. A segment holds one batch of documents: the sorted
+vocabulary and the chunk IDs as UTF-8 blobs with u64 offsets, the CSR
+postings (`indptr`, `doc_ids`, `term_freqs`, `slots`), `doc_len`, the
+block-max bounds (`block_*`), and u32 paper codes into the header's paper
+list. A stats file holds the corpus-wide
+idf of every segment's vocabulary for one manifest generation.
+
+Reading maps the file read-only and wraps the arrays without copying, so
+opening costs a header parse regardless of corpus size and the pages are
+shared by every process that maps the same file. Files are written to a
+temporary name and renamed into place, so readers that still map an older
+file keep a consistent view of it. No pickles are involved; loading an
+index never executes code from the file.
+"""
+
+import json
+import mmap
+import os
+import struct
+from collections.abc import Sequence as SequenceABC
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from indexing.bm25_engine import CorpusStats, PostingBlocks, Postings, StringArray
+
+MAGIC = b"FMLBM25\x00"
+FORMAT_VERSION = 1
+MISSING = np.iinfo(np.uint32).max
+
+_PREAMBLE = struct.Struct("<8sIIQ")
+_ALIGN = 8
+
+
+def _pad(size: int) -> int:
+    return -size % _ALIGN
+
+
+class PaperIdArray(SequenceABC):
+    """Per-chunk paper IDs stored as u32 codes into a short list of values."""
+
+    def __init__(self, codes: np.ndarray, values: List[Optional[str]]):
+        self.codes = codes
+        self.values = values
+
+    @classmethod
+    def from_ids(cls, paper_ids: Sequence[Optional[str]]) -> 'PaperIdArray':
+        lookup: Dict[str, int] = {}
+        codes = np.empty(len(paper_ids), dtype="<u4")
+        for row, paper_id in enumerate(paper_ids):
+            codes[row] = MISSING if paper_id is None else lookup.setdefault(paper_id, len(lookup))
+        return cls(codes, list(lookup))
+
+    def rows_of(self, paper_ids) -> np.ndarray:
+        """Boolean mask of the rows belonging to any of `paper_ids`."""
+        codes = [code for code, value in enumerate(self.values) if value in paper_ids]
+        return np.isin(self.codes, codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        code = int(self.codes[index])
+        return None if code == MISSING else self.values[code]
+
+
+def write_arrays(path, header: Dict, arrays: Dict[str, np.ndarray]) -> None:
+    """Write `arrays` plus JSON `header` fields to `path` atomically."""
+    entries, data, offset = {}, [], 0
+    for name, array in arrays.items():
+        # Stored little-endian so files move between machines
+        array = np.ascontiguousarray(array, dtype=np.asarray(array).dtype.newbyteorder("<"))
+        entries[name] = {"dtype": array.dtype.str, "offset": offset, "nbytes": array.nbytes}
+        data.append(array)
+        offset += array.nbytes + _pad(array.nbytes)
+    encoded = json.dumps({**header, "arrays": entries}).encode("utf-8")
+
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(encoded)))
+        f.write(encoded)
+        f.write(b"\x00" * _pad(_PREAMBLE.size + len(encoded)))
+        for array in data:
+            f.write(array.tobytes())
+            f.write(b"\x00" * _pad(array.nbytes))
+    os.replace(tmp_path, path)
+
+
+def read_arrays(path) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """Map `path` read-only; returns its header and zero-copy views of its arrays."""
+    path = Path(path)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, header_len = _PREAMBLE.unpack_from(mm, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a BM25 index file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path}: unsupported BM25 index version {version}")
+    header = json.loads(mm[_PREAMBLE.size:_PREAMBLE.size + header_len])
+    data_start = _PREAMBLE.size + header_len + _pad(_PREAMBLE.size + header_len)
+
+    # The views keep the map alive for as long as they are referenced
+    arrays = {}
+    for name, entry in header.pop("arrays").items():
+        dtype = np.dtype(entry["dtype"])
+        arrays[name] = np.frombuffer(mm, dtype=dtype, count=entry["nbytes"] // dtype.itemsize,
+                                     offset=data_start + entry["offset"])
+    return header, arrays
+
+
+def write_segment(path, postings: Postings, chunk_ids: Sequence[str], paper_ids: Sequence[Optional[str]]) -> None:
+    chunk_id_array = chunk_ids if isinstance(chunk_ids, StringArray) else StringArray.from_strings(chunk_ids)
+    paper_id_array = paper_ids if isinstance(paper_ids, PaperIdArray) else PaperIdArray.from_ids(paper_ids)
+    blocks = postings.blocks
+    write_arrays(path, {"kind": "segment", "documents": postings.doc_count, "papers": paper_id_array.values}, {
+        "term_offsets": postings.terms.offsets,
+        "term_blob": postings.terms.blob,
+        "indptr": postings.indptr,
+        "doc_ids": postings.doc_ids,
+        "term_freqs": postings.term_freqs,
+        "slots": postings.slots,
+        "doc_len": postings.doc_len,
+        "block_term_ptr": blocks.term_ptr,
+        "block_offsets": blocks.offsets,
+        "block_max_tf": blocks.max_tf,
+        "block_min_len": blocks.min_len,
+        "chunk_id_offsets": chunk_id_array.offsets,
+        "chunk_id_blob": chunk_id_array.blob,
+        "paper_codes": paper_id_array.codes,
+    })
+
+
+def read_segment(path) -> Tuple[Postings, StringArray, PaperIdArray]:
+    """Returns (postings, chunk_ids, paper_ids) backed by the mapped file.
+
+    Single-file indexes written before segments existed have the same
+    arrays (plus precomputed weights, which are ignored) and load as one
+    segment. Files without block bounds get them computed on first use.
+    """
+    header, arrays = read_arrays(path)
+    blocks = None
+    if "block_offsets" in arrays:
+        blocks = PostingBlocks(arrays["block_term_ptr"], arrays["block_offsets"],
+                               arrays["block_max_tf"], arrays["block_min_len"])
+    postings = Postings(StringArray(arrays["term_offsets"], arrays["term_blob"]), arrays["indptr"],
+                        arrays["doc_ids"], arrays["term_freqs"], arrays["slots"], arrays["doc_len"], blocks)
+    chunk_ids = StringArray(arrays["chunk_id_offsets"], arrays["chunk_id_blob"])
+    return postings, chunk_ids, PaperIdArray(arrays["paper_codes"], header["papers"])
+
+
+def write_stats(path, generation: int, segments: List[str], stats: CorpusStats) -> None:
+    offsets = np.zeros(len(stats.idf) + 1, dtype="<u8")
+    np.cumsum([len(idf) for idf in stats.idf], out=offsets[1:])
+    write_arrays(path, {
+        "kind": "stats",
+        "generation": generation,
+        "segments": segments,
+        "corpus_size": stats.corpus_size,
+        "avgdl": stats.avgdl,
+    }, {
+        "offsets": offsets,
+        "idf": np.concatenate(stats.idf) if stats.idf else np.zeros(0),
+        "doc_freq": np.concatenate(stats.doc_freq) if stats.doc_freq else np.zeros(0, dtype=np.int64),
+    })
+
+
+def read_stats(path) -> Tuple[Dict, CorpusStats]:
+    """Returns (header, stats); the header names the generation and segments it was computed for."""
+    header, arrays = read_arrays(path)
+    bounds = arrays["offsets"].tolist()
+    spans = list(zip(bounds[:-1], bounds[1:]))
+    stats = CorpusStats(header["corpus_size"], header["avgdl"],
+                        [arrays["idf"][start:end] for start, end in spans],
+                        [arrays["doc_freq"][start:end] for start, end in spans])
+    return header, stats
@@ -0,0 +1,428 @@
+"""Columnar, memory-mapped store for processed chunks.
+
+Layout of a store file (all integers little-endian):
+
+    MAGIC (8 bytes) | format version (u32) | reserved (u32) | header length (u64)
+    header (UTF-8 JSON) | padding to 8 bytes | column data
+
+The header lists each column's kind, byte offset and size, plus paper-level
+metadata. Columns are:
+
+* ``blob``  - concatenated UTF-8 values with a u64 offsets array (text, chunk_id)
+* ``int64`` - one integer per chunk (e.g. token_count, page_start)
+* ``dict``  - u32 codes into a value list kept in the header (section titles,
+  paper IDs, ...); ``MISSING`` marks chunks without the field
+
+A u32 ``id_order`` column holds row numbers sorted by (chunk_id, paper_id), so
+lookups by chunk ID are a binary search over the mapped file and only the
+matching row is decoded.
+"""
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+MAGIC = b"FMLCHNK\x00"
+FORMAT_VERSION = 1
+MISSING = np.iinfo(np.uint32).max
+
+_PREAMBLE = struct.Struct("<8sIIQ")
+_BLOB_FIELDS = ("text", "chunk_id")
+_ALIGN = 8
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def _pad(size: int) -> int:
+    return -size % _ALIGN
+
+
+class _SpilledColumn:
+    """One field's values, written to a scratch file as the chunks stream past.
+
+    Blob fields keep their bytes and running offsets; every other field is
+    dictionary-encoded, and becomes an int64 column at the end if all its
+    values turned out to be integers.
+    """
+
+    def __init__(self, directory: Path, number: int, name: str, rows_before: int):
+        self.blob = name in _BLOB_FIELDS
+        self.rows = 0
+        self.data = open(directory / f"{number}.data", "w+b")
+        if self.blob:
+            self.size = 0
+            self.offsets = open(directory / f"{number}.offsets", "w+b")
+            self.offsets.write(struct.pack("<Q", 0))
+        else:
+            self.lookup: Dict = {}
+            self.dictionary: list = []
+            self.all_int = True
+        self.pad(rows_before)
+
+    def append(self, value) -> None:
+        self.rows += 1
+        if self.blob:
+            encoded = ("" if value is None else str(value)).encode("utf-8")
+            self.data.write(encoded)
+            self.size += len(encoded)
+            self.offsets.write(struct.pack("<Q", self.size))
+            return
+        if value is None:
+            self.all_int = False
+            self.data.write(struct.pack("<I", MISSING))
+            return
+        self.all_int = self.all_int and _is_int(value)
+        key = (type(value), value) if isinstance(value, (str, int, float)) else json.dumps(value, sort_keys=True)
+        if key not in self.lookup:
+            self.lookup[key] = len(self.dictionary)
+            self.dictionary.append(value)
+        self.data.write(struct.pack("<I", self.lookup[key]))
+
+    def pad(self, rows: int) -> None:
+        while self.rows < rows:
+            self.append(None)
+
+    def codes(self) -> np.ndarray:
+        self.data.flush()
+        return np.fromfile(self.data.name, dtype="<u4")
+
+    def close(self) -> None:
+        self.data.close()
+        if self.blob:
+            self.offsets.close()
+
+
+def _sortable_ids(column: _SpilledColumn, count: int) -> np.ndarray:
+    """A blob column's values as fixed-width bytes, which sort as the strings do."""
+    column.offsets.flush()
+    column.data.flush()
+    offsets = np.fromfile(column.offsets.name, dtype="<u8").astype(np.int64)
+    data = np.fromfile(column.data.name, dtype=np.uint8)
+    lengths = np.diff(offsets)
+    width = max(1, int(lengths.max(initial=0)))
+    padded = np.zeros((count, width), dtype=np.uint8)
+    rows = np.repeat(np.arange(count), lengths)
+    padded[rows, np.arange(len(data)) - np.repeat(offsets[:-1], lengths)] = data
+    return padded.view(f"S{width}").ravel()
+
+
+def write_chunk_store(path, chunks: Iterable[Dict], papers: Optional[Dict[str, Dict]] = None) -> None:
+    """Write `chunks` (dicts as produced by HierarchicalChunker) to `path` atomically.
+
+    Columns are spilled to scratch files as the chunks are read, so memory
+    does not grow with the number of chunks (beyond one code per chunk for
+    the final ID sort).
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=path.parent, prefix=f".{path.name}.") as scratch:
+        fields: Dict[str, _SpilledColumn] = {}
+        try:
+            _write_spilled(path, chunks, papers, Path(scratch), fields)
+        finally:
+            for column in fields.values():
+                column.close()
+
+
+def _write_spilled(path: Path, chunks: Iterable[Dict], papers: Optional[Dict[str, Dict]], scratch: Path,
+                   fields: Dict[str, "_SpilledColumn"]) -> None:
+    layout: List[str] = []
+    metadata_keys: List[str] = []
+    count = 0
+
+    def append(name: str, value) -> None:
+        if name not in fields:
+            fields[name] = _SpilledColumn(scratch, len(fields), name, count)
+        fields[name].append(value)
+
+    for chunk in chunks:
+        for key, value in chunk.items():
+            if key not in layout:
+                layout.append(key)
+            if key != "metadata":
+                append(key, value)
+                continue
+            for meta_key, meta_value in value.items():
+                if meta_key not in metadata_keys:
+                    metadata_keys.append(meta_key)
+                append(f"metadata.{meta_key}", meta_value)
+        count += 1
+        for column in fields.values():
+            column.pad(count)
+
+    for name in _BLOB_FIELDS:
+        if name not in fields:
+            fields[name] = _SpilledColumn(scratch, len(fields), name, count)
+
+    # Arrays in file order: scratch file paths, or small arrays built here
+    columns, parts = {}, []
+    offset = 0
+
+    def add_part(part, nbytes: int) -> Dict:
+        nonlocal offset
+        entry = {"offset": offset, "nbytes": nbytes}
+        parts.append(part)
+        offset += nbytes + _pad(nbytes)
+        return entry
+
+    for name, column in fields.items():
+        if column.blob:
+            column.offsets.flush()
+            column.data.flush()
+            columns[name] = {
+                "kind": "blob",
+                "offsets": add_part(column.offsets.name, (count + 1) * 8),
+                "data": add_part(column.data.name, column.size),
+            }
+        elif column.all_int:
+            data = np.asarray(column.dictionary, dtype="<i8")[column.codes()] if count else np.zeros(0, dtype="<i8")
+            columns[name] = {"kind": "int64", "data": add_part(data, data.nbytes)}
+        else:
+            column.data.flush()
+            columns[name] = {"kind": "dict", "values": column.dictionary,
+                             "data": add_part(column.data.name, count * 4)}
+
+    chunk_ids = _sortable_ids(fields["chunk_id"], count)
+    paper_ranks = np.zeros(count, dtype=np.int64)
+    if "metadata.paper_id" in fields:
+        paper_column = fields["metadata.paper_id"]
+        names = [str(value or "") for value in paper_column.dictionary] + [""]
+        ranks = np.argsort(np.argsort(np.array(names, dtype=object), kind="stable"), kind="stable")
+        codes = paper_column.codes().astype(np.int64)
+        paper_ranks = ranks[np.where(codes == MISSING, len(names) - 1, codes)]
+    order = np.lexsort((paper_ranks, chunk_ids)).astype("<u4")
+    columns["id_order"] = {"kind": "index", "data": add_part(order, order.nbytes)}
+
+    header = json.dumps({
+        "count": count,
+        "unique_ids": len(np.unique(chunk_ids)),
+        "layout": layout,
+        "metadata_keys": metadata_keys,
+        "papers": papers or {},
+        "columns": columns,
+    }).encode("utf-8")
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, 0, len(header)))
+        f.write(header)
+        f.write(b"\x00" * _pad(_PREAMBLE.size + len(header)))
+        for part in parts:
+            if isinstance(part, np.ndarray):
+                f.write(part.tobytes())
+                nbytes = part.nbytes
+            else:
+                with open(part, "rb") as source:
+                    shutil.copyfileobj(source, f)
+                nbytes = os.path.getsize(part)
+            f.write(b"\x00" * _pad(nbytes))
+    os.replace(tmp_path, path)
+
+
+class ChunkStore(Mapping):
+    """Read-only view of a chunk store file, keyed by chunk ID.
+
+    Chunk IDs are only unique per paper; plain lookups return the row of the
+    lowest paper ID, and `get_row(chunk_id, paper_id)` picks a specific one.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, header_len = _PREAMBLE.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a chunk store")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"{self.path}: unsupported chunk store version {version}")
+        header = json.loads(self._mm[_PREAMBLE.size:_PREAMBLE.size + header_len])
+        data_start = _PREAMBLE.size + header_len + _pad(_PREAMBLE.size + header_len)
+
+        self.count: int = header["count"]
+        self.papers: Dict[str, Dict] = header["papers"]
+        self._unique_ids = header["unique_ids"]
+        self._layout = header["layout"]
+        self._metadata_keys = header["metadata_keys"]
+        self._columns = {}
+        dtypes = {"int64": "<i8", "dict": "<u4", "index": "<u4"}
+        for name, column in header["columns"].items():
+            if column["kind"] == "blob":
+                offsets = self._view(data_start, column["offsets"], "<u8")
+                self._columns[name] = ("blob", offsets, data_start + column["data"]["offset"])
+            else:
+                data = self._view(data_start, column["data"], dtypes[column["kind"]])
+                self._columns[name] = (column["kind"], data, column.get("values"))
+        self._order = self._columns.pop("id_order")[1]
+        self._decoded: Dict[str, np.ndarray] = {}
+        self._row_index: Optional[Dict[tuple, int]] = None
+
+    def _view(self, data_start: int, entry: Dict, dtype: str) -> np.ndarray:
+        size = np.dtype(dtype).itemsize
+        return np.frombuffer(self._mm, dtype=dtype, count=entry["nbytes"] // size,
+                             offset=data_start + entry["offset"])
+
+    def close(self) -> None:
+        # Views must go before the map can be closed
+        self._columns = {}
+        self._decoded = {}
+        self._order = None
+        self._mm.close()
+
+    def __enter__(self) -> "ChunkStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _blob(self, name: str, row: int) -> bytes:
+        _, offsets, start = self._columns[name]
+        return self._mm[start + int(offsets[row]):start + int(offsets[row + 1])]
+
+    def _value(self, name: str, row: int):
+        kind, data, values = self._columns[name]
+        if kind == "blob":
+            return self._blob(name, row).decode("utf-8")
+        if kind == "int64":
+            return int(data[row])
+        code = int(data[row])
+        return None if code == MISSING else values[code]
+
+    def text(self, row: int) -> str:
+        return self._blob("text", row).decode("utf-8")
+
+    def _paper_id(self, row: int) -> str:
+        if "metadata.paper_id" not in self._columns:
+            return ""
+        return self._value("metadata.paper_id", row) or ""
+
+    def _first_position(self, chunk_id: bytes) -> int:
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._blob("chunk_id", int(self._order[mid])) < chunk_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get_row(self, chunk_id: str, paper_id: Optional[str] = None) -> Optional[int]:
+        key = chunk_id.encode("utf-8")
+        position = self._first_position(key)
+        while position < self.count:
+            row = int(self._order[position])
+            if self._blob("chunk_id", row) != key:
+                break
+            if paper_id is None or self._paper_id(row) == paper_id:
+                return row
+            position += 1
+        return None
+
+    def chunk(self, row: int) -> Dict:
+        chunk = {}
+        for key in self._layout:
+            if key == "metadata":
+                chunk["metadata"] = {}
+                for meta_key in self._metadata_keys:
+                    value = self._value(f"metadata.{meta_key}", row)
+                    if value is not None:
+                        chunk["metadata"][meta_key] = value
+                continue
+            value = self._value(key, row)
+            if value is not None:
+                chunk[key] = value
+        return chunk
+
+    def column(self, field: str) -> np.ndarray:
+        """A metadata field (or top-level field) of every chunk as an object array, None where missing."""
+        if field not in self._decoded:
+            name = f"metadata.{field}" if f"metadata.{field}" in self._columns else field
+            values = np.empty(self.count, dtype=object)
+            if name in self._columns:
+                kind, data, dictionary = self._columns[name]
+                if kind == "dict":
+                    lookup = np.empty(len(dictionary) + 1, dtype=object)
+                    for code, value in enumerate(dictionary):
+                        lookup[code] = value
+                    values[:] = lookup[np.where(data == MISSING, len(dictionary), data)]
+                elif kind == "int64":
+                    values[:] = data.tolist()
+                else:
+                    values[:] = [self._value(name, row) for row in range(self.count)]
+            self._decoded[field] = values
+        return self._decoded[field]
+
+    def rows_of(self, chunk_ids: Iterable[str], paper_ids: Iterable[Optional[str]]) -> np.ndarray:
+        """Row of each (chunk ID, paper ID) pair, -1 for chunks not in the store."""
+        if self._row_index is None:
+            self._row_index = {
+                (self._blob("chunk_id", row).decode("utf-8"), self._paper_id(row)): row
+                for row in range(self.count)
+            }
+        return np.fromiter((self._row_index.get((chunk_id, paper_id or ""), -1)
+                            for chunk_id, paper_id in zip(chunk_ids, paper_ids)), dtype=np.int64)
+
+    def iter_chunks(self) -> Iterator[Dict]:
+        for row in range(self.count):
+            yield self.chunk(row)
+
+    def __getitem__(self, chunk_id: str) -> Dict:
+        row = self.get_row(chunk_id)
+        if row is None:
+            raise KeyError(chunk_id)
+        return self.chunk(row)
+
+    def __contains__(self, chunk_id) -> bool:
+        return isinstance(chunk_id, str) and self.get_row(chunk_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        previous = None
+        for position in range(self.count):
+            chunk_id = self._blob("chunk_id", int(self._order[position]))
+            if chunk_id != previous:
+                yield chunk_id.decode("utf-8")
+            previous = chunk_id
+
+    def __len__(self) -> int:
+        return self._unique_ids
+
+
+def merge_chunk_stores(paths: Iterable, out_path) -> None:
+    """Concatenate per-paper stores into a single corpus store.
+
+    Only one store is open at a time, so the number of papers is not
+    bounded by the open-file limit.
+    """
+    paths = list(paths)
+    papers = {}
+    for path in paths:
+        with ChunkStore(path) as store:
+            papers.update(store.papers)
+
+    def chunks():
+        for path in paths:
+            with ChunkStore(path) as store:
+                yield from store.iter_chunks()
+
+    write_chunk_store(out_path, chunks(), papers)
+
+
+def convert_json_paper(json_path, out_path) -> int:
+    """Convert a legacy processed-paper JSON file; returns the number of chunks."""
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    chunks = data.get("chunks", [])
+    paper_id = Path(json_path).stem
+    for chunk in chunks:
+        chunk.setdefault("metadata", {}).setdefault("paper_id", paper_id)
+    write_chunk_store(out_path, chunks, {paper_id: data.get("metadata", {})})
+    return len(chunks)
@@ -0,0 +1,69 @@
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+
+# SQLite's default limit on bound parameters per statement is 999
+_LOOKUP_BATCH = 500
+
+
+class EmbeddingCache:
+    """SQLite store of embeddings keyed by (model name, SHA-256 of the text).
+
+    Vectors are stored as little-endian float32 blobs. Entries never go
+    stale: a changed text hashes to a new key, and a different model is a
+    different key. Re-ingesting unchanged chunks therefore never
+    recomputes their embeddings.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Ingestion and API threads may share a store; sqlite3 calls are serialized here
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, text_sha256 BLOB NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, text_sha256))"
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    @staticmethod
+    def text_key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def get_many(self, model: str, keys: Iterable[bytes]) -> Dict[bytes, np.ndarray]:
+        keys = list(keys)
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_BATCH):
+                batch = keys[start:start + _LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    "SELECT text_sha256, dim, vector FROM embeddings"
+                    f" WHERE model = ? AND text_sha256 IN ({','.join('?' * len(batch))})",
+                    [model, *batch],
+                ).fetchall()
+                for key, dim, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype="<f4", count=dim)
+        return found
+
+    def put_many(self, model: str, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        rows = []
+        for key, vector in items:
+            vector = np.asarray(vector, dtype="<f4")
+            rows.append((model, key, len(vector), vector.tobytes()))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_sha256, dim, vector) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def count(self, model: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
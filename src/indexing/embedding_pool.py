@@ -0,0 +1,100 @@
+"""Bulk encoding sharded across worker processes.
+
+Each worker loads the model once, with its thread count pinned so that
+the workers together use the machine's cores without oversubscribing
+them. Texts are handed out in shards of `batch_size`; a worker writes its
+shard's vectors straight into a shared-memory matrix at the shard's rows,
+so results come back in input order without pickling arrays.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from typing import Callable, List, Optional
+
+import numpy as np
+
+# Environment read by BLAS / OpenMP runtimes when they start
+_THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+_encode = None
+
+
+def load_generator(settings: dict, threads: int) -> Callable[[List[str]], np.ndarray]:
+    """Default worker encoder: an uncached EmbeddingsGenerator built from `settings`."""
+    from indexing.embeddings_generator import EmbeddingsGenerator
+
+    generator = EmbeddingsGenerator(use_cache=False, threads=threads, workers=1, **settings)
+    # Loaded here, once per worker, rather than inside the first shard
+    generator.model
+    return generator._encode
+
+
+def _init_worker(load_encoder: Callable, threads: int) -> None:
+    global _encode
+    for name in _THREAD_VARIABLES:
+        os.environ[name] = str(threads)
+    # Each worker is already one of many; tokenizers must not start its own pool
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _encode = load_encoder(threads)
+
+
+def _encode_shard(shm_name: str, shape: tuple, start: int, texts: List[str]) -> int:
+    vectors = _encode(texts)
+    # Spawned workers share the parent's resource tracker, so attaching here
+    # does not hand the block's cleanup to this process
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        np.ndarray(shape, dtype=np.float32, buffer=shm.buf)[start:start + len(texts)] = vectors
+    finally:
+        shm.close()
+    return start
+
+
+def _dimension() -> int:
+    return int(np.asarray(_encode(["dimension"])).shape[1])
+
+
+class EmbeddingPool:
+    def __init__(self, load_encoder: Callable[[int], Callable], workers: int, threads: int = 0, batch_size: int = 32):
+        """`load_encoder(threads)` runs once in each worker and returns its `encode(texts)` function.
+
+        It is pickled to the workers, so it has to be a module-level function
+        (or a `functools.partial` of one).
+        """
+        self.workers = workers
+        self.batch_size = batch_size
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        # Spawned, not forked: a forked copy of a process that already started
+        # torch or ONNX Runtime threads can deadlock
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(load_encoder, self.threads))
+        self.dimension = self._executor.submit(_dimension).result()
+
+    def encode(self, texts: List[str], done: Optional[Callable[[int, np.ndarray], None]] = None) -> np.ndarray:
+        """Vectors for `texts`, in order; `done(start, vectors)` is called as each shard completes."""
+        shape = (len(texts), self.dimension)
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(texts) * self.dimension * 4))
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        try:
+            futures = [self._executor.submit(_encode_shard, shm.name, shape, start, texts[start:start + self.batch_size])
+                       for start in range(0, len(texts), self.batch_size)]
+            try:
+                for future in as_completed(futures):
+                    start = future.result()
+                    if done is not None:
+                        done(start, out[start:start + self.batch_size])
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            return out.copy()
+        finally:
+            # The view has to go before the block can be closed
+            del out
+            shm.close()
+            shm.unlink()
+
+    def close(self) -> None:
+        self._executor.shutdown()
@@ -1,14 +1,143 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from functools import partial
+from typing import Dict, List
 import numpy as np
 from config import config
+from indexing import onnx_encoder
+from indexing.embedding_cache import EmbeddingCache
+from indexing.query_embedding_cache import QueryEmbeddingCache
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+
+def embedding_model_id(model_name: str, backend: str, onnx_quantize: bool) -> str:
+    """Names the vectors a model produces: int8 ONNX weights give (slightly) different ones."""
+    if backend == "onnx" and onnx_quantize:
+        return f"{model_name}@onnx-int8"
+    return model_name
+
 
 class EmbeddingsGenerator:
-    def __init__(self, model_name=None):
-        self.model = SentenceTransformer(model_name or config.embedding_model_name)
+    """Embeds texts with `embeddings.model_name`, batched and cached on disk.
+
+    The model is loaded on first use, so runs where every text is already
+    cached never load it. Query embeddings go through an in-process LRU
+    instead (`embed_query`), since the same questions are asked repeatedly.
+
+    `backend` is "torch" (sentence-transformers) or "onnx", which runs an
+    ONNX export of the same model under ONNX Runtime (see `onnx_encoder`),
+    optionally with int8 weights. With `workers` > 1, large batches of
+    uncached texts are sharded across a pool of processes
+    (`embedding_pool`) instead of being encoded in this one.
+    """
+
+    def __init__(self, model_name=None, batch_size=None, cache_path=None, use_cache=True, query_cache=None,
+                 backend=None, onnx_quantize=None, threads=None, workers=None):
+        self._model = None
+        self.backend = backend or config.embedding_backend
+        if self.backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"unknown embedding backend {self.backend!r}; "
+                             f"expected one of {', '.join(EMBEDDING_BACKENDS)}")
+        self.onnx_quantize = config.embedding_onnx_quantize if onnx_quantize is None else onnx_quantize
+        self.threads = config.embedding_threads if threads is None else threads
+        self.workers = workers or config.embedding_workers
+        self._pool = None
+        self.model_name = model_name or config.embedding_model_name
+        self.batch_size = batch_size or config.embedding_batch_size
+        self.cache = EmbeddingCache(cache_path or config.embedding_cache_path) if use_cache else None
+        if query_cache is None:
+            query_cache = QueryEmbeddingCache(config.query_embedding_cache_entries, config.query_embedding_cache_bytes)
+        self.query_cache = query_cache
+
+    @property
+    def model_name(self) -> str:
+        return self._model_name
+
+    @model_name.setter
+    def model_name(self, name: str) -> None:
+        # Cached query vectors are keyed by model id, so they are dropped on the next lookup
+        self._model_name = name
+        self._model = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
+
+    @property
+    def model_id(self) -> str:
+        return embedding_model_id(self.model_name, self.backend, self.onnx_quantize)
+
+    def _load_model(self):
+        if self.backend == "onnx":
+            return onnx_encoder.OnnxEncoder(self._export_onnx(), quantized=self.onnx_quantize, threads=self.threads)
+        from sentence_transformers import SentenceTransformer
+        if self.threads:
+            import torch
+            torch.set_num_threads(self.threads)
+        return SentenceTransformer(self.model_name)
+
+    def _export_onnx(self):
+        target = onnx_encoder.export_dir(config.onnx_export_path, self.model_name)
+        return onnx_encoder.export_model(self.model_name, target, quantize=self.onnx_quantize)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from indexing.embedding_pool import EmbeddingPool, load_generator
+            if self.backend == "onnx":
+                # Exported once here, so the workers do not race to write it
+                self._export_onnx()
+            settings = {'model_name': self.model_name, 'batch_size': self.batch_size, 'backend': self.backend,
+                        'onnx_quantize': self.onnx_quantize}
+            self._pool = EmbeddingPool(partial(load_generator, settings), self.workers, self.threads, self.batch_size)
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
 
     def generate_embeddings(self, texts: List[str]) -> np.ndarray:
-        return self.model.encode(texts, normalize_embeddings=True)
+        """Normalized float32 embeddings, one row per text, in order."""
+        keys = [EmbeddingCache.text_key(text) for text in texts]
+        vectors: Dict[bytes, np.ndarray] = self.cache.get_many(self.model_id, set(keys)) if self.cache else {}
+        pending = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        # Longest first, so the texts in a batch pad to similar lengths
+        ordered = sorted(pending, key=lambda key: len(pending[key]), reverse=True)
+        if self.workers > 1 and len(ordered) > self.batch_size:
+            self._encode_in_pool(ordered, pending, vectors)
+            ordered = []
+        for start in range(0, len(ordered), self.batch_size):
+            batch = ordered[start:start + self.batch_size]
+            embedded = self._encode([pending[key] for key in batch])
+            vectors.update(zip(batch, embedded))
+            if self.cache:
+                # Written per batch, so an interrupted run keeps what it computed
+                self.cache.put_many(self.model_id, zip(batch, embedded))
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys]).astype(np.float32, copy=False)
+
+    def _encode_in_pool(self, ordered: List[bytes], pending: Dict[bytes, str], vectors: Dict[bytes, np.ndarray]) -> None:
+        def done(start, embedded):
+            # Cached per shard, like the batches encoded in this process
+            if self.cache:
+                self.cache.put_many(self.model_id, zip(ordered[start:start + len(embedded)], embedded))
+
+        embedded = self.pool.encode([pending[key] for key in ordered], done)
+        vectors.update(zip(ordered, embedded))
 
     def generate_single_embedding(self, text: str) -> np.ndarray:
-        return self.model.encode([text], normalize_embeddings=True)[0]
\ No newline at end of file
+        return self._encode([text])[0]
+
+    def embed_query(self, query: str) -> np.ndarray:
+        vector = self.query_cache.get(self.model_id, query)
+        if vector is None:
+            vector = self.generate_single_embedding(query)
+            self.query_cache.put(self.model_id, query, vector)
+        return vector
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=len(texts), normalize_embeddings=True,
+                                            convert_to_numpy=True), dtype=np.float32)
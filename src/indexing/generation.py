@@ -0,0 +1,33 @@
+"""Index generation marker.
+
+Ingestion bumps a counter in `<data_dir>/index_generation` after it has
+committed new index contents; long-running readers compare it with the
+generation they loaded and reopen their indexes when it moves.
+"""
+
+import os
+from pathlib import Path
+from config import config
+
+GENERATION_FILE = "index_generation"
+
+
+def generation_path() -> Path:
+    return Path(config.data_dir) / GENERATION_FILE
+
+
+def read_generation(path=None) -> int:
+    try:
+        return int(Path(path or generation_path()).read_text().strip() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def bump_generation(path=None) -> int:
+    path = Path(path or generation_path())
+    generation = read_generation(path) + 1
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(f"{generation}\n")
+    os.replace(tmp_path, path)
+    return generation
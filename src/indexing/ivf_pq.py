@@ -0,0 +1,194 @@
+"""IVF-PQ: an inverted file over k-means cells with product-quantized residuals.
+
+For corpora of millions of chunks, where an HNSW graph over float32
+vectors (Chroma) or even int8 codes no longer fit comfortably in memory:
+
+- Coarse quantizer: spherical k-means splits the vectors into `nlist`
+  cells. A query only visits the `nprobe` cells whose centroids are
+  closest to it.
+- Product quantization: a vector's residual from its cell centroid is cut
+  into `m` subvectors, and each is replaced by the index of the nearest of
+  256 codewords trained for that subspace. A vector costs `m` bytes (48
+  for 384 dimensions, against 1,536 as float32) plus a 4-byte row ID.
+  Residuals are first turned by a fixed random rotation. Embedding
+  variance is concentrated in a few dimensions, and the rotation spreads
+  it evenly over the subspaces so that no codebook is overloaded.
+- A query scores a cell's vectors as `q . centroid + sum_j lut[j, code_j]`,
+  where `lut[j]` holds the query's dot products with subspace j's
+  codewords. The table is computed once per query, and the query itself is
+  not quantized (asymmetric distance).
+
+Callers rescore the best candidates against the float32 vectors, as
+`vector_quantization` does, so the final ranking uses exact similarities.
+
+Vectors are expected to be L2-normalized, as `EmbeddingsGenerator`
+returns them, so dot products are cosine similarities.
+"""
+
+import math
+import os
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from indexing.bm25_engine import top_k_indices
+
+CODEWORDS = 256
+KMEANS_ITERATIONS = 10
+# Training vectors sampled per cell
+TRAIN_POINTS_PER_CELL = 40
+# Residuals each PQ codebook is trained on
+PQ_TRAIN_POINTS = 64 * 256
+# Rows assigned or encoded per matrix multiply
+_BLOCK_ROWS = 16384
+
+
+class IvfPqParams(NamedTuple):
+    centroids: np.ndarray  # float32 (nlist, dim), unit length
+    rotation: np.ndarray  # float32 (dim, dim), orthogonal
+    codebooks: np.ndarray  # float32 (m, 256, dim // m), for rotated residuals
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def subquantizers(self) -> int:
+        return len(self.codebooks)
+
+
+def default_nlist(rows: int) -> int:
+    """About 4 * sqrt(rows) cells, the usual starting point for IVF indexes."""
+    return max(1, int(4 * math.sqrt(rows)))
+
+
+def nearest(data: np.ndarray, centroids: np.ndarray, spherical: bool = False) -> np.ndarray:
+    """Index of each row's closest centroid: by dot product if `spherical`, else by L2 distance."""
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, and |x|^2 does not change the argmin
+    offsets = None if spherical else -0.5 * np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), _BLOCK_ROWS):
+        scores = np.asarray(data[start:start + _BLOCK_ROWS], dtype=np.float32) @ centroids.T
+        if offsets is not None:
+            scores += offsets
+        labels[start:start + len(scores)] = scores.argmax(axis=1)
+    return labels
+
+
+def kmeans(data: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, spherical: bool = False,
+           seed: int = 0) -> np.ndarray:
+    """`k` centroids of `data` by Lloyd's algorithm; unit-length ones if `spherical`."""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=len(data) < k)].astype(np.float32)
+    for _ in range(iterations):
+        labels = nearest(data, centroids, spherical)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        sums = np.add.reduceat(data[np.argsort(labels, kind='stable')], starts, axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        # Empty cells restart from random points
+        centroids[~filled] = data[rng.choice(len(data), int((~filled).sum()))]
+        if spherical:
+            centroids /= np.clip(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12, None)
+    return centroids
+
+
+def train(vectors: np.ndarray, nlist: int, subquantizers: int, rows: Optional[np.ndarray] = None,
+          seed: int = 0) -> IvfPqParams:
+    """Coarse centroids and PQ codebooks from a sample of `vectors` (of `rows`, if given)."""
+    dim = vectors.shape[1]
+    if dim % subquantizers:
+        raise ValueError(f"{dim} dimensions do not split into {subquantizers} subquantizers")
+    rows = np.arange(len(vectors)) if rows is None else rows
+    nlist = min(nlist, len(rows))
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(rows), max(TRAIN_POINTS_PER_CELL * nlist, PQ_TRAIN_POINTS))
+    # Sorted, so a memory-mapped matrix is read front to back
+    sample = np.asarray(vectors[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+
+    centroids = kmeans(sample, nlist, spherical=True, seed=seed)
+    rotation = np.linalg.qr(rng.standard_normal((dim, dim)))[0].astype(np.float32)
+    sample = sample[rng.permutation(len(sample))[:PQ_TRAIN_POINTS]]
+    residuals = (sample - centroids[nearest(sample, centroids, spherical=True)]) @ rotation
+    width = dim // subquantizers
+    codebooks = np.stack([kmeans(np.ascontiguousarray(residuals[:, j * width:(j + 1) * width]), CODEWORDS, seed=seed)
+                          for j in range(subquantizers)])
+    return IvfPqParams(centroids, rotation, codebooks)
+
+
+def encode(params: IvfPqParams, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Each row's cell (int32) and PQ codes (uint8, one per subquantizer)."""
+    m, _, width = params.codebooks.shape
+    codeword_offsets = -0.5 * np.einsum('jcd,jcd->jc', params.codebooks, params.codebooks)
+    lists = np.empty(len(vectors), dtype=np.int32)
+    codes = np.empty((len(vectors), m), dtype=np.uint8)
+    for start in range(0, len(vectors), _BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _BLOCK_ROWS], dtype=np.float32)
+        cells = nearest(block, params.centroids, spherical=True)
+        residuals = (block - params.centroids[cells]) @ params.rotation
+        lists[start:start + len(block)] = cells
+        for j in range(m):
+            scores = residuals[:, j * width:(j + 1) * width] @ params.codebooks[j].T + codeword_offsets[j]
+            codes[start:start + len(block), j] = scores.argmax(axis=1)
+    return lists, codes
+
+
+class IvfPqIndex:
+    """Rows grouped by cell, with their codes, ready to search."""
+
+    def __init__(self, params: IvfPqParams, lists: np.ndarray, codes: np.ndarray):
+        self.params = params
+        order = np.argsort(lists, kind='stable')
+        self.rows = order.astype(np.int32)
+        self.codes = codes[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=params.nlist))])
+        # Index into a flattened lookup table: subquantizer j's codeword c is at j * 256 + c
+        self._code_base = (np.arange(params.subquantizers) * CODEWORDS).astype(np.int32)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes + self.codes.nbytes + sum(array.nbytes for array in self.params)
+
+    def search(self, query: np.ndarray, k: int, nprobe: int,
+               live: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Rows and approximate scores of the k best rows in the `nprobe` closest cells, best first.
+
+        Rows where `live` is False are never returned.
+        """
+        query = np.asarray(query, dtype=np.float32)
+        coarse = self.params.centroids @ query
+        cells = top_k_indices(coarse, nprobe)
+        starts, ends = self.offsets[cells], self.offsets[cells + 1]
+        positions = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+        rows = self.rows[positions]
+        if live is not None:
+            keep = live[rows]
+            positions, rows = positions[keep], rows[keep]
+            cell_scores = np.repeat(coarse[cells], ends - starts)[keep]
+        else:
+            cell_scores = np.repeat(coarse[cells], ends - starts)
+        m, _, width = self.params.codebooks.shape
+        # q . r = (q R) . (r R) for the orthogonal rotation R
+        rotated = (query @ self.params.rotation).reshape(m, width)
+        lut = np.einsum('jd,jcd->jc', rotated, self.params.codebooks).ravel()
+        scores = cell_scores + lut[self.codes[positions] + self._code_base].sum(axis=1)
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+
+def save_params(path, params: IvfPqParams) -> None:
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **params._asdict())
+    os.replace(tmp_path, path)
+
+
+def load_params(path) -> IvfPqParams:
+    with np.load(path) as data:
+        return IvfPqParams(**{name: data[name] for name in IvfPqParams._fields})
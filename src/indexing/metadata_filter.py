@@ -0,0 +1,114 @@
+"""Chroma-style `where` filters evaluated over metadata columns with numpy.
+
+Supported: `{"field": value}`, `{"field": {"$op": value}}` with `$eq`, `$ne`,
+`$gt`, `$gte`, `$lt`, `$lte`, `$in`, `$nin`, and `{"$and": [...]}` /
+`{"$or": [...]}`. Several fields in one dict must all match. As in Chroma,
+a row without the field never matches, whatever the operator.
+
+`ChunkRowFilter` applies a filter to the BM25 index, matching its rows to
+chunks by (chunk ID, paper ID).
+"""
+
+import json
+import operator
+from typing import Callable, Dict, List, Mapping, Optional
+
+import numpy as np
+
+_COMPARISONS = {
+    "$eq": operator.eq,
+    "$ne": operator.ne,
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+_MEMBERSHIP = ("$in", "$nin")
+
+
+def filter_fields(where: Optional[Dict]) -> set:
+    """The metadata fields `where` refers to."""
+    fields = set()
+    for key, value in (where or {}).items():
+        if key in ("$and", "$or"):
+            for clause in value:
+                fields |= filter_fields(clause)
+        else:
+            fields.add(key)
+    return fields
+
+
+def filter_mask(where: Dict, column: Callable[[str], np.ndarray], size: int) -> np.ndarray:
+    """Rows matching `where`; `column(field)` returns the field as an object array (None where missing)."""
+    mask = np.ones(size, dtype=bool)
+    for key, value in where.items():
+        if key == "$and":
+            for clause in value:
+                mask &= filter_mask(clause, column, size)
+        elif key == "$or":
+            matched = np.zeros(size, dtype=bool)
+            for clause in value:
+                matched |= filter_mask(clause, column, size)
+            mask &= matched
+        elif key.startswith("$"):
+            raise ValueError(f"unknown filter operator {key!r}")
+        else:
+            mask &= _field_mask(column(key), value if isinstance(value, Mapping) else {"$eq": value})
+    return mask
+
+
+def _field_mask(values: np.ndarray, condition: Mapping) -> np.ndarray:
+    mask = np.array([value is not None for value in values], dtype=bool)
+    for op, operand in condition.items():
+        present = np.flatnonzero(mask)
+        if op in _MEMBERSHIP:
+            found = np.isin(values[present], np.array(list(operand), dtype=object))
+            keep = found if op == "$in" else ~found
+        elif op in _COMPARISONS:
+            compare = _COMPARISONS[op]
+            try:
+                keep = np.asarray(compare(values[present], operand), dtype=bool)
+            except TypeError:
+                # Mixed types in the column
+                keep = np.array([_comparable(value, operand) and compare(value, operand)
+                                 for value in values[present]], dtype=bool)
+        else:
+            raise ValueError(f"unknown filter operator {op!r}")
+        mask[present[~keep]] = False
+    return mask
+
+
+def _comparable(value, operand) -> bool:
+    # Numbers compare with numbers and strings with strings; anything else never matches
+    numbers = (int, float)
+    return (isinstance(value, numbers) and isinstance(operand, numbers)) or type(value) is type(operand)
+
+
+class ChunkRowFilter:
+    """`where` as a BM25 row filter (see `SegmentedIndex.search`) over chunk metadata.
+
+    `chunks` is a `ChunkStore`, whose columns are filtered whole, or a dict
+    of chunks by ID (processed papers written before the store existed).
+    Rows whose chunk is not found never match.
+    """
+
+    def __init__(self, where: Dict, chunks: Mapping[str, Dict]):
+        self.where = where
+        self.chunks = chunks
+        self.key = json.dumps(where, sort_keys=True)
+
+    def __call__(self, chunk_ids: List[str], paper_ids: List[Optional[str]]) -> np.ndarray:
+        if hasattr(self.chunks, "rows_of"):
+            if not self.chunks.count:
+                return np.zeros(len(chunk_ids), dtype=bool)
+            matched = filter_mask(self.where, self.chunks.column, self.chunks.count)
+            rows = self.chunks.rows_of(chunk_ids, paper_ids)
+            return (rows >= 0) & matched[rows]
+        metadata = [self.chunks[chunk_id]["metadata"] if chunk_id in self.chunks else {} for chunk_id in chunk_ids]
+
+        def column(field: str) -> np.ndarray:
+            values = np.empty(len(metadata), dtype=object)
+            values[:] = [meta.get(field) for meta in metadata]
+            return values
+
+        return filter_mask(self.where, column, len(metadata))
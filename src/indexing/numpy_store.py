@@ -0,0 +1,416 @@
+"""In-process vector store: normalized embeddings in a memory-mapped float32 matrix.
+
+A store is a directory:
+
+- `vectors.f32`: one float32 row per chunk, appended as chunks are added.
+- `rows.sqlite`: per row, the chunk's key, paper, text and metadata, and
+  whether it is live. Upserting a chunk or deleting its paper marks the
+  old row dead; dead rows are skipped at query time and dropped when the
+  store is rebuilt.
+- `codes.int8` + `scales.f32` or `codes.binary`: quantized copies of the
+  rows (`vector_quantization`), kept when `retrieval.vector_quantization`
+  is set.
+
+Searching is an exact dot product over the memory-mapped matrix in blocks,
+keeping the top k of each block with `argpartition`. With quantization,
+only the codes are scanned and the best candidates are rescored against
+the matrix. Metadata filters (Chroma `where` syntax, see
+`metadata_filter`) restrict the rows first, so a selective filter scores
+fewer rows.
+
+A store opened for queries sees the rows as of its last `reopen()`;
+ingestion only ever appends to the files, so readers are never disturbed.
+
+`IvfPqVectorStore` (backend `ivfpq`) is the same store searched through an
+IVF-PQ index (`ivf_pq`): `ivf_pq.npz` holds the trained centroids and
+codebooks, `ivf.lists` and `pq.codes` each row's cell and codes, and
+`ivf_pq.json` how many rows they cover. `optimize()` trains the index or
+encodes the rows added since; rows it does not cover yet are searched
+exactly.
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from config import config
+from indexing.bm25_engine import top_k_indices
+from indexing.ivf_pq import IvfPqIndex, default_nlist, encode, load_params, save_params, train
+from indexing.metadata_filter import filter_mask
+from indexing.vector_quantization import QuantizedCodes, quantize, quantized_search
+from indexing.vector_store import VectorStore
+
+VECTORS_FILE = "vectors.f32"
+ROWS_FILE = "rows.sqlite"
+IVF_PARAMS_FILE = "ivf_pq.npz"
+IVF_LISTS_FILE = "ivf.lists"
+PQ_CODES_FILE = "pq.codes"
+# Written last: the number of rows the lists and codes cover, and the settings they were trained with
+IVF_META_FILE = "ivf_pq.json"
+# The index is retrained once the store has grown this many times over since training
+IVF_RETRAIN_GROWTH = 2
+# Rows scored per matrix multiply
+_SEARCH_BLOCK_ROWS = 65536
+# Below this share of live rows, a filter's rows are gathered and scored directly
+_GATHER_FRACTION = 0.25
+
+
+class _Snapshot:
+    """The rows visible to queries: a read-only view of the files at load time."""
+
+    def __init__(self, path: Path, quantization: Optional[str]):
+        self.conn = sqlite3.connect(str(path / ROWS_FILE), check_same_thread=False)
+        rows = self.conn.execute("SELECT live FROM rows ORDER BY row").fetchall()
+        self.size = len(rows)
+        self.live = np.array([live for live, in rows], dtype=bool)
+        dim = _read_dim(self.conn)
+        self.vectors = (np.memmap(path / VECTORS_FILE, dtype="<f4", mode="r", shape=(self.size, dim))
+                        if self.size else np.zeros((0, dim or 0), dtype=np.float32))
+        self.codes = _load_codes(path, quantization, self.vectors) if quantization and self.size else None
+        self.columns: Dict[str, np.ndarray] = {}
+        self.ivf: Optional[IvfPqIndex] = None
+        self.lock = threading.Lock()
+
+    def column(self, field: str) -> np.ndarray:
+        with self.lock:
+            if field not in self.columns:
+                values = np.empty(self.size, dtype=object)
+                for row, value in self.conn.execute(
+                        "SELECT row, json_extract(metadata, '$.' || ?) FROM rows", (field,)):
+                    if row < self.size:
+                        values[row] = value
+                self.columns[field] = values
+            return self.columns[field]
+
+    def fetch(self, rows: List[int]) -> Dict[int, tuple]:
+        with self.lock:
+            found = self.conn.execute(
+                f"SELECT row, text, metadata FROM rows WHERE row IN ({','.join('?' * len(rows))})", rows)
+            return {row: (text, json.loads(metadata)) for row, text, metadata in found}
+
+
+class NumpyVectorStore(VectorStore):
+    def __init__(self, path=None, collection_name=None, embedder=None, quantization=None):
+        super().__init__(embedder)
+        self.root = Path(path or config.numpy_store_path)
+        self._name = collection_name or "financial_ml_papers"
+        quantization = quantization if quantization is not None else config.vector_quantization
+        self.quantization = None if quantization == "none" else quantization
+        self._snapshot: Optional[_Snapshot] = None
+        self._lock = threading.Lock()
+        self._open()
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    @property
+    def path(self) -> Path:
+        return self.root / self._name
+
+    def _open(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / VECTORS_FILE).touch()
+        self._conn = sqlite3.connect(str(self.path / ROWS_FILE), check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " row INTEGER PRIMARY KEY, key TEXT NOT NULL, paper_id TEXT, text TEXT,"
+                " metadata TEXT NOT NULL, live INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS rows_key ON rows (key) WHERE live")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS rows_paper ON rows (paper_id) WHERE live")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def clear(self) -> None:
+        self._conn.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+        self._open()
+        self.reopen()
+
+    def reopen(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+    def save_snapshot(self, target: Path) -> None:
+        destination = Path(target) / self._name
+        shutil.copytree(self.path, destination, ignore=shutil.ignore_patterns(ROWS_FILE))
+        # Copied through SQLite so the file is consistent even with a connection open
+        copy = sqlite3.connect(str(destination / ROWS_FILE))
+        try:
+            self._conn.backup(copy)
+        finally:
+            copy.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._snapshot is not None:
+                self._snapshot.conn.close()
+            self._snapshot = None
+        self._conn.close()
+
+    def swap_in(self, staging_name: str) -> bool:
+        staging = self.root / staging_name
+        if not (staging / ROWS_FILE).exists():
+            return False
+        self._conn.close()
+        backup = self.root / f"{self._name}_previous"
+        shutil.rmtree(backup, ignore_errors=True)
+        self.path.rename(backup)
+        staging.rename(self.path)
+        shutil.rmtree(backup)
+        self._open()
+        self.reopen()
+        return True
+
+    def add_chunks(self, chunks: List[Dict]):
+        vectors = self.embedder.generate_embeddings([chunk['text'] for chunk in chunks])
+        with self._conn:
+            start = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+            dim = _read_dim(self._conn)
+            if dim is None:
+                dim = vectors.shape[1]
+                self._conn.execute("INSERT INTO meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            elif dim != vectors.shape[1]:
+                raise ValueError(f"embedding dimension {vectors.shape[1]} does not match the store's {dim}")
+            self._append(VECTORS_FILE, start * dim * 4, vectors.astype("<f4"))
+            if self.quantization:
+                self._append_codes(start, vectors)
+            # The last copy of a chunk within the batch wins, as with Chroma's upsert
+            keys = [self.chunk_key(chunk) for chunk in chunks]
+            latest = {key: offset for offset, key in enumerate(keys)}
+            self._conn.executemany("UPDATE rows SET live = 0 WHERE key = ? AND live", [(key,) for key in latest])
+            self._conn.executemany(
+                "INSERT INTO rows (row, key, paper_id, text, metadata, live) VALUES (?, ?, ?, ?, ?, ?)",
+                [(start + offset, key, chunk['metadata'].get('paper_id', ''), chunk['text'],
+                  json.dumps(self.chunk_metadata(chunk)), int(latest[key] == offset))
+                 for offset, (key, chunk) in enumerate(zip(keys, chunks))])
+
+    def delete_papers(self, paper_ids: Iterable[str]) -> None:
+        with self._conn:
+            self._conn.executemany("UPDATE rows SET live = 0 WHERE paper_id = ? AND live",
+                                   [(paper_id,) for paper_id in paper_ids])
+
+    def search(self, query: str, k: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        snapshot = self._load()
+        if k <= 0 or not snapshot.size:
+            return []
+        mask = snapshot.live
+        if where:
+            mask = mask & filter_mask(where, snapshot.column, snapshot.size)
+        rows, scores = self._top_k(snapshot, self.embedder.embed_query(query), k, mask)
+
+        found = snapshot.fetch(rows.tolist())
+        return [{
+            'text': found[row][0],
+            'metadata': found[row][1],
+            'distance': 1.0 - float(score),
+        } for row, score in zip(rows.tolist(), scores.tolist())]
+
+    def _top_k(self, snapshot: _Snapshot, query_vector: np.ndarray, k: int, mask: np.ndarray):
+        live = int(mask.sum())
+        if snapshot.codes is not None and live > k:
+            return quantized_search(snapshot.vectors, snapshot.codes, query_vector, k, live=mask)
+        if live < _GATHER_FRACTION * snapshot.size:
+            return _gathered_top_k(snapshot.vectors, query_vector, k, np.flatnonzero(mask))
+        return _exact_top_k(snapshot.vectors, query_vector, k, mask)
+
+    def get_stats(self) -> Dict:
+        snapshot = self._load()
+        return {
+            'total_chunks': int(snapshot.live.sum()),
+            'collection_name': self._name,
+            'dead_rows': int(snapshot.size - snapshot.live.sum()),
+            'quantization': self.quantization or 'none',
+            'in_memory_bytes': snapshot.codes.nbytes if snapshot.codes is not None else 0,
+            'query_cache': self.embedder.query_cache.stats(),
+        }
+
+    def _load(self) -> _Snapshot:
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self._read_snapshot()
+            return self._snapshot
+
+    def _read_snapshot(self) -> _Snapshot:
+        return _Snapshot(self.path, self.quantization)
+
+    def _append(self, name: str, offset: int, array: np.ndarray) -> None:
+        # Bytes past `offset` are left over from a batch that was never committed
+        with open(self.path / name, 'r+b' if (self.path / name).exists() else 'wb') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(array.tobytes())
+
+    def _append_codes(self, start: int, vectors: np.ndarray) -> None:
+        codes = quantize(vectors, self.quantization)
+        row_bytes = codes.codes.shape[1]
+        path = self.path / f"codes.{self.quantization}"
+        if not path.exists() or path.stat().st_size < start * row_bytes:
+            # Quantization was switched on (or changed) after rows were added
+            _write_codes(self.path, _load_codes(self.path, self.quantization, self._vectors(start)))
+        self._append(path.name, start * row_bytes, codes.codes)
+        if codes.scales is not None:
+            self._append("scales.f32", start * 4, codes.scales.astype("<f4"))
+
+    def _vectors(self, size: int) -> np.ndarray:
+        dim = _read_dim(self._conn)
+        if not size:
+            return np.zeros((0, dim), dtype=np.float32)
+        return np.memmap(self.path / VECTORS_FILE, dtype="<f4", mode="r", shape=(size, dim))
+
+
+def _gathered_top_k(vectors: np.ndarray, query: np.ndarray, k: int, rows: np.ndarray):
+    scores = np.asarray(vectors[rows]) @ query
+    best = top_k_indices(scores, k)
+    return rows[best], scores[best]
+
+
+def _exact_top_k(vectors: np.ndarray, query: np.ndarray, k: int, mask: np.ndarray):
+    rows, scores = [], []
+    for start in range(0, len(vectors), _SEARCH_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + _SEARCH_BLOCK_ROWS]) @ query
+        block[~mask[start:start + len(block)]] = -np.inf
+        best = top_k_indices(block, k)
+        rows.append(best + start)
+        scores.append(block[best])
+    rows, scores = np.concatenate(rows), np.concatenate(scores)
+    best = top_k_indices(scores, k)
+    best = best[np.isfinite(scores[best])]
+    return rows[best], scores[best]
+
+
+def _read_dim(conn: sqlite3.Connection) -> Optional[int]:
+    row = conn.execute("SELECT value FROM meta WHERE key = 'dim'").fetchone()
+    return int(row[0]) if row else None
+
+
+def _load_codes(path: Path, kind: str, vectors: np.ndarray) -> QuantizedCodes:
+    """The stored codes for the rows of `vectors`, or freshly quantized ones if they are missing."""
+    size, dim = vectors.shape
+    row_bytes = dim if kind == "int8" else (dim + 7) // 8
+    if not size:
+        return QuantizedCodes(kind, np.zeros((0, row_bytes), dtype=np.int8 if kind == "int8" else np.uint8),
+                              np.zeros(0, dtype=np.float32) if kind == "int8" else None)
+    codes_path, scales_path = path / f"codes.{kind}", path / "scales.f32"
+    stored = codes_path.exists() and codes_path.stat().st_size >= size * row_bytes
+    if stored and kind == "int8":
+        stored = scales_path.exists() and scales_path.stat().st_size >= size * 4
+    if not stored:
+        blocks = [quantize(vectors[start:start + _SEARCH_BLOCK_ROWS], kind)
+                  for start in range(0, size, _SEARCH_BLOCK_ROWS)]
+        return QuantizedCodes(kind, np.concatenate([block.codes for block in blocks]).reshape(size, row_bytes),
+                              np.concatenate([block.scales for block in blocks]) if kind == "int8" else None)
+    dtype = np.int8 if kind == "int8" else np.uint8
+    codes = np.fromfile(codes_path, dtype=dtype, count=size * row_bytes).reshape(size, row_bytes)
+    scales = np.fromfile(scales_path, dtype="<f4", count=size) if kind == "int8" else None
+    return QuantizedCodes(kind, codes, scales)
+
+
+def _write_codes(path: Path, codes: QuantizedCodes) -> None:
+    codes.codes.tofile(path / f"codes.{codes.kind}")
+    if codes.scales is not None:
+        codes.scales.astype("<f4").tofile(path / "scales.f32")
+
+
+class IvfPqVectorStore(NumpyVectorStore):
+    """`NumpyVectorStore` searched through an IVF-PQ index instead of scanning every vector.
+
+    Only the PQ codes are held in memory. The best `k * rescore_factor`
+    candidates from the `nprobe` closest cells are rescored against the
+    memory-mapped float32 vectors.
+    """
+
+    def __init__(self, path=None, collection_name=None, embedder=None, nprobe=None, rescore_factor=None):
+        super().__init__(path, collection_name, embedder, quantization="none")
+        self.nprobe = nprobe or config.ivf_nprobe
+        self.rescore_factor = config.ivf_rescore_factor if rescore_factor is None else rescore_factor
+
+    def optimize(self) -> None:
+        size = self._conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+        if not size:
+            return
+        meta = _read_ivf_meta(self.path)
+        live_rows = np.array([row for row, in self._conn.execute("SELECT row FROM rows WHERE live")], dtype=np.int64)
+        nlist = config.ivf_nlist or default_nlist(len(live_rows))
+        subquantizers = config.pq_subquantizers
+        retrain = (meta is None or meta['subquantizers'] != subquantizers
+                   or (config.ivf_nlist and meta['nlist'] != min(nlist, len(live_rows)))
+                   or len(live_rows) >= IVF_RETRAIN_GROWTH * meta['trained_rows'])
+        vectors = self._vectors(size)
+        if retrain:
+            if not len(live_rows):
+                return
+            # Readers fall back to exact search until the new index is complete
+            (self.path / IVF_META_FILE).unlink(missing_ok=True)
+            save_params(self.path / IVF_PARAMS_FILE, train(vectors, nlist, subquantizers, rows=live_rows))
+            meta = {'trained_rows': len(live_rows), 'rows': 0}
+        params = load_params(self.path / IVF_PARAMS_FILE)
+        start = meta['rows']
+        for block in range(start, size, _SEARCH_BLOCK_ROWS):
+            lists, codes = encode(params, vectors[block:block + _SEARCH_BLOCK_ROWS])
+            self._append(IVF_LISTS_FILE, block * 4, lists.astype("<i4"))
+            self._append(PQ_CODES_FILE, block * params.subquantizers, codes)
+        _write_ivf_meta(self.path, {**meta, 'nlist': params.nlist, 'subquantizers': params.subquantizers,
+                                    'rows': size})
+
+    def _read_snapshot(self) -> _Snapshot:
+        snapshot = super()._read_snapshot()
+        meta = _read_ivf_meta(self.path)
+        if meta is not None and snapshot.size:
+            params = load_params(self.path / IVF_PARAMS_FILE)
+            rows = min(meta['rows'], snapshot.size)
+            lists = np.fromfile(self.path / IVF_LISTS_FILE, dtype="<i4", count=rows)
+            codes = np.fromfile(self.path / PQ_CODES_FILE, dtype=np.uint8, count=rows * params.subquantizers)
+            snapshot.ivf = IvfPqIndex(params, lists, codes.reshape(rows, params.subquantizers))
+        return snapshot
+
+    def _top_k(self, snapshot: _Snapshot, query_vector: np.ndarray, k: int, mask: np.ndarray):
+        index = snapshot.ivf
+        if index is None or mask.sum() < _GATHER_FRACTION * snapshot.size:
+            # Not built yet, or a filter selective enough to score its rows directly
+            return super()._top_k(snapshot, query_vector, k, mask)
+        rows, scores = index.search(query_vector, k * max(1, self.rescore_factor), self.nprobe, live=mask)
+        # Rows added since the last optimize() are scored exactly
+        tail = len(index) + np.flatnonzero(mask[len(index):])
+        if len(tail):
+            rows = np.concatenate([rows, tail])
+            scores = np.concatenate([scores, np.asarray(snapshot.vectors[tail]) @ query_vector])
+        if self.rescore_factor:
+            return _gathered_top_k(snapshot.vectors, query_vector, k, np.sort(rows))
+        best = top_k_indices(scores, k)
+        return rows[best], scores[best]
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        index = self._load().ivf
+        stats.update({
+            'ivf_pq': None if index is None else {
+                'nlist': index.params.nlist,
+                'subquantizers': index.params.subquantizers,
+                'rows': len(index),
+                'nprobe': self.nprobe,
+                'rescore_factor': self.rescore_factor,
+            },
+            'in_memory_bytes': index.nbytes if index is not None else 0,
+        })
+        return stats
+
+
+def _read_ivf_meta(path: Path) -> Optional[Dict]:
+    try:
+        return json.loads((path / IVF_META_FILE).read_text())
+    except FileNotFoundError:
+        return None
+
+
+def _write_ivf_meta(path: Path, meta: Dict) -> None:
+    tmp_path = path / (IVF_META_FILE + ".tmp")
+    tmp_path.write_text(json.dumps(meta))
+    os.replace(tmp_path, path / IVF_META_FILE)
@@ -0,0 +1,131 @@
+"""Sentence embeddings under ONNX Runtime instead of PyTorch.
+
+`export_model` converts a sentence-transformers model once: the transformer
+is exported to ONNX (and, optionally, dynamically quantized to int8
+weights) next to its tokenizer and the pooling settings. Exporting needs
+torch, sentence-transformers and, for quantization, the `onnx` package.
+`OnnxEncoder` then only needs onnxruntime and tokenizers, and reproduces
+`SentenceTransformer.encode`: tokenize, run the transformer, pool, and
+normalize.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+EXPORT_FILE = "export.json"
+EXPORT_VERSION = 1
+POOLING_MODES = ("mean", "cls", "max")
+
+
+def export_dir(root, model_name: str) -> Path:
+    return Path(root) / re.sub(r"[^\w.-]+", "__", model_name)
+
+
+def export_model(model_name: str, target: Path, quantize: bool = False) -> Path:
+    """Export `model_name` to `target` unless an export is already there; returns `target`."""
+    target = Path(target)
+    info_path = target / EXPORT_FILE
+    if info_path.exists():
+        info = json.loads(info_path.read_text())
+        if info.get("version") == EXPORT_VERSION and info["model_name"] == model_name:
+            if quantize and not (target / "model.int8.onnx").exists():
+                _quantize(target)
+            return target
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer, pooling = st[0].auto_model, st[1]
+    if pooling.pooling_mode_cls_token:
+        mode = "cls"
+    elif pooling.pooling_mode_max_tokens:
+        mode = "max"
+    else:
+        mode = "mean"
+    target.mkdir(parents=True, exist_ok=True)
+    st.tokenizer.save_pretrained(str(target))
+
+    sample = st.tokenizer(["an example sentence"], return_tensors="pt")
+    names = list(sample.keys())
+    axes = {name: {0: "batch", 1: "tokens"} for name in names}
+    transformer.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer, (sample["input_ids"], {name: sample[name] for name in names if name != "input_ids"}),
+            str(target / "model.onnx"), input_names=names, output_names=["token_embeddings"],
+            dynamic_axes={**axes, "token_embeddings": {0: "batch", 1: "tokens"}}, opset_version=14,
+        )
+    if quantize:
+        _quantize(target)
+    # Written last: a directory without it is an interrupted export and is redone
+    info_path.write_text(json.dumps({
+        "version": EXPORT_VERSION,
+        "model_name": model_name,
+        "pooling": mode,
+        "max_seq_length": st.max_seq_length,
+    }, indent=2))
+    return target
+
+
+def _quantize(target: Path) -> None:
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(target / "model.onnx"), str(target / "model.int8.onnx"), weight_type=QuantType.QInt8)
+
+
+def pool(token_embeddings: np.ndarray, attention_mask: np.ndarray, mode: str) -> np.ndarray:
+    """Sentence vectors from token vectors, ignoring padding, as sentence-transformers' Pooling does."""
+    mask = attention_mask[..., None].astype(token_embeddings.dtype)
+    if mode == "cls":
+        return token_embeddings[:, 0]
+    if mode == "max":
+        return np.where(mask > 0, token_embeddings, -1e9).max(axis=1)
+    if mode == "mean":
+        return (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+    raise ValueError(f"unknown pooling mode {mode!r}; expected one of {', '.join(POOLING_MODES)}")
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+class OnnxEncoder:
+    """Drop-in for `SentenceTransformer.encode` over an exported model."""
+
+    def __init__(self, path, quantized: bool = False, threads: int = 0):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        path = Path(path)
+        info = json.loads((path / EXPORT_FILE).read_text())
+        self.pooling = info["pooling"]
+        self.tokenizer = Tokenizer.from_file(str(path / "tokenizer.json"))
+        self.tokenizer.enable_truncation(info["max_seq_length"])
+        self.tokenizer.enable_padding()
+        options = onnxruntime.SessionOptions()
+        # 0 lets ONNX Runtime use every core
+        options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            str(path / ("model.int8.onnx" if quantized else "model.onnx")), options,
+            providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            encodings = self.tokenizer.encode_batch(texts[start:start + batch_size])
+            inputs = {
+                "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+                "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+                "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+            }
+            token_embeddings = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+            vectors = pool(token_embeddings, inputs["attention_mask"], self.pooling)
+            batches.append(normalize(vectors) if normalize_embeddings else vectors)
+        return np.concatenate(batches).astype(np.float32) if batches else np.zeros((0, 0), dtype=np.float32)
@@ -0,0 +1,83 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+import numpy as np
+
+
+class QueryEmbeddingCache:
+    """In-process LRU of query embeddings, bounded by entry count and bytes.
+
+    Entries belong to one model: a lookup or insert for a different model
+    empties the cache first, so a model change can never serve stale vectors.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.model: Optional[str] = None
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._bytes = 0
+        # Shared by concurrent API requests
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: str, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            self._switch_model(model)
+            vector = self._entries.get(query)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(query)
+            self.hits += 1
+            return vector
+
+    def put(self, model: str, query: str, vector: np.ndarray) -> None:
+        vector = np.array(vector, dtype=np.float32)
+        # Callers get the cached array back; keep them from changing it
+        vector.setflags(write=False)
+        size = vector.nbytes + len(query)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._switch_model(model)
+            previous = self._entries.pop(query, None)
+            if previous is not None:
+                self._bytes -= previous.nbytes + len(query)
+            self._entries[query] = vector
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes + len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            'model': self.model,
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+    def _switch_model(self, model: str) -> None:
+        if model == self.model:
+            return
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self._bytes = 0
+        self.model = model
@@ -0,0 +1,166 @@
+"""Versioned, immutable index snapshots.
+
+Ingestion keeps updating its working indexes in place. After each run that
+changes them it publishes a snapshot: a directory under `snapshot_path`
+holding a copy of the vector store, the BM25 index and the chunk store,
+plus `snapshot.json` describing them. Files that are never rewritten in
+place (BM25 segments and stats, the chunk store) are hard-linked, so a
+snapshot costs about one copy of the vector store.
+
+`CURRENT` names the snapshot searchers should serve. It is replaced with a
+rename, so moving it to a new build or back to an older one is atomic, and
+running searchers switch over when they see it change (see
+`retrieval.hybrid_search`).
+"""
+
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import List, NamedTuple, Optional
+
+from config import config
+from indexing.chunk_store import ChunkStore
+
+SNAPSHOT_FILE = "snapshot.json"
+CURRENT_FILE = "CURRENT"
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotInfo(NamedTuple):
+    version: str
+    path: Path
+    created_at: float
+    generation: int
+    vector_backend: str
+    collection_name: str
+    embedding_model: str
+    chunks: int
+
+    def as_dict(self) -> dict:
+        return {**self._asdict(), 'path': str(self.path)}
+
+
+def snapshots_root(root=None) -> Path:
+    return Path(root or config.snapshot_path)
+
+
+def _version_number(version: str) -> int:
+    return int(version[1:])
+
+
+def read_snapshot(version: str, root=None) -> SnapshotInfo:
+    path = snapshots_root(root) / version
+    try:
+        data = json.loads((path / SNAPSHOT_FILE).read_text())
+    except (FileNotFoundError, NotADirectoryError):
+        raise ValueError(f"unknown snapshot {version!r}") from None
+    if data.get('format') != SNAPSHOT_VERSION:
+        raise ValueError(f"{path}: unsupported snapshot format {data.get('format')}")
+    return SnapshotInfo(version, path, data['created_at'], data['generation'], data['vector_backend'],
+                        data['collection_name'], data['embedding_model'], data['chunks'])
+
+
+def list_snapshots(root=None) -> List[SnapshotInfo]:
+    """Complete snapshots, oldest first."""
+    root = snapshots_root(root)
+    if not root.exists():
+        return []
+    versions = sorted((p.name for p in root.iterdir() if p.name.startswith('v') and p.name[1:].isdigit()),
+                      key=_version_number)
+    return [read_snapshot(version, root) for version in versions if (root / version / SNAPSHOT_FILE).exists()]
+
+
+def current_version(root=None) -> Optional[str]:
+    try:
+        return (snapshots_root(root) / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def set_current(version: str, root=None) -> SnapshotInfo:
+    """Point `CURRENT` at `version` (which must exist)."""
+    info = read_snapshot(version, root)
+    path = snapshots_root(root) / CURRENT_FILE
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(f"{version}\n")
+    os.replace(tmp_path, path)
+    return info
+
+
+def previous_version(version: Optional[str] = None, root=None) -> Optional[str]:
+    """The newest snapshot older than `version` (default: the current one)."""
+    version = version or current_version(root)
+    if version is None:
+        return None
+    older = [info.version for info in list_snapshots(root) if _version_number(info.version) < _version_number(version)]
+    return older[-1] if older else None
+
+
+def _link(source: Path, target: Path) -> None:
+    """Hard-link `source` (a file, or every file under a directory) to `target`.
+
+    Only for files that are replaced rather than modified in place. Falls
+    back to copying where links are not possible (another filesystem).
+    """
+    if source.is_dir():
+        target.mkdir(parents=True, exist_ok=True)
+        for path in source.iterdir():
+            _link(path, target / path.name)
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def publish_snapshot(vector_store, bm25_path, chunk_store_path, generation: int, embedding_model: str,
+                     keep: Optional[int] = None, root=None) -> SnapshotInfo:
+    """Copy the working indexes into a new snapshot, make it current and prune old ones.
+
+    Ingestion must have finished writing (including BM25 merges).
+    """
+    root = snapshots_root(root)
+    root.mkdir(parents=True, exist_ok=True)
+    existing = [int(p.name[1:]) for p in root.iterdir() if p.name.startswith('v') and p.name[1:].isdigit()]
+    version = f"v{max(existing, default=0) + 1:06d}"
+    # Built under a hidden name and renamed, so a listed snapshot is always complete
+    staging = root / f".{version}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+
+    vector_store.save_snapshot(staging / "vectors")
+    _link(Path(bm25_path), staging / "bm25")
+    chunks = 0
+    if Path(chunk_store_path).exists():
+        _link(Path(chunk_store_path), staging / "corpus.chunks")
+        with ChunkStore(staging / "corpus.chunks") as store:
+            chunks = store.count
+    (staging / SNAPSHOT_FILE).write_text(json.dumps({
+        'format': SNAPSHOT_VERSION,
+        'created_at': time.time(),
+        'generation': generation,
+        'vector_backend': config.vector_backend,
+        'collection_name': vector_store.name,
+        'embedding_model': embedding_model,
+        'chunks': chunks,
+    }, indent=2))
+    staging.rename(root / version)
+
+    info = set_current(version, root)
+    prune_snapshots(config.snapshots_keep if keep is None else keep, root)
+    return info
+
+
+def prune_snapshots(keep: int, root=None) -> List[str]:
+    """Delete all but the `keep` newest snapshots, never the current one; returns the deleted versions."""
+    current = current_version(root)
+    snapshots = list_snapshots(root)
+    removed = []
+    for info in snapshots[:max(0, len(snapshots) - keep)]:
+        if info.version == current:
+            continue
+        shutil.rmtree(info.path, ignore_errors=True)
+        removed.append(info.version)
+    return removed
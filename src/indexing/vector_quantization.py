@@ -0,0 +1,92 @@
+"""Quantized embeddings for candidate generation, rescored at full precision.
+
+Only the compact codes are held in memory; the float32 vectors stay on
+disk (memory-mapped) and are read just for the few candidates being
+rescored, so the final ranking uses exact cosine similarities.
+
+- `int8`: each vector scaled by its largest absolute component into
+  [-127, 127]. A quarter of the float32 size; approximate scores are
+  close enough that 4x over-fetching recovers nearly all of the top k.
+- `binary`: one sign bit per dimension, compared by Hamming distance.
+  1/32 of the float32 size, but much coarser, so it needs a larger
+  rescoring pool.
+
+Vectors are expected to be L2-normalized, as `EmbeddingsGenerator`
+returns them, so dot products are cosine similarities.
+"""
+
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from indexing.bm25_engine import top_k_indices
+
+QUANTIZATIONS = ("int8", "binary")
+# Candidates rescored per requested result
+DEFAULT_RESCORE_FACTOR = {"int8": 4, "binary": 16}
+# Rows scored per step; the float32 copy of a block of int8 codes stays in cache
+_SCORE_BLOCK_ROWS = 1024
+# Set bits per byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class QuantizedCodes(NamedTuple):
+    kind: str
+    codes: np.ndarray  # int8 (n, dim), or uint8 (n, ceil(dim / 8)) packed sign bits
+    scales: Optional[np.ndarray]  # float32 (n,) for int8, None for binary
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    @property
+    def nbytes(self) -> int:
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+
+def quantize(vectors: np.ndarray, kind: str) -> QuantizedCodes:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if kind == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127 if len(vectors) else np.zeros(0, dtype=np.float32)
+        scales = np.where(scales > 0, scales, 1).astype(np.float32)
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return QuantizedCodes(kind, codes, scales)
+    if kind == "binary":
+        return QuantizedCodes(kind, np.packbits(vectors > 0, axis=1), None)
+    raise ValueError(f"unknown quantization {kind!r}; expected one of {', '.join(QUANTIZATIONS)}")
+
+
+def approximate_scores(codes: QuantizedCodes, query: np.ndarray) -> np.ndarray:
+    """A score per row that ranks rows roughly as their dot product with `query` does."""
+    query = np.asarray(query, dtype=np.float32)
+    scores = np.empty(len(codes), dtype=np.float32)
+    if codes.kind == "binary":
+        bits = np.packbits(query > 0)
+    for start in range(0, len(codes), _SCORE_BLOCK_ROWS):
+        block = codes.codes[start:start + _SCORE_BLOCK_ROWS]
+        if codes.kind == "int8":
+            scores[start:start + len(block)] = (block.astype(np.float32) @ query) * codes.scales[start:start + len(block)]
+        else:
+            scores[start:start + len(block)] = -_POPCOUNT[block ^ bits].sum(axis=1, dtype=np.int32)
+    return scores
+
+
+def quantized_search(vectors: np.ndarray, codes: QuantizedCodes, query: np.ndarray, k: int,
+                     live: Optional[np.ndarray] = None,
+                     rescore_factor: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows and exact scores of the (approximately) k best rows, best first.
+
+    `vectors` is the float32 matrix the codes were made from, normally a
+    memmap; only the rescored candidates are read from it. Rows where
+    `live` is False are never returned.
+    """
+    approx = approximate_scores(codes, query)
+    if live is not None:
+        approx[~live] = -np.inf
+    pool = k * (rescore_factor or DEFAULT_RESCORE_FACTOR[codes.kind])
+    candidates = np.sort(top_k_indices(approx, pool))
+    if live is not None:
+        candidates = candidates[live[candidates]]
+    # Ascending rows, so the memmap is read front to back
+    exact = np.asarray(vectors[candidates], dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+    best = top_k_indices(exact, k)
+    return candidates[best], exact[best]
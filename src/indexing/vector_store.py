@@ -1,19 +1,131 @@
 import chromadb
-from typing import List, Dict
-import uuid
+from abc import ABC, abstractmethod
+from pathlib import Path
+from chromadb.api.client import SharedSystemClient
+from typing import Dict, Iterable, List, Optional
 from config import config
+from indexing.embeddings_generator import EmbeddingsGenerator
 
-class ChromaDBStore:
-    def __init__(self, path=None, collection_name=None):
-        self.client = chromadb.PersistentClient(path=path or config.chroma_db_path)
+VECTOR_BACKENDS = ("chroma", "numpy", "ivfpq")
+# Chunks read from the live collection and written to a snapshot per call
+SNAPSHOT_PAGE_SIZE = 1000
+
+
+class VectorStore(ABC):
+    """Semantic index of chunks, keyed by `chunk_key`.
+
+    Stores embed chunks and queries with the shared `EmbeddingsGenerator`.
+    `search` returns dicts with `text`, `metadata` and cosine `distance`,
+    best first; `where` is a metadata filter in Chroma's syntax.
+    """
+
+    def __init__(self, embedder=None):
+        self._embedder = embedder
+
+    @property
+    def embedder(self) -> EmbeddingsGenerator:
+        if self._embedder is None:
+            self._embedder = EmbeddingsGenerator()
+        return self._embedder
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """The collection name; staging collections for rebuilds are named after it."""
+
+    @abstractmethod
+    def add_chunks(self, chunks: List[Dict]):
+        """Insert or replace chunks."""
+
+    @abstractmethod
+    def delete_papers(self, paper_ids: Iterable[str]) -> None:
+        """Remove every chunk of these papers."""
+
+    @abstractmethod
+    def search(self, query: str, k: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        """The k chunks closest to `query`."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Remove all entries from the collection."""
+
+    @abstractmethod
+    def reopen(self) -> None:
+        """Pick up writes made by another process."""
+
+    @abstractmethod
+    def swap_in(self, staging_name: str) -> bool:
+        """Replace this collection with the `staging_name` one; False if there is none."""
+
+    @abstractmethod
+    def get_stats(self) -> Dict:
+        """At least `total_chunks` and `collection_name`."""
+
+    @abstractmethod
+    def save_snapshot(self, target: Path) -> None:
+        """Copy the store to `target`, where `create_vector_store(path=target)` opens it.
+
+        Writes must have finished; the copy is never written to again.
+        """
+
+    def close(self) -> None:
+        """Release files and memory held for searching."""
+
+    def optimize(self) -> None:
+        """Bring search structures derived from the stored vectors up to date after a batch of writes."""
+
+    @staticmethod
+    def chunk_key(chunk: Dict) -> str:
+        """Deterministic collection ID so re-ingesting a paper overwrites its chunks."""
+        paper_id = chunk['metadata'].get('paper_id')
+        return f"{paper_id}:{chunk['chunk_id']}" if paper_id else chunk['chunk_id']
+
+    @staticmethod
+    def chunk_metadata(chunk: Dict) -> Dict:
+        metadata = {
+            'chunk_id': chunk['chunk_id'],
+            'paper_title': chunk['metadata']['paper_title'],
+            'section': chunk['metadata']['section'],
+            'page_start': chunk['metadata'].get('page_start', 1),
+            'paper_id': chunk['metadata'].get('paper_id', '')
+        }
+        # Chroma metadata cannot hold None; papers without a year have no field
+        if chunk['metadata'].get('year') is not None:
+            metadata['year'] = chunk['metadata']['year']
+        return metadata
+
+
+def create_vector_store(collection_name=None, backend=None, embedder=None, path=None) -> VectorStore:
+    """The store selected by `retrieval.vector_backend`, under its configured path unless `path` is given."""
+    backend = backend or config.vector_backend
+    if backend == "chroma":
+        return ChromaDBStore(path=path, collection_name=collection_name, embedder=embedder)
+    if backend == "numpy":
+        from indexing.numpy_store import NumpyVectorStore
+        return NumpyVectorStore(path=path, collection_name=collection_name, embedder=embedder)
+    if backend == "ivfpq":
+        from indexing.numpy_store import IvfPqVectorStore
+        return IvfPqVectorStore(path=path, collection_name=collection_name, embedder=embedder)
+    raise ValueError(f"unknown vector backend {backend!r}; expected one of {', '.join(VECTOR_BACKENDS)}")
+
+
+class ChromaDBStore(VectorStore):
+    def __init__(self, path=None, collection_name=None, embedder=None):
+        # Vectors are computed by the embedder and passed to Chroma, so the
+        # configured model is used instead of Chroma's default embedding function
+        super().__init__(embedder)
+        self.path = str(path or config.chroma_db_path)
+        self.client = chromadb.PersistentClient(path=self.path)
         self.collection = self.client.get_or_create_collection(
             name=collection_name or "financial_ml_papers",
             metadata={"hnsw:space": "cosine"}
         )
 
+    @property
+    def name(self) -> str:
+        return self.collection.name
 
     def clear(self) -> None:
-        """Remove all entries from the collection."""
         try:
             self.client.delete_collection(self.collection.name)
         except Exception:
@@ -23,6 +135,40 @@ class ChromaDBStore:
             metadata=self.collection.metadata or {"hnsw:space": "cosine"}
         )
 
+    def reopen(self) -> None:
+        """Reconnect so that writes made by another process become visible.
+
+        Chroma shares one client system per path and keeps collection
+        segments in memory, so the cached system has to be dropped first.
+        """
+        SharedSystemClient.clear_system_cache()
+        self.client = chromadb.PersistentClient(path=self.path)
+        self.collection = self.client.get_or_create_collection(
+            name=self.collection.name,
+            metadata={"hnsw:space": "cosine"}
+        )
+
+    def swap_in(self, staging_name: str) -> bool:
+        """Replace this collection with the `staging_name` collection by renaming.
+
+        The live name always refers to a populated collection except for the
+        instant between the two renames. Returns False if there is no staging
+        collection to promote.
+        """
+        names = {getattr(c, 'name', c) for c in self.client.list_collections()}
+        if staging_name not in names:
+            return False
+        live_name = self.collection.name
+        backup_name = f"{live_name}_previous"
+        if backup_name in names:
+            self.client.delete_collection(backup_name)
+        self.collection.modify(name=backup_name)
+        staging = self.client.get_collection(staging_name)
+        staging.modify(name=live_name)
+        self.client.delete_collection(backup_name)
+        self.collection = self.client.get_collection(live_name)
+        return True
+
     def add_chunks(self, chunks: List[Dict]):
         documents = []
         metadatas = []
@@ -30,24 +176,25 @@ class ChromaDBStore:
 
         for chunk in chunks:
             documents.append(chunk['text'])
-            metadatas.append({
-                'chunk_id': chunk['chunk_id'],
-                'paper_title': chunk['metadata']['paper_title'],
-                'section': chunk['metadata']['section'],
-                'page_start': chunk['metadata'].get('page_start', 1)
-            })
-            ids.append(str(uuid.uuid4()))
+            metadatas.append(self.chunk_metadata(chunk))
+            ids.append(self.chunk_key(chunk))
 
-        self.collection.add(
+        self.collection.upsert(
             documents=documents,
+            embeddings=self.embedder.generate_embeddings(documents).tolist(),
             metadatas=metadatas,
             ids=ids
         )
 
-    def search(self, query: str, k: int = 10) -> List[Dict]:
+    def delete_papers(self, paper_ids: Iterable[str]) -> None:
+        for paper_id in paper_ids:
+            self.collection.delete(where={'paper_id': paper_id})
+
+    def search(self, query: str, k: int = 10, where: Optional[Dict] = None) -> List[Dict]:
         results = self.collection.query(
-            query_texts=[query],
-            n_results=k
+            query_embeddings=[self.embedder.embed_query(query).tolist()],
+            n_results=k,
+            where=where or None
         )
 
         chunks = []
@@ -63,5 +210,41 @@ class ChromaDBStore:
     def get_stats(self) -> Dict:
         return {
             'total_chunks': self.collection.count(),
-            'collection_name': self.collection.name
-        }
\ No newline at end of file
+            'collection_name': self.collection.name,
+            'query_cache': self.embedder.query_cache.stats()
+        }
+
+    def save_snapshot(self, target: Path) -> None:
+        """Export the live collection into a new client directory at `target`.
+
+        Copying the persist directory while this client holds its SQLite file
+        open can catch it mid-write, and would also carry the staging and
+        previous collections of a rebuild. Reading the collection back through
+        Chroma, a page at a time, gives a consistent copy of just the live one.
+        """
+        client = chromadb.PersistentClient(path=str(target))
+        try:
+            copy = client.create_collection(
+                name=self.collection.name,
+                metadata=self.collection.metadata or {"hnsw:space": "cosine"}
+            )
+            page_size = min(SNAPSHOT_PAGE_SIZE, client.get_max_batch_size())
+            offset = 0
+            while True:
+                page = self.collection.get(include=["embeddings", "documents", "metadatas"],
+                                           limit=page_size, offset=offset)
+                if not page['ids']:
+                    break
+                copy.add(ids=page['ids'], embeddings=page['embeddings'],
+                         documents=page['documents'], metadatas=page['metadatas'])
+                offset += len(page['ids'])
+        finally:
+            close = getattr(client, "close", None)
+            if close is not None:
+                close()
+
+    def close(self) -> None:
+        # Client.close() stops the shared system once no client uses it (Chroma >= 1.0)
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            close()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import json
+import sqlite3
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class IngestionCheckpoint:
+    """SQLite work queue that lets an interrupted ingestion run resume.
+
+    A run is identified by its settings; papers are queued as `pending` and
+    flipped to `done` (with the chunk IDs they produced) only after the batch
+    containing their last chunk has been committed to the indexes. Every
+    update is its own transaction, so a killed process loses at most the
+    batch that was in flight.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path))
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS run (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS papers ("
+                " paper_id TEXT PRIMARY KEY, path TEXT NOT NULL, sha256 TEXT,"
+                " status TEXT NOT NULL, chunk_ids TEXT, error TEXT)"
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _get(self, key: str):
+        row = self._conn.execute("SELECT value FROM run WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _set(self, key: str, value) -> None:
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO run (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    @property
+    def active(self) -> bool:
+        return self._get('run') is not None
+
+    @property
+    def run(self) -> Optional[Dict]:
+        return self._get('run')
+
+    @property
+    def phase(self) -> Optional[str]:
+        return self._get('phase')
+
+    def set_phase(self, phase: str) -> None:
+        self._set('phase', phase)
+
+    def resume(self, run: Dict) -> bool:
+        """Continue the stored run if it matches `run`; otherwise start afresh."""
+        if self.run == run:
+            return True
+        self.finish()
+        self._set('run', run)
+        self._set('phase', 'ingest')
+        return False
+
+    def enqueue(self, papers: Iterable[Tuple[str, Path, Optional[str]]]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO papers (paper_id, path, sha256, status) VALUES (?, ?, ?, 'pending')",
+                [(paper_id, str(path), sha) for paper_id, path, sha in papers],
+            )
+
+    def mark_done(self, papers: Iterable[Tuple[str, Path, Optional[str], list]]) -> None:
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO papers (paper_id, path, sha256, status, chunk_ids)"
+                " VALUES (?, ?, ?, 'done', ?)",
+                [(paper_id, str(path), sha, json.dumps(chunk_ids)) for paper_id, path, sha, chunk_ids in papers],
+            )
+
+    def mark_failed(self, paper_id: str, path: Path, error: str) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO papers (paper_id, path, status, error) VALUES (?, ?, 'failed', ?)",
+                (paper_id, str(path), error),
+            )
+
+    def done(self) -> Dict[str, Dict]:
+        rows = self._conn.execute("SELECT paper_id, path, sha256, chunk_ids FROM papers WHERE status = 'done'")
+        return {
+            paper_id: {'path': path, 'sha256': sha, 'chunk_ids': json.loads(chunk_ids)}
+            for paper_id, path, sha, chunk_ids in rows
+        }
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn.execute("SELECT status, COUNT(*) FROM papers GROUP BY status")
+        return dict(rows.fetchall())
+
+    def finish(self) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM run")
+            self._conn.execute("DELETE FROM papers")
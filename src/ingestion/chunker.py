@@ -1,47 +1,51 @@
 import tiktoken
-from typing import List, Dict
+from typing import Dict, Iterable, Iterator, List
 
 class HierarchicalChunker:
-    def __init__(self, max_tokens=400, overlap=50):
+    def __init__(self, max_tokens=400, overlap=50, num_threads=1):
         self.encoder = tiktoken.encoding_for_model("gpt-4")
         self.max_tokens = max_tokens
         self.overlap = overlap
+        self.num_threads = num_threads
 
     def chunk_paper(self, structure: Dict, metadata: Dict) -> List[Dict]:
-        chunks = []
+        return list(self.iter_chunks(structure['sections'], metadata))
+
+    def iter_chunks(self, sections: Iterable[Dict], metadata: Dict) -> Iterator[Dict]:
         chunk_id = 0
 
-        for section in structure['sections']:
+        for section in sections:
             content = '\n'.join(section['content'])
             if not content.strip():
                 continue
 
-            section_chunks = self._create_chunks(content, {
+            chunk_metadata = {
                 'paper_title': metadata.get('title', 'Unknown'),
                 'section': section['title'],
                 'level': section.get('level', 1),
                 'page_start': section.get('page_start', section.get('page', 1))
-            })
+            }
+            # Copied onto every chunk so searches can filter on it
+            if metadata.get('year') is not None:
+                chunk_metadata['year'] = metadata['year']
+            section_chunks = self._create_chunks(content, chunk_metadata)
 
             for chunk in section_chunks:
                 chunk['chunk_id'] = f"chunk_{chunk_id}"
-                chunks.append(chunk)
+                yield chunk
                 chunk_id += 1
 
-        return chunks
-
     def _create_chunks(self, text: str, metadata: Dict) -> List[Dict]:
         if not text.strip():
             return []
 
         sentences = self._split_sentences(text)
+        token_counts = self._count_tokens(sentences)
         chunks = []
         current_chunk = []
         current_tokens = 0
 
-        for sentence in sentences:
-            sentence_tokens = len(self.encoder.encode(sentence))
-
+        for sentence, sentence_tokens in zip(sentences, token_counts):
             if current_tokens + sentence_tokens > self.max_tokens and current_chunk:
                 chunks.append({
                     'text': ' '.join(current_chunk),
@@ -52,13 +56,14 @@ class HierarchicalChunker:
                 # Keep overlap
                 if self.overlap > 0 and len(current_chunk) > 1:
                     current_chunk = current_chunk[-1:]
-                    current_tokens = len(self.encoder.encode(current_chunk[-1]))
+                    current_tokens = last_sentence_tokens
                 else:
                     current_chunk = []
                     current_tokens = 0
 
             current_chunk.append(sentence)
             current_tokens += sentence_tokens
+            last_sentence_tokens = sentence_tokens
 
         if current_chunk:
             chunks.append({
@@ -69,6 +74,16 @@ class HierarchicalChunker:
 
         return chunks
 
+    def _count_tokens(self, sentences: List[str]) -> List[int]:
+        # Each sentence is encoded once and its count reused for overlap.
+        # tiktoken's encode_batch maps encode over a new thread pool per call,
+        # which only pays off with spare cores (see bench_chunker.py)
+        if self.num_threads > 1:
+            encoded = self.encoder.encode_batch(sentences, num_threads=self.num_threads)
+        else:
+            encoded = map(self.encoder.encode, sentences)
+        return [len(tokens) for tokens in encoded]
+
     def _split_sentences(self, text: str) -> List[str]:
         import re
         sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', text)
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# Bump when extraction/parsing/chunking or embedding output changes so
+# existing indexes are rebuilt instead of mixing chunks from two pipeline
+# versions. 3: vectors come from embeddings.model_name, not Chroma's default.
+# 4: chunks carry the paper's year.
+PIPELINE_VERSION = 4
+
+
+def file_sha256(path: Path, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class IngestionPlan:
+    to_process: List[Path] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+    full_rebuild: bool = False
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+
+class IngestionManifest:
+    """Persistent record of what is currently indexed.
+
+    Papers are keyed by `paper_id` (the PDF file stem) and store the content
+    hash plus the chunk IDs they contributed. The settings block captures the
+    chunker parameters and embedding model; if any of them change, every
+    paper has to be re-ingested.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.settings: Dict = {}
+        self.papers: Dict[str, Dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        with open(self.path, 'r') as f:
+            data = json.load(f)
+        self.settings = data.get('settings', {})
+        self.papers = data.get('papers', {})
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({'settings': self.settings, 'papers': self.papers}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def paper_id(pdf_path: Path) -> str:
+        return Path(pdf_path).stem
+
+    def plan(self, pdf_files: List[Path], settings: Dict) -> IngestionPlan:
+        settings = {**settings, 'pipeline_version': PIPELINE_VERSION}
+        plan = IngestionPlan(full_rebuild=settings != self.settings)
+        if plan.full_rebuild:
+            self.settings = settings
+            self.papers = {}
+
+        current_ids = set()
+        for pdf_path in pdf_files:
+            paper_id = self.paper_id(pdf_path)
+            current_ids.add(paper_id)
+            entry = self.papers.get(paper_id)
+            stat = pdf_path.stat()
+
+            # Cheap size/mtime check first; only hash files that look touched
+            if entry and entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime:
+                plan.unchanged.append(paper_id)
+                continue
+
+            sha = file_sha256(pdf_path)
+            if entry and entry.get('sha256') == sha:
+                entry.update(size=stat.st_size, mtime=stat.st_mtime)
+                plan.unchanged.append(paper_id)
+                continue
+
+            plan.hashes[paper_id] = sha
+            plan.to_process.append(pdf_path)
+
+        plan.removed = sorted(set(self.papers) - current_ids)
+        return plan
+
+    def record(self, pdf_path: Path, sha256: Optional[str], chunk_ids: List[str]) -> None:
+        stat = Path(pdf_path).stat()
+        self.papers[self.paper_id(pdf_path)] = {
+            'file': Path(pdf_path).name,
+            'sha256': sha256 or file_sha256(pdf_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'chunk_ids': chunk_ids,
+        }
+
+    def forget(self, paper_id: str) -> None:
+        self.papers.pop(paper_id, None)
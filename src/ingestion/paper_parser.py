@@ -1,20 +1,41 @@
-try:
-    import fitz
-except ImportError:
-    import pymupdf as fitz
-from typing import List, Dict
+import unicodedata
+from typing import List, Dict, Iterator, Optional, Tuple, Union
+
+from .pdf_document import PDFDocument
 
 class PaperParser:
-    def parse_structure(self, pdf_path: str) -> Dict:
-        doc = fitz.open(pdf_path)
-        outline = doc.get_toc()
+    # Slack (in points) between a TOC destination and the heading's block
+    POSITION_TOLERANCE = 2.0
+
+    def parse_structure(self, source: Union[str, PDFDocument]) -> Dict:
+        doc = PDFDocument.wrap(source)
+        try:
+            return {'sections': list(self.iter_sections(doc))}
+        finally:
+            if doc is not source:
+                doc.close()
+
+    def iter_sections(self, doc: PDFDocument, fallback_window: Optional[int] = None) -> Iterator[Dict]:
+        """Yield sections as soon as the next heading closes them.
+
+        Pages are consumed strictly in order, so this pairs with a
+        `PDFDocument` whose page cache is bounded. Without an outline the
+        whole document is one section, or one per `fallback_window` pages.
+        """
+        outline = doc.get_toc(simple=False)
 
         if not outline:
-            return self._fallback_parse(doc)
+            yield from self._fallback_sections(doc, fallback_window)
+            return
 
         sections = []
-        for level, title, page_num in outline:
+        starts_by_page: Dict[int, List[Tuple[int, Optional[Tuple[float, float]]]]] = {}
+        for level, title, page_num, *dest in outline:
             if level <= 2:  # Only main sections and subsections
+                page_idx = min(max(page_num, 1), len(doc)) - 1
+                starts_by_page.setdefault(page_idx, []).append(
+                    (len(sections), self._destination(doc, page_idx, dest))
+                )
                 sections.append({
                     'level': level,
                     'title': title.strip(),
@@ -22,34 +43,100 @@ class PaperParser:
                     'content': []
                 })
 
-        # Extract content for each section
-        for i, section in enumerate(sections):
-            start_page = section['page_start'] - 1  # 0-indexed
-            end_page = sections[i + 1]['page_start'] - 1 if i + 1 < len(sections) else len(doc)
+        # Walk the document once. Pages without a heading go wholesale to the
+        # active section; pages with headings are split at the heading block.
+        active = None
+        # Lines above the first heading (title, authors, abstract), kept at the
+        # start of the first section
+        preamble: List[str] = []
+        for page_idx in range(len(doc)):
+            starts = starts_by_page.get(page_idx)
+            if not starts:
+                if active is not None:
+                    sections[active]['content'].extend(self._lines(doc.page_text(page_idx)))
+                continue
 
-            content_text = ""
-            for page_idx in range(start_page, min(end_page, len(doc))):
-                page = doc[page_idx]
-                content_text += page.get_text()
+            blocks = [b for b in doc.page_blocks(page_idx) if b[6] == 0]
+            cursor = 0
+            for section_idx, dest in starts:
+                split = self._find_heading_block(blocks, cursor, sections[section_idx]['title'], dest)
+                if active is not None:
+                    for block in blocks[cursor:split]:
+                        sections[active]['content'].extend(self._lines(block[4]))
+                    yield self._finish(sections, active, preamble)
+                    preamble = []
+                else:
+                    for block in blocks[cursor:split]:
+                        preamble.extend(self._lines(block[4]))
+                active, cursor = section_idx, split
+            for block in blocks[cursor:]:
+                sections[active]['content'].extend(self._lines(block[4]))
 
-            # Clean content (remove section title if it appears)
-            lines = content_text.split('\n')
-            cleaned_lines = [line for line in lines if line.strip() and section['title'] not in line]
-            section['content'] = cleaned_lines
+        if active is not None:
+            yield self._finish(sections, active, preamble)
 
-        doc.close()
-        return {'sections': sections}
+    def _finish(self, sections: List[Dict], idx: int, preamble: List[str]) -> Dict:
+        # Hand the section over and drop our reference so its text can be freed
+        section, sections[idx] = sections[idx], None
+        section['content'] = preamble + self._strip_heading(section['content'], section['title'])
+        return section
 
-    def _fallback_parse(self, doc) -> Dict:
-        # Fallback for PDFs without bookmarks
-        sections = [{
-            'level': 1,
-            'title': 'Full Document',
-            'page_start': 1,
-            'content': []
-        }]
+    def _destination(self, doc: PDFDocument, page_idx: int, dest: List) -> Optional[Tuple[float, float]]:
+        target = dest[0].get('to') if dest and isinstance(dest[0], dict) else None
+        if target is None:
+            return None
+        return doc.to_page_coords(page_idx, target)
 
-        for page in doc:
-            sections[0]['content'].extend(page.get_text().split('\n'))
+    def _find_heading_block(self, blocks: List, start: int, title: str,
+                            dest: Optional[Tuple[float, float]]) -> int:
+        """Index of the block where a section starts, searching from `start`."""
+        tol = self.POSITION_TOLERANCE
+        if dest is not None:
+            x, y = dest
+            for idx in range(start, len(blocks)):
+                x0, y0, x1 = blocks[idx][0], blocks[idx][1], blocks[idx][2]
+                if y0 >= y - tol and x0 - tol <= x <= x1 + tol:
+                    return idx
 
-        return {'sections': sections}
\ No newline at end of file
+        # No usable destination: fall back to the first block matching the title
+        norm_title = self._normalize(title)
+        for idx in range(start, len(blocks)):
+            if self._normalize(blocks[idx][4]).startswith(norm_title):
+                return idx
+        return start
+
+    def _strip_heading(self, lines: List[str], title: str) -> List[str]:
+        # Headings are often split over lines ("1" / "Introduction")
+        norm_title = self._normalize(title)
+        consumed = ''
+        for idx, line in enumerate(lines):
+            candidate = self._normalize(f"{consumed} {line}")
+            if not norm_title.startswith(candidate):
+                break
+            if candidate == norm_title:
+                return lines[idx + 1:]
+            consumed = candidate
+        return lines
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        # NFKC folds ligatures (e.g. U+FB01 'fi') that PDFs emit but TOC titles do not
+        return ' '.join(unicodedata.normalize('NFKC', text).split()).lower()
+
+    @staticmethod
+    def _lines(text: str) -> List[str]:
+        return [line for line in text.split('\n') if line.strip()]
+
+    def _fallback_sections(self, doc: PDFDocument, window: Optional[int] = None) -> Iterator[Dict]:
+        # Fallback for PDFs without bookmarks
+        window = window or max(len(doc), 1)
+        for first_page in range(0, len(doc), window):
+            section = {
+                'level': 1,
+                'title': 'Full Document',
+                'page_start': first_page + 1,
+                'content': []
+            }
+            for page_idx in range(first_page, min(first_page + window, len(doc))):
+                section['content'].extend(doc.page_text(page_idx).split('\n'))
+            yield section
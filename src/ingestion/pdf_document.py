@@ -0,0 +1,92 @@
+try:
+    import fitz
+except ImportError:
+    import pymupdf as fitz
+from collections import OrderedDict
+from collections.abc import Mapping
+from typing import List, Optional, Tuple, Union
+
+
+class PDFDocument:
+    """A PDF opened once and shared by the extractor and the parser.
+
+    Page text and blocks are pulled from PyMuPDF the first time they are
+    requested and cached, so each page is extracted at most once per kind.
+    Setting `max_cached_pages` turns the caches into small LRUs, which keeps
+    memory flat for book-length PDFs that are read front to back.
+    """
+
+    def __init__(self, pdf_path: str, max_cached_pages: Optional[int] = None):
+        self.path = str(pdf_path)
+        self.doc = fitz.open(self.path)
+        self.max_cached_pages = max_cached_pages
+        self._text: OrderedDict = OrderedDict()
+        self._blocks: OrderedDict = OrderedDict()
+
+    @classmethod
+    def wrap(cls, source: Union[str, 'PDFDocument']) -> 'PDFDocument':
+        return source if isinstance(source, cls) else cls(source)
+
+    def __len__(self) -> int:
+        return len(self.doc)
+
+    def __enter__(self) -> 'PDFDocument':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.doc.close()
+
+    def get_toc(self, simple: bool = True) -> List:
+        return self.doc.get_toc(simple=simple)
+
+    def page_text(self, page_idx: int) -> str:
+        return self._cached(self._text, page_idx, lambda page: page.get_text())
+
+    def page_blocks(self, page_idx: int) -> List:
+        return self._cached(self._blocks, page_idx, lambda page: page.get_text("blocks"))
+
+    def _cached(self, cache: OrderedDict, page_idx: int, extract):
+        if page_idx in cache:
+            cache.move_to_end(page_idx)
+            return cache[page_idx]
+        value = cache[page_idx] = extract(self.doc[page_idx])
+        if self.max_cached_pages is not None:
+            while len(cache) > self.max_cached_pages:
+                cache.popitem(last=False)
+        return value
+
+    def to_page_coords(self, page_idx: int, point) -> Tuple[float, float]:
+        """Convert a TOC destination point (PDF space) to the page's text coordinates."""
+        mapped = fitz.Point(point) * self.doc[page_idx].transformation_matrix
+        return mapped.x, mapped.y
+
+    def page(self, page_idx: int) -> 'PDFPage':
+        return PDFPage(self, page_idx)
+
+
+class PDFPage(Mapping):
+    """Read-only page record (`page_num`, `text`, `blocks`) backed by the document cache."""
+
+    _KEYS = ('page_num', 'text', 'blocks')
+
+    def __init__(self, document: PDFDocument, page_idx: int):
+        self._document = document
+        self._page_idx = page_idx
+
+    def __getitem__(self, key):
+        if key == 'page_num':
+            return self._page_idx + 1
+        if key == 'text':
+            return self._document.page_text(self._page_idx)
+        if key == 'blocks':
+            return self._document.page_blocks(self._page_idx)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self) -> int:
+        return len(self._KEYS)
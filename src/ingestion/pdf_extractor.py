@@ -1,20 +1,22 @@
-try:
-    import fitz
-except ImportError:
-    import pymupdf as fitz
-from typing import Dict
+from typing import Dict, Iterator, Union
+
+from .pdf_document import PDFDocument, PDFPage
 
 class PDFExtractor:
-    def extract_from_pdf(self, pdf_path: str) -> Dict:
-        doc = fitz.open(pdf_path)
-        pages = []
+    # _extract_metadata only ever looks at this much leading text
+    METADATA_CHARS = 3000
+
+    def extract_from_pdf(self, source: Union[str, PDFDocument], lazy: bool = False) -> Dict:
+        document = PDFDocument.wrap(source)
+        if lazy:
+            # Metadata from the first pages only; pages are produced on demand
+            return {
+                'raw_text': None,
+                'pages': self.iter_pages(document),
+                'metadata': self.extract_metadata(document)
+            }
 
-        for page_num, page in enumerate(doc):
-            pages.append({
-                'page_num': page_num + 1,
-                'text': page.get_text(),
-                'blocks': page.get_text("blocks")
-            })
+        pages = [document.page(page_idx) for page_idx in range(len(document))]
 
         raw_text = '\n'.join([p['text'] for p in pages])
         metadata = self._extract_metadata(raw_text)
@@ -25,6 +27,22 @@ class PDFExtractor:
             'metadata': metadata
         }
 
+    def extract_metadata(self, source: Union[str, PDFDocument]) -> Dict:
+        document = PDFDocument.wrap(source)
+        texts = []
+        length = 0
+        for page_idx in range(len(document)):
+            if length >= self.METADATA_CHARS:
+                break
+            texts.append(document.page_text(page_idx))
+            length += len(texts[-1]) + 1
+        return self._extract_metadata('\n'.join(texts))
+
+    def iter_pages(self, source: Union[str, PDFDocument]) -> Iterator[PDFPage]:
+        document = PDFDocument.wrap(source)
+        for page_idx in range(len(document)):
+            yield document.page(page_idx)
+
     def _extract_metadata(self, text: str) -> Dict:
         import re
 
@@ -37,4 +55,4 @@ class PDFExtractor:
         year_match = re.search(r'(20[0-9]{2})', text[:1000])
         year = int(year_match.group(1)) if year_match else None
 
-        return {'title': title, 'abstract': abstract, 'year': year}
\ No newline at end of file
+        return {'title': title, 'abstract': abstract, 'year': year}
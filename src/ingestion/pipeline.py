@@ -0,0 +1,252 @@
+"""Streaming ingestion pipeline: extract -> parse -> chunk -> embed -> index.
+
+Each stage is a generator that pulls from the previous one, so at any time
+only the papers in flight and a single index batch are held in memory.
+Papers are processed either in-process behind a bounded prefetch queue or
+across a process pool with a bounded number of outstanding papers.
+"""
+
+import queue
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from itertools import islice
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .chunker import HierarchicalChunker
+from .paper_parser import PaperParser
+from .pdf_document import PDFDocument
+from .pdf_extractor import PDFExtractor
+
+
+# Pages kept in the document cache for PDFs extracted in lazy mode
+LAZY_CACHED_PAGES = 2
+# Without an outline, lazy mode emits one fallback section per this many pages
+LAZY_FALLBACK_WINDOW = 10
+
+
+@dataclass
+class PipelineSettings:
+    max_tokens: int = 400
+    overlap: int = 50
+    tokenizer_threads: int = 1
+    # PDFs with more pages are read lazily, one page at a time
+    lazy_page_threshold: Optional[int] = None
+
+    def build_components(self) -> Tuple[PDFExtractor, PaperParser, HierarchicalChunker]:
+        return PDFExtractor(), PaperParser(), HierarchicalChunker(self.max_tokens, self.overlap, self.tokenizer_threads)
+
+
+@dataclass
+class PaperJob:
+    pdf_path: Path
+    document: Optional[PDFDocument] = None
+    metadata: Dict = field(default_factory=dict)
+    structure: Optional[Dict] = None
+    chunks: List[Dict] = field(default_factory=list)
+    error: Optional[str] = None
+    lazy: bool = False
+
+    @property
+    def paper_id(self) -> str:
+        return Path(self.pdf_path).stem
+
+    def fail(self, exc: Exception) -> None:
+        self.error = f"{type(exc).__name__}: {exc}"
+        self.release()
+
+    def release(self) -> None:
+        # Drop the open PDF and parsed structure once chunks exist
+        if self.document is not None:
+            self.document.close()
+            self.document = None
+        self.structure = None
+
+
+def extract_stage(pdf_paths: Iterable[Path], extractor: PDFExtractor,
+                  lazy_page_threshold: Optional[int] = None) -> Iterator[PaperJob]:
+    for pdf_path in pdf_paths:
+        job = PaperJob(pdf_path=Path(pdf_path))
+        try:
+            job.document = PDFDocument(job.pdf_path)
+            job.lazy = lazy_page_threshold is not None and len(job.document) > lazy_page_threshold
+            if job.lazy:
+                job.document.max_cached_pages = LAZY_CACHED_PAGES
+                job.metadata = extractor.extract_metadata(job.document)
+            else:
+                job.metadata = extractor.extract_from_pdf(job.document)['metadata']
+        except Exception as exc:
+            job.fail(exc)
+        yield job
+
+
+def parse_stage(jobs: Iterable[PaperJob], parser: PaperParser) -> Iterator[PaperJob]:
+    for job in jobs:
+        if not job.error:
+            try:
+                if job.lazy:
+                    # Sections are produced while the chunker consumes them
+                    job.structure = {'sections': parser.iter_sections(job.document, LAZY_FALLBACK_WINDOW)}
+                else:
+                    job.structure = parser.parse_structure(job.document)
+            except Exception as exc:
+                job.fail(exc)
+        yield job
+
+
+def chunk_stage(jobs: Iterable[PaperJob], chunker: HierarchicalChunker) -> Iterator[PaperJob]:
+    for job in jobs:
+        if not job.error:
+            try:
+                job.chunks = chunker.chunk_paper(job.structure, job.metadata)
+                for chunk in job.chunks:
+                    chunk['metadata']['paper_id'] = job.paper_id
+            except Exception as exc:
+                job.fail(exc)
+            job.release()
+        yield job
+
+
+def embed_stage(batches: Iterable[List[Dict]], vector_store) -> Iterator[List[Dict]]:
+    """Upsert each batch into the vector store, which embeds the chunk texts."""
+    for batch in batches:
+        vector_store.add_chunks(batch)
+        yield batch
+
+
+def index_stage(batches: Iterable[List[Dict]], bm25_indexer) -> Iterator[List[Dict]]:
+    """Stage each batch in the BM25 index; the caller commits once at the end."""
+    for batch in batches:
+        bm25_indexer.add_chunks(batch)
+        yield batch
+
+
+def batch_stage(jobs: Iterable[PaperJob], batch_size: int) -> Iterator[List[Dict]]:
+    """Regroup per-paper chunks into fixed-size index batches."""
+    batch: List[Dict] = []
+    for job in jobs:
+        for chunk in job.chunks:
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+class _Sentinel:
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+def prefetch(items: Iterable, maxsize: int) -> Iterator:
+    """Run `items` in a background thread, buffering at most `maxsize` results."""
+    buffer: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+
+    def produce():
+        try:
+            for item in items:
+                buffer.put(item)
+        except BaseException as exc:  # surface producer errors to the consumer
+            buffer.put(_Sentinel(exc))
+            return
+        buffer.put(_Sentinel())
+
+    threading.Thread(target=produce, daemon=True).start()
+    while True:
+        item = buffer.get()
+        if isinstance(item, _Sentinel):
+            if item.error:
+                raise item.error
+            return
+        yield item
+
+
+# Per-process pipeline components, created once per worker by _init_worker
+_components = None
+
+
+def _init_worker(settings: PipelineSettings) -> None:
+    global _components
+    _components = (settings, *settings.build_components())
+
+
+def _run_stages(pdf_paths: Iterable[Path], settings: PipelineSettings, extractor: PDFExtractor,
+                parser: PaperParser, chunker: HierarchicalChunker) -> Iterator[PaperJob]:
+    jobs = extract_stage(pdf_paths, extractor, settings.lazy_page_threshold)
+    return chunk_stage(parse_stage(jobs, parser), chunker)
+
+
+def process_paper(pdf_path: Path, settings: Optional[PipelineSettings] = None) -> PaperJob:
+    """Extract, parse and chunk one PDF. Runs inside pool workers."""
+    if _components is None:
+        _init_worker(settings or PipelineSettings())
+    return next(_run_stages([pdf_path], *_components))
+
+
+def process_stage(
+    pdf_paths: Iterable[Path],
+    settings: PipelineSettings,
+    workers: int = 1,
+    queue_size: int = 4,
+) -> Iterator[PaperJob]:
+    """Yield chunked papers with at most `queue_size` finished papers waiting.
+
+    With workers > 1 papers are fanned out over a process pool; results come
+    back in completion order and no more than `workers + queue_size` papers
+    are outstanding at once. A paper whose worker process dies (e.g. PyMuPDF
+    crashing on a malformed PDF) comes back as a failed job, and the pool is
+    recreated for the remaining papers.
+    """
+    if workers <= 1:
+        jobs = _run_stages(pdf_paths, settings, *settings.build_components())
+        yield from prefetch(jobs, queue_size)
+        return
+
+    paths = iter(pdf_paths)
+    while True:
+        # Papers in flight when a worker process died
+        suspects: List[Path] = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(settings,)) as pool:
+            pending = {pool.submit(process_paper, path): path for path in islice(paths, workers + queue_size)}
+            while pending and not suspects:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path = pending.pop(future)
+                    try:
+                        job = future.result()
+                    except BrokenProcessPool:
+                        suspects.append(path)
+                        continue
+                    except Exception as exc:
+                        job = _failed_job(path, exc)
+                    yield job
+                    next_path = None if suspects else next(paths, None)
+                    if next_path is not None:
+                        pending[pool.submit(process_paper, next_path)] = next_path
+            # A broken pool fails every outstanding future
+            suspects.extend(pending.values())
+        if not suspects:
+            return
+        # Any one of them may have killed the worker, so each is retried in a
+        # pool of its own; the rest of the papers go to a fresh pool
+        for path in suspects:
+            yield _process_alone(path, settings)
+
+
+def _failed_job(pdf_path: Path, exc: Exception) -> PaperJob:
+    job = PaperJob(pdf_path=Path(pdf_path))
+    job.fail(exc)
+    return job
+
+
+def _process_alone(pdf_path: Path, settings: PipelineSettings) -> PaperJob:
+    """Process one paper in a single-worker pool; if the worker dies, the paper has failed."""
+    with ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(settings,)) as pool:
+        try:
+            return pool.submit(process_paper, pdf_path).result()
+        except Exception as exc:
+            return _failed_job(pdf_path, exc)
@@ -0,0 +1,71 @@
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+
+@dataclass
+class FolderChanges:
+    added: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.modified or self.removed)
+
+
+class FolderWatcher:
+    """Polls a directory and reports changes once it has been quiet for a while.
+
+    Each poll compares file sizes and mtimes with the previous poll. While
+    files keep appearing or growing (a copy in progress, a burst of drops)
+    the debounce timer restarts; once nothing has changed for
+    `debounce_seconds` the accumulated changes are reported as one batch.
+    """
+
+    def __init__(self, directory, pattern: str = "*.pdf", debounce_seconds: float = 5.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.directory = Path(directory)
+        self.pattern = pattern
+        self.debounce_seconds = debounce_seconds
+        self._clock = clock
+        self._reported = self.snapshot()
+        self._latest = self._reported
+        self._changed_at: Optional[float] = None
+
+    def snapshot(self) -> Dict[str, Tuple[int, float]]:
+        files = {}
+        for path in self.directory.glob(self.pattern):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # deleted between glob and stat
+                continue
+            files[path.name] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def poll(self) -> Optional[FolderChanges]:
+        current = self.snapshot()
+        now = self._clock()
+        if current != self._latest:
+            self._latest = current
+            self._changed_at = now
+            return None
+        if self._changed_at is None or now - self._changed_at < self.debounce_seconds:
+            return None
+
+        self._changed_at = None
+        previous = self._reported
+        changes = FolderChanges(
+            added=sorted(set(current) - set(previous)),
+            modified=sorted(name for name in current if name in previous and current[name] != previous[name]),
+            removed=sorted(set(previous) - set(current)),
+        )
+        self._reported = current
+        return changes or None
+
+    def watch(self, poll_interval: float = 2.0) -> Iterator[FolderChanges]:
+        while True:
+            changes = self.poll()
+            if changes:
+                yield changes
+            time.sleep(poll_interval)
@@ -1,23 +1,241 @@
 import json
+import threading
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Mapping, Optional
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from config import config
-from indexing.vector_store import ChromaDBStore
+from indexing.vector_store import VectorStore, create_vector_store
 from indexing.bm25_indexer import BM25Indexer
+from indexing.chunk_store import ChunkStore
+from indexing.generation import read_generation
+from indexing.metadata_filter import ChunkRowFilter
+from indexing.snapshots import current_version, previous_version, read_snapshot, set_current
+
+
+class SearchIndexes:
+    """One consistent set of indexes: from a snapshot, or the working indexes (`version` None).
+
+    A search holds the set it started with until it returns, so swapping in
+    another set never changes the indexes under a running query. A retired
+    snapshot set closes once its last search has finished.
+    """
+
+    def __init__(self, version: Optional[str], vector_store: VectorStore, bm25_indexer: BM25Indexer,
+                 chunks: Mapping[str, Dict], generation: int):
+        self.version = version
+        self.vector_store = vector_store
+        self.bm25_indexer = bm25_indexer
+        self.chunks = chunks
+        self.generation = generation
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+
+    def acquire(self) -> "SearchIndexes":
+        with self._lock:
+            self._users += 1
+        return self
+
+    def release(self) -> None:
+        with self._lock:
+            self._users -= 1
+            idle = self._retired and self._users == 0
+        if idle:
+            self._close()
+
+    def retire(self) -> None:
+        with self._lock:
+            self._retired = True
+            idle = self._users == 0
+        if idle:
+            self._close()
+
+    def _close(self) -> None:
+        # The working indexes are reopened in place rather than replaced
+        if self.version is None:
+            return
+        self.vector_store.close()
+        if isinstance(self.chunks, ChunkStore):
+            try:
+                self.chunks.close()
+            except BufferError:
+                # A caller still holds a view into it; the map goes with that
+                pass
+
 
 class HybridSearch:
-    def __init__(self, semantic_weight=None):
+    """Fuses semantic and keyword search over the current index snapshot.
+
+    When ingestion publishes snapshots (see `indexing.snapshots`), searches
+    are served from the one named by `CURRENT`. A new current snapshot is
+    opened and warmed in a background thread while searches continue on the
+    old one, then swapped in atomically; the set it replaced is kept for
+    `rollback`. Without snapshots the working indexes are searched and
+    reopened when ingestion bumps the index generation.
+    """
+
+    def __init__(self, semantic_weight=None, embedder=None):
         self.semantic_weight = semantic_weight or config.semantic_weight
         self.keyword_weight = 1 - self.semantic_weight
-        self.vector_store = ChromaDBStore()
-        self.bm25_indexer = BM25Indexer()
-        self.chunks_cache = self._load_chunks()
+        self._swap_lock = threading.Lock()
+        self._warming: Optional[str] = None
+        self._failed: Dict[str, str] = {}
+        self.previous: Optional[SearchIndexes] = None
+        # Shared by every set of indexes, so the query model loads once
+        self._embedder = embedder
+        version = current_version() if config.snapshots_enabled else None
+        self.indexes = self._open_snapshot(version) if version is not None else self._open_working()
+
+    @property
+    def vector_store(self) -> VectorStore:
+        return self.indexes.vector_store
+
+    @property
+    def bm25_indexer(self) -> BM25Indexer:
+        return self.indexes.bm25_indexer
+
+    @property
+    def chunks_cache(self) -> Mapping[str, Dict]:
+        return self.indexes.chunks
+
+    def _open_working(self) -> SearchIndexes:
+        generation = read_generation()
+        return SearchIndexes(None, create_vector_store(embedder=self._embedder), BM25Indexer(),
+                             self._load_chunks(), generation)
+
+    def _open_snapshot(self, version: str) -> SearchIndexes:
+        info = read_snapshot(version)
+        vector_store = create_vector_store(collection_name=info.collection_name, backend=info.vector_backend,
+                                           embedder=self._embedder, path=info.path / "vectors")
+        if info.embedding_model != vector_store.embedder.model_id:
+            vector_store.close()
+            raise ValueError(f"snapshot {version} was embedded with {info.embedding_model}, "
+                             f"not {vector_store.embedder.model_id}")
+        self._embedder = vector_store.embedder
+        chunks_path = info.path / "corpus.chunks"
+        chunks = ChunkStore(chunks_path) if chunks_path.exists() else {}
+        return SearchIndexes(version, vector_store, BM25Indexer(info.path / "bm25"), chunks, info.generation)
 
-    def _load_chunks(self) -> Dict[str, Dict]:
+    def _warm(self, version: str) -> SearchIndexes:
+        if self._embedder is None:
+            self._embedder = self.indexes.vector_store.embedder
+        indexes = self._open_snapshot(version)
+        # Pays for loading the vectors, BM25 segments and the query model
+        # here rather than in the first search after the swap
+        indexes.vector_store.search("warm up", k=1)
+        indexes.bm25_indexer.search_keys("warm up", k=1)
+        return indexes
+
+    def _swap(self, indexes: SearchIndexes) -> None:
+        with self._swap_lock:
+            retired, self.previous = self.previous, self.indexes
+            self.indexes = indexes
+        if retired is not None:
+            retired.retire()
+
+    def _activate(self, version: str, make_current: bool) -> None:
+        try:
+            indexes = self._warm(version)
+            if make_current:
+                # Before the swap, so refresh_if_stale never sees this
+                # process serving a version other than CURRENT
+                set_current(version)
+            self._swap(indexes)
+        except Exception as exc:
+            # Not retried until CURRENT names another snapshot
+            self._failed[version] = str(exc)
+            raise
+        finally:
+            self._warming = None
+
+    def activate(self, version: str, wait: bool = False) -> bool:
+        """Warm snapshot `version` and swap it in, making it current for every searcher.
+
+        Runs in a background thread unless `wait`; False if a snapshot is
+        already being warmed. Raises ValueError for an unknown snapshot.
+        """
+        read_snapshot(version)
+        with self._swap_lock:
+            if self._warming is not None:
+                return False
+            self._warming = version
+        self._failed.pop(version, None)
+        if wait:
+            self._activate(version, make_current=True)
+        else:
+            self._start(version, make_current=True)
+        return True
+
+    def rollback(self) -> str:
+        """Serve the snapshot from before the last swap again; returns its version."""
+        previous = self.previous
+        if previous is None or previous.version is None:
+            version = previous_version(self.indexes.version) if self.indexes.version else None
+            if version is None:
+                raise ValueError("no earlier snapshot to roll back to")
+            if not self.activate(version, wait=True):
+                raise RuntimeError("a snapshot is being activated; try again once it is swapped in")
+            return version
+        with self._swap_lock:
+            if self._warming is not None:
+                raise RuntimeError("a snapshot is being activated; try again once it is swapped in")
+            # Already warm: swapping back is immediate
+            set_current(previous.version)
+            self.previous, self.indexes = self.indexes, previous
+        return previous.version
+
+    def status(self) -> Dict:
+        return {
+            'serving': self.indexes.version,
+            'previous': self.previous.version if self.previous is not None else None,
+            'warming': self._warming,
+            'failed': dict(self._failed),
+        }
+
+    def _start(self, version: str, make_current: bool) -> None:
+        def run():
+            try:
+                self._activate(version, make_current)
+            except Exception as exc:
+                print(f"Could not activate snapshot {version}: {exc}")
+
+        threading.Thread(target=run, name=f"warm-{version}", daemon=True).start()
+
+    def refresh_if_stale(self) -> bool:
+        """Pick up newer indexes; True if the ones searched changed.
+
+        A new current snapshot is warmed in the background (and this returns
+        False until it is swapped in); working indexes are reopened in place.
+        """
+        version = current_version() if config.snapshots_enabled else None
+        if version is not None:
+            if version == self.indexes.version or version in self._failed:
+                return False
+            with self._swap_lock:
+                if self._warming is not None:
+                    return False
+                self._warming = version
+            self._start(version, make_current=False)
+            return False
+
+        generation = read_generation()
+        if self.indexes.version is not None or generation == self.indexes.generation:
+            return False
+        vector_store = self.indexes.vector_store
+        vector_store.reopen()
+        self._swap(SearchIndexes(None, vector_store, BM25Indexer(), self._load_chunks(), generation))
+        return True
+
+    def _load_chunks(self) -> Mapping[str, Dict]:
+        store_path = Path(config.chunk_store_path)
+        if store_path.exists():
+            # Memory-mapped; chunks are decoded only when looked up
+            return ChunkStore(store_path)
+
+        # Processed papers written before the chunk store existed
         chunks = {}
         for json_file in Path(config.processed_papers_path).glob("*.json"):
             with open(json_file, 'r') as f:
@@ -26,40 +244,66 @@ class HybridSearch:
                     chunks[chunk['chunk_id']] = chunk
         return chunks
 
-    def search(self, query: str, k: int = 10) -> List[Dict]:
+    def search(self, query: str, k: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        """Top k chunks for `query`, fusing semantic similarity and keyword rank.
+
+        `where` is a Chroma-style metadata filter (see `indexing.metadata_filter`),
+        e.g. `{"year": {"$gte": 2020}}`. It is pushed into both searches, so
+        each ranks only matching chunks instead of filtering its top k.
+        """
+        self.refresh_if_stale()
+        where = where or None
+        with self._swap_lock:
+            indexes = self.indexes.acquire()
+        try:
+            return self._search(indexes, query, k, where)
+        finally:
+            indexes.release()
+
+    def _search(self, indexes: SearchIndexes, query: str, k: int, where: Optional[Dict]) -> List[Dict]:
         # Get semantic results
-        semantic_results = self.vector_store.search(query, k=k*2)
+        semantic_results = indexes.vector_store.search(query, k=k*2, where=where)
 
         # Get keyword results
-        keyword_chunk_ids = self.bm25_indexer.search(query, k=k*2)
+        row_filter = ChunkRowFilter(where, indexes.chunks) if where else None
+        keyword_keys = indexes.bm25_indexer.search_keys(query, k=k*2, row_filter=row_filter)
 
-        # Combine and score results
+        # Combine and score results; chunk IDs are only unique within a paper
         combined_scores = {}
 
         # Add semantic scores
         for i, result in enumerate(semantic_results):
-            chunk_id = result['metadata']['chunk_id']
+            key = (result['metadata'].get('paper_id') or '', result['metadata']['chunk_id'])
             # Convert distance to similarity (lower distance = higher similarity)
             similarity = 1 - result['distance']
-            combined_scores[chunk_id] = similarity * self.semantic_weight
+            combined_scores[key] = similarity * self.semantic_weight
 
         # Add keyword scores
-        for i, chunk_id in enumerate(keyword_chunk_ids):
+        for i, (chunk_id, paper_id) in enumerate(keyword_keys):
+            key = (paper_id or '', chunk_id)
             # Rank-based scoring (higher rank = higher score)
-            score = (len(keyword_chunk_ids) - i) / len(keyword_chunk_ids)
-            if chunk_id in combined_scores:
-                combined_scores[chunk_id] += score * self.keyword_weight
+            score = (len(keyword_keys) - i) / len(keyword_keys)
+            if key in combined_scores:
+                combined_scores[key] += score * self.keyword_weight
             else:
-                combined_scores[chunk_id] = score * self.keyword_weight
+                combined_scores[key] = score * self.keyword_weight
 
         # Sort by combined score and return top k
         sorted_chunks = sorted(combined_scores.items(), key=lambda x: x[1], reverse=True)[:k]
 
         results = []
-        for chunk_id, score in sorted_chunks:
-            if chunk_id in self.chunks_cache:
-                chunk = self.chunks_cache[chunk_id].copy()
+        for (paper_id, chunk_id), score in sorted_chunks:
+            chunk = self._lookup_chunk(indexes.chunks, chunk_id, paper_id)
+            if chunk is not None:
+                chunk = chunk.copy()
                 chunk['hybrid_score'] = score
                 results.append(chunk)
 
-        return results
\ No newline at end of file
+        return results
+
+    @staticmethod
+    def _lookup_chunk(chunks: Mapping[str, Dict], chunk_id: str, paper_id: str) -> Optional[Dict]:
+        if isinstance(chunks, ChunkStore) and paper_id:
+            row = chunks.get_row(chunk_id, paper_id)
+            return chunks.chunk(row) if row is not None else None
+        return chunks.get(chunk_id)
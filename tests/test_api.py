@@ -10,7 +10,7 @@ from agents.models import (
     QueryAnalyzerMetadata,
     SourceInfo,
 )
-from api.app import app, get_evaluation_runner, get_orchestrator
+from api.app import app, get_evaluation_runner, get_orchestrator, get_search_system
 
 
 class DummyOrchestrator:
@@ -36,6 +36,25 @@ class DummyEvaluationRunner:
         return {"overall_score": 42, "recall_at_10": 0.7, "factual_accuracy": 0.5, "avg_response_time": 0.1}
 
 
+class DummySearchSystem:
+    def __init__(self):
+        self.serving, self.previous = "v000002", "v000001"
+        self.activated = []
+
+    def activate(self, version: str, wait: bool = False) -> bool:
+        if version != "v000001":
+            raise ValueError(f"unknown snapshot {version!r}")
+        self.activated.append(version)
+        return True
+
+    def rollback(self) -> str:
+        self.serving, self.previous = self.previous, self.serving
+        return self.serving
+
+    def status(self):
+        return {"serving": self.serving, "previous": self.previous, "warming": None, "failed": {}}
+
+
 def build_response() -> OrchestratorResponse:
     entities = Entities(models=["lstm"], metrics=["sharpe"], concepts=["trading"])
     query_metadata = QueryAnalyzerMetadata(
@@ -94,6 +113,21 @@ def test_query_endpoint_returns_orchestrator_response():
     assert evaluator.logged[0][0] == payload["query"]
 
 
+def test_query_endpoint_accepts_search_filters():
+    orchestrator, _ = setup_overrides(build_response())
+    client = TestClient(app)
+
+    payload = {"query": "Crypto forecasting", "filters": {"year_min": 2020, "sections": ["Results"]}}
+    result = client.post("/query", json=payload)
+
+    teardown_overrides()
+
+    assert result.status_code == 200
+    assert orchestrator.last_request.filters.as_where() == {
+        "$and": [{"year": {"$gte": 2020}}, {"section": {"$in": ["Results"]}}]
+    }
+
+
 def test_evaluate_endpoint_uses_evaluation_runner():
     response_payload = build_response()
     _, evaluator = setup_overrides(response_payload)
@@ -119,3 +153,23 @@ def test_health_endpoint_includes_quality_metrics():
     assert result.status_code == 200
     data = result.json()
     assert data["quality_indicators"]["overall_score"] == 42
+
+
+def test_snapshot_endpoints_activate_and_roll_back():
+    search = DummySearchSystem()
+    app.dependency_overrides[get_search_system] = lambda: search
+    client = TestClient(app)
+
+    listed = client.get("/snapshots")
+    activated = client.post("/snapshots/v000001/activate")
+    unknown = client.post("/snapshots/v000009/activate")
+    rolled_back = client.post("/snapshots/rollback")
+
+    teardown_overrides()
+
+    assert listed.status_code == 200
+    assert listed.json()["serving"] == "v000002"
+    assert activated.status_code == 202
+    assert search.activated == ["v000001"]
+    assert unknown.status_code == 404
+    assert rolled_back.json()["serving"] == "v000001"
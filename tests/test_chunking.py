@@ -35,3 +35,18 @@ def test_chunker_emits_section_scoped_chunks():
     assert chunks[0]["metadata"]["section"] == "Introduction"
     assert "Introduction" not in chunks[1]["text"]
     assert chunks[1]["metadata"]["section"] == "Results"
+
+
+def test_chunker_encodes_each_sentence_once(monkeypatch):
+    text = " ".join(f"Sentence number {i} describes the LSTM forecast." for i in range(30))
+    chunker = HierarchicalChunker(max_tokens=40, overlap=10)
+    encoded = []
+    original_encode = chunker.encoder.encode
+    monkeypatch.setattr(chunker.encoder, "encode", lambda s, **kw: encoded.append(s) or original_encode(s, **kw))
+
+    chunks = chunker._create_chunks(text, {"section": "Results"})
+
+    assert len(encoded) == 30, "overlap sentences must reuse their cached token count"
+    assert len(chunks) > 1
+    threaded = HierarchicalChunker(max_tokens=40, overlap=10, num_threads=4)
+    assert threaded._create_chunks(text, {"section": "Results"}) == chunks
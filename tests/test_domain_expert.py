@@ -3,7 +3,7 @@ from typing import List, Dict
 import pytest
 
 from agents.domain_expert import DomainExpert
-from agents.models import DomainExpertRequest, DomainExpertResponse, QueryAnalyzerMetadata
+from agents.models import DomainExpertRequest, DomainExpertResponse, QueryAnalyzerMetadata, SearchFilters
 
 LLM_RESPONSE = (
     "Key findings indicate improved accuracy. Methodology uses LSTM models. "
@@ -14,8 +14,10 @@ LLM_RESPONSE = (
 class StubSearch:
     def __init__(self, results: List[Dict]):
         self._results = results
+        self.last_where = None
 
-    def search(self, query: str, k: int = 5) -> List[Dict]:
+    def search(self, query: str, k: int = 5, where: Dict = None) -> List[Dict]:
+        self.last_where = where
         return self._results[:k]
 
 
@@ -87,3 +89,14 @@ def test_domain_expert_respects_ranking_and_citation_format(sample_query_metadat
     assert [s.relevance_score for s in sources] == [0.91, 0.74, 0.52]
     assert [s.section for s in sources] == ["Findings", "Discussion", "Appendix"]
     assert all(source.paper.endswith("...") for source in sources)
+
+
+def test_domain_expert_passes_filters_to_search(sample_query_metadata: QueryAnalyzerMetadata):
+    expert = _make_expert([])
+
+    filters = SearchFilters(year_min=2021, sections=["Results"])
+    expert.process(DomainExpertRequest(query="Crypto results", query_analysis=sample_query_metadata, filters=filters))
+
+    assert expert.search_system.last_where == {
+        "$and": [{"year": {"$gte": 2021}}, {"section": {"$in": ["Results"]}}]
+    }
@@ -0,0 +1,617 @@
+import json
+import pickle
+import random
+import resource
+import time
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from config import Config
+from indexing import bm25_engine, bm25_query, vector_store
+from indexing.analyzer import Analyzer, ENGLISH_STOPWORDS
+from indexing.bm25_engine import BM25Engine, Postings, corpus_stats, top_k_indices
+from indexing.bm25_indexer import BM25Indexer
+from indexing.bm25_segments import MANIFEST_FILE
+from indexing.bm25_store import read_segment, write_segment
+from indexing.chunk_store import ChunkStore, convert_json_paper, merge_chunk_stores, write_chunk_store
+from indexing.embedding_pool import EmbeddingPool
+from indexing.embeddings_generator import EmbeddingsGenerator
+from indexing.generation import bump_generation, read_generation
+from indexing.metadata_filter import ChunkRowFilter
+from indexing.numpy_store import IvfPqVectorStore, NumpyVectorStore
+from indexing.onnx_encoder import pool
+from indexing.query_embedding_cache import QueryEmbeddingCache
+from indexing.snapshots import (current_version, list_snapshots, previous_version, prune_snapshots,
+                                publish_snapshot, set_current)
+from indexing.vector_quantization import quantize, quantized_search
+from indexing.vector_store import ChromaDBStore
+from retrieval.hybrid_search import HybridSearch
+
+
+def make_chunk(paper_id, chunk_id, text):
+    return {"chunk_id": chunk_id, "text": text, "metadata": {"paper_id": paper_id}}
+
+
+def test_bm25_update_index_replaces_and_removes_papers(tmp_path):
+    indexer = BM25Indexer(index_path=tmp_path)
+    indexer.build_index([
+        make_chunk("a", "chunk_0", "lstm forecasts bitcoin returns"),
+        make_chunk("b", "chunk_0", "sharpe ratio of momentum portfolios"),
+        make_chunk("c", "chunk_0", "garch volatility of ethereum"),
+    ])
+
+    indexer.update_index(
+        [make_chunk("b", "chunk_0", "transformer attention for order books")],
+        removed_paper_ids=["b", "c"],
+    )
+
+    reloaded = BM25Indexer(index_path=tmp_path)
+    assert reloaded.search("order books attention", k=1) == ["chunk_0"]
+    reloaded._load_index()
+    assert sorted(reloaded.paper_ids) == ["a", "b"]
+    assert "sharpe" not in reloaded.bm25.idf
+
+
+def test_bm25_engine_matches_rank_bm25():
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    rng = random.Random(7)
+    # "the" lands in most documents so its idf goes negative and gets floored
+    vocabulary = [f"term{i}" for i in range(200)] + ["the"] * 40
+    corpus = [[rng.choice(vocabulary) for _ in range(rng.randint(0, 50))] for _ in range(500)]
+    reference = rank_bm25.BM25Okapi(corpus)
+    engine = BM25Engine.from_doc_freqs(reference.doc_freqs)
+
+    assert engine.doc_freqs() == reference.doc_freqs
+    for _ in range(50):
+        query = [rng.choice(vocabulary + ["unseen"]) for _ in range(rng.randint(1, 6))]
+        expected = reference.get_scores(query)
+        assert np.array_equal(engine.get_scores(query), expected)
+        for k in (1, 10, 499, 600):
+            ranked = sorted(range(len(expected)), key=lambda i: expected[i], reverse=True)[:k]
+            assert engine.top_k(query, k).tolist() == ranked
+
+
+def test_top_k_indices_breaks_ties_by_index():
+    scores = np.array([1.0, 3.0, 2.0, 3.0, 2.0, 2.0, 0.0])
+    assert top_k_indices(scores, 4).tolist() == [1, 3, 2, 4]
+    assert top_k_indices(scores, 0).tolist() == []
+
+
+def test_bm25_loads_legacy_rank_bm25_pickle(tmp_path):
+    rank_bm25 = pytest.importorskip("rank_bm25")
+    docs = ["lstm forecasts bitcoin returns", "sharpe ratio of momentum portfolios", "garch volatility"]
+    with open(tmp_path / "bm25_index.pkl", "wb") as f:
+        pickle.dump(rank_bm25.BM25Okapi([doc.split() for doc in docs]), f)
+    with open(tmp_path / "chunk_ids.pkl", "wb") as f:
+        pickle.dump(["chunk_0", "chunk_1", "chunk_2"], f)
+
+    indexer = BM25Indexer(index_path=tmp_path)
+    assert indexer.search("momentum sharpe", k=1) == ["chunk_1"]
+    indexer.update_index([make_chunk("d", "chunk_9", "transformer attention")])
+    assert BM25Indexer(index_path=tmp_path).search("attention", k=1) == ["chunk_9"]
+    assert (tmp_path / MANIFEST_FILE).exists()
+    assert not (tmp_path / "bm25_index.pkl").exists()
+
+
+def test_bm25_segment_file_round_trips(tmp_path):
+    rng = random.Random(3)
+    vocabulary = ["alpha", "beta", "gamma", "δέλτα", "volatility", "the", "the", "the"]
+    doc_freqs = [dict(Counter(rng.choice(vocabulary) for _ in range(rng.randint(1, 12)))) for _ in range(40)]
+    chunk_ids = [f"chunk_{i % 7}" for i in range(40)]
+    paper_ids = [None if i % 5 == 0 else f"paper_{i % 3}" for i in range(40)]
+    path = tmp_path / "seg_000001.index"
+    write_segment(path, Postings.from_doc_freqs(doc_freqs), chunk_ids, paper_ids)
+
+    postings, loaded_chunk_ids, loaded_paper_ids = read_segment(path)
+    assert list(loaded_chunk_ids) == chunk_ids
+    assert list(loaded_paper_ids) == paper_ids
+    assert postings.doc_freqs() == doc_freqs
+
+    path.write_bytes(b"not an index" * 4)
+    with pytest.raises(ValueError):
+        read_segment(path)
+
+
+def test_segmented_bm25_matches_single_index(tmp_path):
+    rng = random.Random(11)
+    vocabulary = [f"term{i}" for i in range(60)] + ["market"] * 20
+    indexer = BM25Indexer(index_path=tmp_path)
+    indexer.bm25.merge_factor = 2
+    live = {}
+    for batch in range(12):
+        paper_ids = [f"p{batch}_{j}" for j in range(3)]
+        removed = rng.sample(sorted(live), min(len(live), 2))
+        chunks = [
+            make_chunk(paper_id, f"{paper_id}:{n}", " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 30))))
+            for paper_id in paper_ids for n in range(rng.randint(1, 4))
+        ]
+        indexer.update_index(chunks, removed_paper_ids=removed)
+        for paper_id in removed:
+            del live[paper_id]
+        for chunk in chunks:
+            live.setdefault(chunk["metadata"]["paper_id"], []).append(chunk)
+
+        if batch in (5, 11):
+            indexer.wait_for_merges()
+        ordered = [chunk for paper_chunks in live.values() for chunk in paper_chunks]
+        # Order of first commit, as a freshly built index would hold them
+        ordered.sort(key=lambda chunk: (int(chunk["chunk_id"][1:].split("_")[0]), chunk["chunk_id"]))
+        analyze = indexer.analyzer.analyze
+        reference = BM25Engine.from_doc_freqs([dict(Counter(analyze(chunk["text"]))) for chunk in ordered])
+        for query in ("market term1", "term2 term2 market", "term59 unseen"):
+            expected = [ordered[i]["chunk_id"] for i in reference.top_k(analyze(query), len(ordered))]
+            assert indexer.search(query, k=len(ordered) + 5) == expected
+
+    assert indexer.bm25.segment_count < 12
+    manifest = json.loads((tmp_path / MANIFEST_FILE).read_text())
+    assert manifest["stats"] and (tmp_path / manifest["stats"]).exists()
+    reopened = BM25Indexer(index_path=tmp_path)
+    assert reopened.search("market term1", k=5) == indexer.search("market term1", k=5)
+    assert sorted(reopened.chunk_ids) == sorted(chunk["chunk_id"] for chunk in ordered)
+
+
+@pytest.mark.parametrize("block_size", [2, 8, 128])
+def test_block_max_top_k_matches_exhaustive(monkeypatch, block_size):
+    monkeypatch.setattr(bm25_engine, "POSTINGS_PER_BLOCK", block_size)
+    rng = random.Random(block_size)
+    # Zipf-like term frequencies, and few distinct lengths so many documents tie
+    vocabulary = [f"term{i}" for i in range(300)]
+    weights = [1 / (rank + 1) for rank in range(300)]
+    parts = []
+    for size in (700, 40, 1500):
+        doc_freqs = [dict(Counter(rng.choices(vocabulary, weights, k=rng.choice((5, 10, 40))))) for _ in range(size)]
+        live = np.array([rng.random() > 0.2 for _ in range(size)])
+        parts.append((Postings.from_doc_freqs(doc_freqs), live))
+    stats = corpus_stats(parts)
+    engines = [BM25Engine(postings, idf, stats.avgdl) for (postings, _), idf in zip(parts, stats.idf)]
+    offsets = np.cumsum([0] + [postings.doc_count for postings, _ in parts])
+    deleted = np.flatnonzero(~np.concatenate([live for _, live in parts]))
+
+    for _ in range(40):
+        query = rng.choices(vocabulary + ["unseen"], k=rng.randint(1, 5))
+        for k in (1, 10, 40, 2000):
+            expected = bm25_query.exhaustive_top_k(engines, offsets, query, k, deleted)
+            assert bm25_query.block_max_top_k(engines, offsets, query, k, deleted).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("share", [0.02, 0.6])
+def test_filtered_top_k_matches_masked_scan(share):
+    rng = random.Random(int(share * 100))
+    vocabulary = [f"term{i}" for i in range(200)]
+    weights = [1 / (rank + 1) for rank in range(200)]
+    parts = []
+    for size in (600, 900):
+        doc_freqs = [dict(Counter(rng.choices(vocabulary, weights, k=rng.choice((5, 20))))) for _ in range(size)]
+        parts.append((Postings.from_doc_freqs(doc_freqs), np.array([rng.random() > 0.1 for _ in range(size)])))
+    stats = corpus_stats(parts)
+    engines = [BM25Engine(postings, idf, stats.avgdl) for (postings, _), idf in zip(parts, stats.idf)]
+    offsets = np.cumsum([0] + [postings.doc_count for postings, _ in parts])
+    live = np.concatenate([live for _, live in parts])
+    deleted = np.flatnonzero(~live)
+    allowed = bm25_query.RowSet.from_mask(live & np.array([rng.random() < share for _ in range(len(live))]))
+
+    for _ in range(30):
+        query = rng.choices(vocabulary, weights, k=rng.randint(1, 4))
+        scores = np.concatenate([engine.get_scores(query) for engine in engines])
+        scores[~allowed.mask] = -np.inf
+        for k in (1, 10, len(allowed.rows)):
+            expected = top_k_indices(scores, k).tolist()
+            for top_k in bm25_query.QUERY_STRATEGIES.values():
+                assert top_k(engines, offsets, query, k, deleted, allowed).tolist() == expected
+
+
+def test_bm25_search_with_chunk_filter(tmp_path):
+    chunks = [
+        {"chunk_id": f"chunk_{n}", "text": f"bitcoin momentum {'returns ' * n}",
+         "metadata": {"paper_id": paper_id, "paper_title": paper_id.upper(), "section": section, "year": year}}
+        for paper_id, year in (("a", 2019), ("b", 2022)) for n, section in enumerate(["Intro", "Results"] * 3)
+    ]
+    store_path = tmp_path / "corpus.chunks"
+    write_chunk_store(store_path, chunks)
+    indexer = BM25Indexer(index_path=tmp_path / "bm25")
+    indexer.build_index(chunks)
+    indexer.remove_papers(["a"])
+    indexer.add_chunks(chunks[:6])
+    indexer.commit()
+
+    with ChunkStore(store_path) as store:
+        where = {"$and": [{"year": {"$gte": 2020}}, {"section": "Results"}]}
+        found = indexer.search_keys("bitcoin returns", k=10, row_filter=ChunkRowFilter(where, store))
+        assert sorted(found) == [("chunk_1", "b"), ("chunk_3", "b"), ("chunk_5", "b")]
+        unfiltered = [key for key in indexer.search_keys("bitcoin returns", k=12) if key in found]
+        assert found == unfiltered
+
+        assert indexer.search("bitcoin", k=10, row_filter=ChunkRowFilter({"year": 2019}, store)) == \
+            indexer.search("bitcoin", k=10, row_filter=ChunkRowFilter({"paper_title": "A"}, store))
+        assert indexer.search("bitcoin", k=10, row_filter=ChunkRowFilter({"year": 1999}, store)) == []
+
+
+def test_analyzer_keeps_protected_terms_and_round_trips():
+    analyzer = Analyzer(stopwords=ENGLISH_STOPWORDS, stemmer="plural", protected_terms=["S&P 500", "S&P", "GARCH(1,1)"])
+    text = "LSTM, forecasts S&P 500 returns; the Sharpe ratios of GARCH(1,1) vs S&P."
+    expected = ["lstm", "forecast", "s&p 500", "return", "sharpe", "ratio", "garch(1,1)", "vs", "s&p"]
+    assert analyzer.analyze(text) == expected
+    assert Analyzer.from_settings(analyzer.settings).analyze(text) == expected
+    assert analyzer.analyze_query(text) == tuple(expected)
+    assert Analyzer.whitespace().analyze("LSTM, forecasts") == "lstm, forecasts".split()
+
+
+def test_bm25_index_keeps_its_analyzer(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "bm25_analyzer", property(lambda self: {"stemmer": "plural"}))
+    BM25Indexer(index_path=tmp_path).build_index([
+        make_chunk("a", "chunk_0", "Momentum portfolios, rebalanced monthly."),
+        make_chunk("b", "chunk_1", "Volatility of ethereum"),
+        make_chunk("c", "chunk_2", "Order books"),
+    ])
+
+    # Changing the configuration does not change how the built index is queried
+    monkeypatch.setattr(Config, "bm25_analyzer", property(lambda self: None))
+    indexer = BM25Indexer(index_path=tmp_path)
+    assert indexer.search("portfolio", k=1) == ["chunk_0"]
+    assert indexer.analyzer.stemmer == "plural"
+    indexer.reset()
+    assert indexer.analyzer.settings == Analyzer.whitespace().settings
+
+
+class StubModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy):
+        self.batches.append(list(texts))
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+
+def test_embeddings_are_batched_by_length_and_cached(tmp_path, monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(EmbeddingsGenerator, "_load_model", lambda self: model)
+    texts = ["bb", "a", "dddd", "ccc", "a"]
+    generator = EmbeddingsGenerator(model_name="stub", batch_size=2, cache_path=tmp_path / "cache.sqlite")
+
+    vectors = generator.generate_embeddings(texts)
+    assert vectors[:, 0].tolist() == [2, 1, 4, 3, 1]
+    assert model.batches == [["dddd", "ccc"], ["bb", "a"]]
+
+    # Unchanged texts come from the cache, so the model is never loaded
+    monkeypatch.setattr(EmbeddingsGenerator, "_load_model", lambda self: pytest.fail("model loaded"))
+    cached = EmbeddingsGenerator(model_name="stub", batch_size=2, cache_path=tmp_path / "cache.sqlite")
+    assert cached.generate_embeddings(texts).tolist() == vectors.tolist()
+    assert cached.cache.count("stub") == 4
+
+
+def test_query_embeddings_are_cached_per_model(tmp_path, monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(EmbeddingsGenerator, "_load_model", lambda self: model)
+    generator = EmbeddingsGenerator(model_name="stub", use_cache=False, query_cache=QueryEmbeddingCache(max_entries=2))
+
+    for query in ["a", "bb", "a", "ccc", "bb"]:
+        generator.embed_query(query)
+    # "bb" was evicted by "ccc" (least recently used after "a" was hit)
+    assert len(model.batches) == 4
+    assert generator.query_cache.stats()["hits"] == 1
+
+    generator.model_name = "other"
+    generator.embed_query("ccc")
+    assert len(model.batches) == 5
+    assert generator.query_cache.stats()["invalidations"] == 1
+
+    bounded = QueryEmbeddingCache(max_bytes=20)
+    for query in ["a", "b", "c"]:
+        bounded.put("stub", query, np.zeros(2, dtype=np.float32))
+    assert len(bounded) == 2 and bounded.get("stub", "a") is None
+
+
+@pytest.mark.parametrize("kind", ["int8", "binary"])
+def test_quantized_search_rescores_with_full_vectors(tmp_path, kind):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((500, 32)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    np.save(tmp_path / "vectors.npy", vectors)
+    on_disk = np.load(tmp_path / "vectors.npy", mmap_mode="r")
+    codes = quantize(vectors, kind)
+    live = np.ones(len(vectors), dtype=bool)
+    live[::2] = False
+
+    for query in vectors[:5]:
+        exact = top_k_indices(np.where(live, vectors @ query, -np.inf), 5)
+        rows, scores = quantized_search(on_disk, codes, query, 5, live=live, rescore_factor=100)
+        assert rows.tolist() == exact.tolist()
+        assert np.allclose(scores, vectors[rows] @ query)
+
+
+def load_length_encoder(threads):
+    # Runs in the pool's worker processes
+    return lambda texts: np.array([[len(text), threads] for text in texts], dtype=np.float32)
+
+
+def test_embedding_pool_returns_vectors_in_input_order():
+    pool = EmbeddingPool(load_length_encoder, workers=2, threads=3, batch_size=4)
+    try:
+        texts = ["x" * length for length in range(1, 12)]
+        shards = []
+        vectors = pool.encode(texts, done=lambda start, embedded: shards.append((start, len(embedded))))
+    finally:
+        pool.close()
+    assert vectors.tolist() == [[length, 3] for length in range(1, 12)]
+    assert sorted(shards) == [(0, 4), (4, 4), (8, 3)]
+
+
+def test_onnx_pooling_ignores_padding():
+    tokens = np.array([[[1.0, 2.0], [3.0, 4.0], [100.0, 100.0]]], dtype=np.float32)
+    mask = np.array([[1, 1, 0]])
+    assert pool(tokens, mask, "mean").tolist() == [[2.0, 3.0]]
+    assert pool(tokens, mask, "max").tolist() == [[3.0, 4.0]]
+    assert pool(tokens, mask, "cls").tolist() == [[1.0, 2.0]]
+
+
+def test_quantized_onnx_vectors_are_cached_separately(tmp_path, monkeypatch):
+    model = StubModel()
+    monkeypatch.setattr(EmbeddingsGenerator, "_load_model", lambda self: model)
+    EmbeddingsGenerator(model_name="stub", cache_path=tmp_path / "cache.sqlite").generate_embeddings(["a"])
+    EmbeddingsGenerator(model_name="stub", cache_path=tmp_path / "cache.sqlite", backend="onnx",
+                        onnx_quantize=True).generate_embeddings(["a"])
+    assert len(model.batches) == 2
+
+
+class HashEmbedder:
+    """Same text, same random unit vector; queries embed like documents."""
+
+    model_id = "hash-16"
+
+    def __init__(self):
+        self.query_cache = QueryEmbeddingCache()
+
+    def generate_embeddings(self, texts):
+        return np.stack([self.embed_query(text) for text in texts])
+
+    def embed_query(self, text):
+        vector = np.random.default_rng(sum(map(ord, text))).standard_normal(16).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+
+@pytest.mark.parametrize("quantization", ["none", "int8"])
+def test_numpy_vector_store_upserts_deletes_and_filters(tmp_path, quantization):
+    store = NumpyVectorStore(path=tmp_path, embedder=HashEmbedder(), quantization=quantization)
+    texts = [f"passage {i}" for i in range(40)]
+    store.add_chunks([{"chunk_id": f"chunk_{i}", "text": text,
+                       "metadata": {"paper_id": "ab"[i % 2], "paper_title": "T", "section": f"S{i % 4}", "page_start": i}}
+                      for i, text in enumerate(texts)])
+    store.add_chunks([{"chunk_id": "chunk_0", "text": "replaced",
+                       "metadata": {"paper_id": "a", "paper_title": "T", "section": "S0", "page_start": 0}}])
+
+    def ranking(query, where=None):
+        return [(hit["metadata"]["chunk_id"], hit["text"]) for hit in store.search(query, k=5, where=where)]
+
+    # Matches brute force, with the upserted text and no duplicate of chunk_0
+    live = {f"chunk_{i}": text for i, text in enumerate(texts)}
+    live["chunk_0"] = "replaced"
+    embedder = HashEmbedder()
+    expected = sorted(live.items(), key=lambda item: -float(embedder.embed_query(item[1]) @ embedder.embed_query("passage 7")))
+    assert ranking("passage 7") == expected[:5]
+
+    # Filters apply before the top k
+    filtered = store.search("passage 7", k=50, where={"$and": [{"section": "S1"}, {"page_start": {"$gte": 20}}]})
+    assert sorted(hit["metadata"]["page_start"] for hit in filtered) == [21, 25, 29, 33, 37]
+
+    # Readers see deletions once reopened
+    store.delete_papers(["b"])
+    assert ranking("passage 7")[0] == ("chunk_7", "passage 7")
+    store.reopen()
+    assert all(int(chunk_id.split("_")[1]) % 2 == 0 for chunk_id, _ in ranking("passage 7"))
+    assert store.get_stats()["total_chunks"] == 20
+
+
+def test_ivf_pq_store_rescores_to_exact_ranking(tmp_path, monkeypatch):
+    monkeypatch.setattr(Config, "ivf_nlist", property(lambda self: 8))
+    monkeypatch.setattr(Config, "pq_subquantizers", property(lambda self: 4))
+    chunks = [{"chunk_id": f"chunk_{i}", "text": f"passage {i} of paper {i % 3}",
+               "metadata": {"paper_id": "abc"[i % 3], "paper_title": "T", "section": "S", "page_start": i}}
+              for i in range(600)]
+    exact = NumpyVectorStore(path=tmp_path / "exact", embedder=HashEmbedder())
+    store = IvfPqVectorStore(path=tmp_path / "ivf", embedder=HashEmbedder(), nprobe=8, rescore_factor=100)
+    for target in (exact, store):
+        target.add_chunks(chunks)
+
+    def ranking(target, query):
+        return [hit["metadata"]["chunk_id"] for hit in target.search(query, k=5)]
+
+    queries = ["passage 17 of paper 2", "passage 301 of paper 1", "garch"]
+    # Exact until the index is built
+    assert store.get_stats()["ivf_pq"] is None
+    assert [ranking(store, q) for q in queries] == [ranking(exact, q) for q in queries]
+
+    store.optimize()
+    store.reopen()
+    stats = store.get_stats()
+    assert stats["ivf_pq"]["rows"] == 600 and stats["ivf_pq"]["nlist"] == 8
+    assert stats["in_memory_bytes"] < 600 * 16 * 4
+    # Every cell probed and every candidate rescored: the exact ranking
+    assert [ranking(store, q) for q in queries] == [ranking(exact, q) for q in queries]
+
+    # Rows added since optimize() are searched exactly; deleted ones never come back
+    extra = {"chunk_id": "chunk_new", "text": "garch", "metadata": {"paper_id": "d", "paper_title": "T", "section": "S"}}
+    store.add_chunks([extra])
+    store.delete_papers(["a"])
+    store.reopen()
+    assert ranking(store, "garch")[0] == "chunk_new"
+    assert all(int(chunk_id.split("_")[1]) % 3 for chunk_id in ranking(store, "passage 300 of paper 0")[1:])
+
+
+def test_chunk_store_round_trips_and_looks_up_by_id(tmp_path):
+    chunks = [
+        {"text": "lstm forecasts bitcoin returns", "metadata": {"paper_title": "A", "section": "1 Intro",
+                                                            "level": 1, "page_start": 1, "paper_id": "a"},
+         "token_count": 5, "chunk_id": "chunk_0"},
+        {"text": "sharpe ratio of momentum portfolios — net of costs",
+         "metadata": {"paper_title": "B", "section": "2 Results", "level": 2, "page_start": 4, "paper_id": "b"},
+         "token_count": 9, "chunk_id": "chunk_0"},
+        {"text": "garch volatility", "metadata": {"paper_title": "B", "section": "2 Results", "level": 2,
+                                                  "page_start": 5, "paper_id": "b"},
+         "token_count": 3, "chunk_id": "chunk_1"},
+    ]
+    path = tmp_path / "corpus.chunks"
+    write_chunk_store(path, chunks, {"a": {"title": "A"}, "b": {"title": "B", "year": 2021}})
+
+    with ChunkStore(path) as store:
+        assert store.count == 3
+        assert sorted(store) == ["chunk_0", "chunk_1"]
+        assert list(store.iter_chunks()) == chunks
+        assert store["chunk_1"] == chunks[2]
+        assert store.chunk(store.get_row("chunk_0", paper_id="b")) == chunks[1]
+        assert store.get_row("chunk_0", paper_id="c") is None
+        assert "chunk_9" not in store
+        assert store.papers["b"]["year"] == 2021
+
+
+def test_merge_chunk_stores_opens_one_store_at_a_time(tmp_path):
+    paths = []
+    for i in range(200):
+        path = tmp_path / f"paper_{i}.chunks"
+        chunk = {"text": f"paper {i}", "metadata": {"paper_id": f"p{i}", "page_start": i}, "chunk_id": "chunk_0"}
+        write_chunk_store(path, [chunk], {f"p{i}": {"title": str(i)}})
+        paths.append(path)
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(64, hard), hard))
+    try:
+        merge_chunk_stores(paths, tmp_path / "corpus.chunks")
+    finally:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (soft, hard))
+
+    with ChunkStore(tmp_path / "corpus.chunks") as store:
+        assert store.count == 200
+        assert len(store.papers) == 200
+        assert store.chunk(store.get_row("chunk_0", paper_id="p150"))["metadata"] == {"paper_id": "p150",
+                                                                                       "page_start": 150}
+
+
+def test_convert_json_paper_preserves_chunks(tmp_path):
+    chunk = {"text": "momentum", "metadata": {"section": "Abstract"}, "token_count": 1, "chunk_id": "chunk_0"}
+    json_path = tmp_path / "paper.json"
+    json_path.write_text(json.dumps({"metadata": {"title": "T"}, "chunks": [chunk], "stats": {"num_chunks": 1}}))
+
+    assert convert_json_paper(json_path, tmp_path / "paper.chunks") == 1
+    with ChunkStore(tmp_path / "paper.chunks") as store:
+        assert store["chunk_0"]["metadata"] == {"section": "Abstract", "paper_id": "paper"}
+        assert store.papers == {"paper": {"title": "T"}}
+
+
+def test_bm25_swap_in_replaces_live_index(tmp_path):
+    live = BM25Indexer(index_path=tmp_path / "bm25")
+    live.build_index([make_chunk("a", "chunk_0", "lstm forecasts bitcoin returns")])
+    staging = BM25Indexer(index_path=tmp_path / "bm25_staging")
+    staging.build_index([make_chunk("b", "chunk_7", "garch volatility of ethereum")])
+
+    assert live.swap_in(tmp_path / "bm25_staging")
+    assert live.search("garch volatility", k=1) == ["chunk_7"]
+    assert not (tmp_path / "bm25_staging").exists()
+    assert not live.swap_in(tmp_path / "bm25_staging")
+
+
+def test_generation_marker_counts_up_from_zero(tmp_path):
+    path = tmp_path / "index_generation"
+    assert read_generation(path) == 0
+    assert bump_generation(path) == 1
+    assert bump_generation(path) == 2
+    assert read_generation(path) == 2
+
+
+class SnapshotCorpus:
+    """Working indexes (NumPy vectors, BM25, chunk store) that one paper at a time is added to."""
+
+    def __init__(self, root, monkeypatch):
+        self.root = root
+        for name, value in {"vector_backend": "numpy", "snapshot_path": str(root / "snapshots"),
+                            "snapshots_enabled": True, "chunk_store_path": str(root / "corpus.chunks"),
+                            "data_dir": str(root)}.items():
+            monkeypatch.setattr(Config, name, property(lambda self, value=value: value))
+        self.vectors = NumpyVectorStore(path=root / "vectors", embedder=HashEmbedder())
+        self.bm25 = BM25Indexer(index_path=root / "bm25")
+        self.chunks = []
+
+    def add_paper(self, paper_id, text):
+        chunk = make_chunk(paper_id, "chunk_0", text)
+        chunk["metadata"].update(paper_title=paper_id, section="Results", page_start=1)
+        self.chunks.append(chunk)
+        self.vectors.add_chunks([chunk])
+        self.bm25.update_index([chunk])
+        write_chunk_store(self.root / "corpus.chunks", self.chunks)
+        return publish_snapshot(self.vectors, self.bm25.index_path, self.root / "corpus.chunks",
+                                bump_generation(), HashEmbedder.model_id, keep=2)
+
+
+def test_chroma_snapshot_exports_only_the_live_collection(tmp_path, monkeypatch):
+    store = ChromaDBStore(path=tmp_path / "chroma", collection_name="papers", embedder=HashEmbedder())
+    chunks = []
+    for i in range(5):
+        chunk = make_chunk(f"p{i}", "chunk_0", f"paper {i} on garch volatility")
+        chunk["metadata"].update(paper_title=f"P{i}", section="Results", page_start=i + 1)
+        chunks.append(chunk)
+    store.add_chunks(chunks)
+    store.client.get_or_create_collection("papers_staging")
+    # Several pages, so paging by offset is exercised
+    monkeypatch.setattr(vector_store, "SNAPSHOT_PAGE_SIZE", 2)
+    store.save_snapshot(tmp_path / "snapshot")
+
+    snapshot = ChromaDBStore(path=tmp_path / "snapshot", collection_name="papers", embedder=HashEmbedder())
+    assert [getattr(c, "name", c) for c in snapshot.client.list_collections()] == ["papers"]
+    assert snapshot.get_stats()["total_chunks"] == 5
+    assert snapshot.search("paper 3 on garch volatility", k=1)[0]["metadata"]["paper_id"] == "p3"
+    snapshot.close()
+    store.close()
+
+
+def test_snapshots_are_immutable_and_pruned(tmp_path, monkeypatch):
+    corpus = SnapshotCorpus(tmp_path, monkeypatch)
+    first = corpus.add_paper("a", "lstm forecasts bitcoin returns")
+    corpus.add_paper("b", "garch volatility of ethereum")
+    third = corpus.add_paper("c", "momentum portfolios and sharpe ratios")
+
+    assert [info.version for info in list_snapshots()] == ["v000002", "v000003"]
+    assert not first.path.exists()
+    assert current_version() == third.version == "v000003"
+    assert previous_version() == "v000002"
+    assert third.chunks == 3 and third.embedding_model == "hash-16"
+
+    # Later writes to the working indexes do not reach a published snapshot
+    corpus.vectors.delete_papers(["a"])
+    corpus.bm25.update_index([], removed_paper_ids=["a"])
+    snapshot_vectors = NumpyVectorStore(path=third.path / "vectors", embedder=HashEmbedder())
+    assert snapshot_vectors.get_stats()["total_chunks"] == 3
+    assert BM25Indexer(index_path=third.path / "bm25").search("bitcoin", k=1) == ["chunk_0"]
+
+    # The current snapshot is never pruned, even after a rollback
+    set_current("v000002")
+    assert prune_snapshots(1) == []
+    assert [info.version for info in list_snapshots()] == ["v000002", "v000003"]
+
+
+def test_hybrid_search_swaps_snapshots_and_rolls_back(tmp_path, monkeypatch):
+    corpus = SnapshotCorpus(tmp_path, monkeypatch)
+    corpus.add_paper("a", "lstm forecasts bitcoin returns")
+    search = HybridSearch(embedder=HashEmbedder())
+    assert search.status()["serving"] == "v000001"
+
+    # A search that started on the old snapshot keeps it until it returns
+    in_flight = search.indexes.acquire()
+    corpus.add_paper("b", "garch volatility of ethereum")
+    search.activate("v000002", wait=True)
+    assert search.status()["serving"] == "v000002"
+    assert {hit["metadata"]["paper_id"] for hit in search.search("garch volatility", k=2)} == {"a", "b"}
+    assert in_flight.vector_store.get_stats()["total_chunks"] == 1
+    in_flight.release()
+
+    assert search.rollback() == "v000001"
+    assert current_version() == "v000001"
+    assert [hit["metadata"]["paper_id"] for hit in search.search("garch volatility", k=2)] == ["a"]
+
+    # A snapshot published by ingestion is warmed in the background, then swapped in
+    corpus.add_paper("c", "momentum portfolios and sharpe ratios")
+    assert not search.refresh_if_stale()
+    for _ in range(500):
+        if search.status()["serving"] == "v000003":
+            break
+        time.sleep(0.01)
+    assert search.status() == {"serving": "v000003", "previous": "v000001", "warming": None, "failed": {}}
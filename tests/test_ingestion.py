@@ -0,0 +1,246 @@
+import os
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+from ingestion.checkpoint import IngestionCheckpoint
+from ingestion.manifest import IngestionManifest
+from ingestion.paper_parser import PaperParser
+from ingestion.pdf_document import PDFDocument
+from ingestion.pdf_extractor import PDFExtractor
+from ingestion.pipeline import PaperJob, PipelineSettings, batch_stage, prefetch, process_stage
+from ingestion.watcher import FolderWatcher
+
+
+@pytest.fixture()
+def sample_pdf(tmp_path):
+    doc = fitz.open()
+    for heading, body in [
+        ("1 Introduction", "Momentum strategies are studied in 2021."),
+        ("2 Results", "The LSTM model improves the Sharpe ratio."),
+    ]:
+        page = doc.new_page()
+        page.insert_text((72, 72), heading, fontsize=14)
+        page.insert_text((72, 120), body, fontsize=11)
+    doc.set_toc([[1, "1 Introduction", 1], [1, "2 Results", 2]])
+    path = tmp_path / "sample.pdf"
+    doc.save(str(path))
+    doc.close()
+    return path
+
+
+def test_document_extracts_each_page_once(sample_pdf, monkeypatch):
+    calls = []
+    original = fitz.Page.get_text
+
+    def counting_get_text(page, *args, **kwargs):
+        calls.append((page.number, args))
+        return original(page, *args, **kwargs)
+
+    monkeypatch.setattr(fitz.Page, "get_text", counting_get_text)
+
+    with PDFDocument(sample_pdf) as document:
+        extracted = PDFExtractor().extract_from_pdf(document)
+        structure = PaperParser().parse_structure(document)
+
+    text_calls = sorted(call for call in calls if call[1] == ())
+    assert text_calls == [(0, ()), (1, ())], "each page's text is extracted once"
+    assert extracted["metadata"]["year"] == 2021
+    assert [s["title"] for s in structure["sections"]] == ["1 Introduction", "2 Results"]
+
+
+def test_text_above_the_first_heading_stays_in_the_first_section(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Deep Learning for Volatility Forecasting", fontsize=16)
+    page.insert_text((72, 110), "Abstract: We show that LSTM beats GARCH.", fontsize=11)
+    page.insert_text((72, 200), "1 Introduction", fontsize=14)
+    page.insert_text((72, 240), "Intro body text here.", fontsize=11)
+    page = doc.new_page()
+    page.insert_text((72, 72), "2 Results", fontsize=14)
+    page.insert_text((72, 120), "The LSTM model improves the Sharpe ratio.", fontsize=11)
+    doc.set_toc([[1, "1 Introduction", 1, {"kind": 1, "page": 0, "to": fitz.Point(72, 186)}], [1, "2 Results", 2]])
+    path = tmp_path / "abstract.pdf"
+    doc.save(str(path))
+    doc.close()
+
+    with PDFDocument(path) as document:
+        sections = PaperParser().parse_structure(document)["sections"]
+
+    assert sections[0]["content"] == [
+        "Deep Learning for Volatility Forecasting",
+        "Abstract: We show that LSTM beats GARCH.",
+        "Intro body text here.",
+    ]
+    assert sections[1]["content"] == ["The LSTM model improves the Sharpe ratio."]
+
+
+def test_page_blocks_are_computed_on_demand(sample_pdf):
+    document = PDFDocument(sample_pdf)
+    page = PDFExtractor().extract_from_pdf(document)["pages"][1]
+
+    assert page["page_num"] == 2
+    assert "Sharpe" in page["text"]
+    assert any("Sharpe" in block[4] for block in page["blocks"])
+    document.close()
+
+
+def test_manifest_plans_only_new_changed_and_removed_papers(tmp_path):
+    papers = tmp_path / "papers"
+    papers.mkdir()
+    (papers / "a.pdf").write_bytes(b"paper a")
+    (papers / "b.pdf").write_bytes(b"paper b")
+    settings = {"max_tokens": 400, "overlap": 50, "embedding_model": "mini"}
+
+    manifest = IngestionManifest(tmp_path / "manifest.json")
+    plan = manifest.plan(sorted(papers.glob("*.pdf")), settings)
+    assert plan.full_rebuild
+    for pdf_path in plan.to_process:
+        manifest.record(pdf_path, plan.hashes[pdf_path.stem], ["chunk_0"])
+    manifest.save()
+
+    (papers / "b.pdf").write_bytes(b"paper b, revised")
+    (papers / "a.pdf").unlink()
+    (papers / "c.pdf").write_bytes(b"paper c")
+
+    reloaded = IngestionManifest(tmp_path / "manifest.json")
+    plan = reloaded.plan(sorted(papers.glob("*.pdf")), settings)
+    assert not plan.full_rebuild
+    assert [p.name for p in plan.to_process] == ["b.pdf", "c.pdf"]
+    assert plan.removed == ["a"]
+
+    assert reloaded.plan([], {**settings, "overlap": 0}).full_rebuild
+
+
+def test_checkpoint_resumes_matching_run_and_resets_otherwise(tmp_path):
+    run = {"full_rebuild": True, "settings": {"max_tokens": 400}}
+    checkpoint = IngestionCheckpoint(tmp_path / "checkpoint.sqlite")
+    assert not checkpoint.resume(run)
+    checkpoint.enqueue([("a", tmp_path / "a.pdf", "sha-a"), ("b", tmp_path / "b.pdf", "sha-b")])
+    checkpoint.mark_done([("a", tmp_path / "a.pdf", "sha-a", ["chunk_0", "chunk_1"])])
+    checkpoint.mark_failed("b", tmp_path / "b.pdf", "FileDataError: broken")
+    checkpoint.close()
+
+    reopened = IngestionCheckpoint(tmp_path / "checkpoint.sqlite")
+    assert reopened.resume(run)
+    assert reopened.done() == {"a": {"path": str(tmp_path / "a.pdf"), "sha256": "sha-a",
+                                     "chunk_ids": ["chunk_0", "chunk_1"]}}
+    assert reopened.counts() == {"done": 1, "failed": 1}
+
+    assert not reopened.resume({**run, "full_rebuild": False})
+    assert reopened.done() == {}
+    reopened.finish()
+    assert not reopened.active
+
+
+def test_folder_watcher_debounces_bursts_into_one_batch(tmp_path):
+    now = [0.0]
+    (tmp_path / "old.pdf").write_bytes(b"old")
+    (tmp_path / "gone.pdf").write_bytes(b"gone")
+    watcher = FolderWatcher(tmp_path, debounce_seconds=5, clock=lambda: now[0])
+
+    (tmp_path / "a.pdf").write_bytes(b"a")
+    assert watcher.poll() is None
+    now[0] = 3
+    (tmp_path / "b.pdf").write_bytes(b"b")  # burst continues; timer restarts
+    (tmp_path / "gone.pdf").unlink()
+    (tmp_path / "old.pdf").write_bytes(b"old, revised")
+    (tmp_path / "notes.txt").write_text("ignored")
+    assert watcher.poll() is None
+    now[0] = 7
+    assert watcher.poll() is None
+
+    now[0] = 8
+    changes = watcher.poll()
+    assert (changes.added, changes.modified, changes.removed) == (["a.pdf", "b.pdf"], ["old.pdf"], ["gone.pdf"])
+    now[0] = 20
+    assert watcher.poll() is None
+
+
+def test_batch_stage_regroups_chunks_across_papers():
+    jobs = [
+        PaperJob(pdf_path="a.pdf", chunks=[{"chunk_id": f"a{i}"} for i in range(3)]),
+        PaperJob(pdf_path="b.pdf", error="broken"),
+        PaperJob(pdf_path="c.pdf", chunks=[{"chunk_id": f"c{i}"} for i in range(2)]),
+    ]
+
+    batches = list(batch_stage(prefetch(iter(jobs), maxsize=1), batch_size=2))
+
+    assert [[c["chunk_id"] for c in batch] for batch in batches] == [["a0", "a1"], ["a2", "c0"], ["c1"]]
+
+
+class CrashingChunker:
+    """One chunk per section; kills its worker process on a section containing CRASH."""
+
+    def chunk_paper(self, structure, metadata):
+        chunks = []
+        for section in structure["sections"]:
+            text = " ".join(section["content"])
+            if "CRASH" in text:
+                os._exit(1)
+            chunks.append({"text": text, "metadata": {"section": section["title"]}, "chunk_id": f"chunk_{len(chunks)}"})
+        return chunks
+
+
+class CrashingSettings(PipelineSettings):
+    def build_components(self):
+        return PDFExtractor(), PaperParser(), CrashingChunker()
+
+
+def test_process_stage_fails_only_the_paper_that_kills_its_worker(tmp_path):
+    paths = []
+    for name in ["a", "b", "crash", "c", "d", "e"]:
+        doc = fitz.open()
+        doc.new_page().insert_text((72, 72), "CRASH here." if name == "crash" else f"Paper {name} body.", fontsize=11)
+        path = tmp_path / f"{name}.pdf"
+        doc.save(str(path))
+        doc.close()
+        paths.append(path)
+
+    jobs = {job.paper_id: job for job in process_stage(paths, CrashingSettings(), workers=2, queue_size=1)}
+
+    assert sorted(jobs) == ["a", "b", "c", "crash", "d", "e"]
+    assert jobs["crash"].error.startswith("BrokenProcessPool")
+    assert all(not job.error and job.chunks for paper_id, job in jobs.items() if paper_id != "crash")
+
+
+def test_parser_splits_sections_sharing_a_page_at_toc_destination(tmp_path):
+    doc = fitz.open()
+    page = doc.new_page()
+    height = page.rect.height
+    page.insert_text((72, 72), "1 Introduction", fontsize=14)
+    page.insert_text((72, 100), "Intro body text.", fontsize=11)
+    page.insert_text((72, 300), "Section two", fontsize=14)
+    page.insert_text((72, 330), "Results body text.", fontsize=11)
+    page = doc.new_page()
+    page.insert_text((72, 72), "More results on the next page.", fontsize=11)
+    # TOC destinations are stored in PDF space (origin bottom-left)
+    doc.set_toc([
+        [1, "1 Introduction", 1, {"kind": fitz.LINK_GOTO, "to": fitz.Point(72, height - 50)}],
+        [1, "2 Results", 1, {"kind": fitz.LINK_GOTO, "to": fitz.Point(72, height - 280)}],
+    ])
+    path = tmp_path / "shared_page.pdf"
+    doc.save(str(path))
+    doc.close()
+
+    sections = PaperParser().parse_structure(str(path))["sections"]
+
+    assert sections[0]["content"] == ["Intro body text."]
+    assert sections[1]["content"] == ["Section two", "Results body text.", "More results on the next page."]
+
+
+def test_lazy_mode_matches_eager_output_with_bounded_cache(sample_pdf):
+    with PDFDocument(sample_pdf) as document:
+        eager = PDFExtractor().extract_from_pdf(document)
+        eager_sections = PaperParser().parse_structure(document)["sections"]
+
+    with PDFDocument(sample_pdf, max_cached_pages=1) as document:
+        lazy = PDFExtractor().extract_from_pdf(document, lazy=True)
+        lazy_sections = list(PaperParser().iter_sections(document))
+        pages = [page["text"] for page in lazy["pages"]]
+        assert len(document._text) == 1
+
+    assert lazy["metadata"] == eager["metadata"]
+    assert lazy_sections == eager_sections
+    assert pages == [page["text"] for page in eager["pages"]]
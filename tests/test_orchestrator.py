@@ -10,7 +10,7 @@ class FixedSearch:
     def __init__(self, chunks):
         self._chunks = chunks
 
-    def search(self, query: str, k: int = 5):
+    def search(self, query: str, k: int = 5, where=None):
         return self._chunks[:k]
 
 